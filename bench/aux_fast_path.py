@@ -0,0 +1,92 @@
+"""How much of Open WebUI's background traffic the auxiliary fast path takes off the chat model.
+
+    python bench/aux_fast_path.py --turns 5 --aux-model qwen2.5:1.5b
+
+Plays chat turns the way OUI sends them against the server in-process, with a
+stub Ollama (see `stub_ollama.py`) that generates one call at a time like a
+single-GPU Ollama: a tool-selection call before each answer, the answer
+itself, then title, tags and follow-up prompts fired in the background while
+the next turn starts.  Runs the turns once through the graphs
+(`AUX_FAST_PATH` off) and once on the fast path, and reports the chat
+model's calls per turn and the time from the start of a turn (the
+tool-selection call included) to its answer's first token.  No real
+Ollama needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+PORT = 18521
+MODEL = "llama3.1:8b"
+os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+
+import httpx
+
+import settings
+from stub_ollama import StubOllama
+from server import app
+
+
+TOOLS = "Available Tools: [{\"name\": \"web_search\", \"description\": \"Search the web\"}]\n\nChoose the tools to call..."
+TITLE = "### Task:\nGenerate a concise, 3-5 word title with an emoji summarizing the chat history.\n### Chat History:\n..."
+TAGS = "### Task:\nGenerate 1-3 broad tags categorizing the main themes of the chat history...\n### Chat History:\n..."
+FOLLOW_UPS = "### Task:\nSuggest 3-5 relevant follow-up questions or prompts that the user might naturally ask next...\n..."
+
+
+async def post(client: httpx.AsyncClient, messages: list[dict], stream: bool = True) -> float:
+    """Time to the first answer token (streamed) or to the whole answer."""
+    body = {"query": messages[-1]["content"], "messages": messages, "config": {"LLM_MODEL": MODEL}, "stream": stream}
+    started = time.perf_counter()
+    async with client.stream("POST", "/graph/fren", json=body) as response:
+        async for line in response.aiter_lines():
+            if '"content": "tok' in line:
+                return time.perf_counter() - started
+    return time.perf_counter() - started
+
+
+async def turns(client: httpx.AsyncClient, n: int) -> list[float]:
+    ttfts = []
+    background = []
+    for i in range(n):
+        question = {"role": "user", "content": f"question {i}"}
+        started = time.perf_counter()
+        await post(client, [{"role": "system", "content": TOOLS}, {"role": "user", "content": f"Query: question {i}"}], stream=False)
+        await post(client, [question])
+        ttfts.append(time.perf_counter() - started)
+        background += [asyncio.create_task(post(client, [{"role": "user", "content": prompt}], stream=False))
+                       for prompt in (TITLE, TAGS, FOLLOW_UPS)]
+    await asyncio.gather(*background)
+    return ttfts
+
+
+async def main(args):
+    stub = StubOllama(PORT, models=[MODEL, args.aux_model], loaded=[MODEL, args.aux_model],
+                      first=0.3, delay=0.02, tokens=40, parallel=1).start()
+    settings.AUX_MODEL = args.aux_model
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+        await post(client, [{"role": "user", "content": "warm up"}])
+        print(f"{'':>12} {'chat model calls/turn':>22} {'aux model calls/turn':>21} {'answer TTFT median':>19} {'max':>7}")
+        for fast_path in (False, True):
+            settings.AUX_FAST_PATH = fast_path
+            stub.calls_by_model.clear()
+            ttfts = await turns(client, args.turns)
+            main_calls = stub.calls_by_model.get(MODEL, 0) / args.turns
+            aux_calls = stub.calls_by_model.get(args.aux_model, 0) / args.turns
+            print(f"{'fast path' if fast_path else 'graphs':>12} {main_calls:>22.1f} {aux_calls:>21.1f} "
+                  f"{statistics.median(ttfts):>18.2f}s {max(ttfts):>6.2f}s")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--aux-model", default="qwen2.5:1.5b")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""Time-to-first-token for N concurrent chats against a running PlebChat server.
+
+    python bench/concurrent_ttft.py --url http://localhost:9000 --graph fren -n 8
+
+Every chat is started at (roughly) the same instant.  If the graphs block the
+event loop the 2nd..Nth chat has to wait for the ones in front of it, so TTFT
+climbs linearly with the chat's position.  With the async execution path the
+column should stay flat (bounded by what Ollama itself can run in parallel).
+"""
+
+import json
+import time
+import argparse
+import threading
+
+import requests
+
+
+def first_token_time(url: str, graph: str, prompt: str, start: threading.Event, results: list, i: int):
+    body = {
+        "query": prompt,
+        "messages": [{"role": "user", "content": prompt}],
+        "config": {},
+    }
+    start.wait()
+    t0 = time.perf_counter()
+    ttft = None
+    with requests.post(f"{url}/graph/{graph}", json=body, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.startswith(b"data: "):
+                continue
+            frame = json.loads(line[6:])
+            delta = frame.get("choices", [{}])[0].get("delta", {})
+            if ttft is None and (delta.get("content") or delta.get("reasoning_content")):
+                ttft = time.perf_counter() - t0
+    results[i] = (ttft, time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:9000")
+    parser.add_argument("--graph", default="fren")
+    parser.add_argument("--prompt", default="Count from one to twenty, one number per line.")
+    parser.add_argument("-n", "--chats", type=int, default=4)
+    args = parser.parse_args()
+
+    start = threading.Event()
+    results = [None] * args.chats
+    threads = [
+        threading.Thread(target=first_token_time, args=(args.url, args.graph, args.prompt, start, results, i))
+        for i in range(args.chats)
+    ]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+
+    # order by arrival of the first token - that's the "2nd..Nth chat" the benchmark is about
+    ordered = sorted(results, key=lambda r: float("inf") if r[0] is None else r[0])
+    print(f"{'chat':>5} {'ttft (s)':>10} {'total (s)':>10}")
+    for i, (ttft, total) in enumerate(ordered, start=1):
+        print(f"{i:>5} {ttft if ttft is not None else float('nan'):>10.3f} {total:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
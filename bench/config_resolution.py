@@ -0,0 +1,84 @@
+"""Config constructions per turn, and the cost of resolving one.
+
+    python bench/config_resolution.py
+
+Runs turns through the real graphs the way the server does (`run_config` once,
+then `astream`), counting how many `Config` models get built.  The LLM nodes'
+`get_llm` is called directly as well, since a full LLM turn would need Ollama.
+Every turn must build exactly one Config - the server's - no matter how many
+nodes look it up.  Exits non-zero otherwise.
+"""
+
+import os
+import sys
+import asyncio
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from graphs import graph_registry
+from graphs.config import Config, run_config
+from graphs.fren.nodes import get_llm as fren_get_llm
+from graphs.research.graph import get_llm as research_get_llm
+
+
+VALVES = {
+    "LLM_MODEL": "llama3.1:8b",
+    "KEEP_ALIVE": "5m",
+    "DISABLE_COMMANDS": False,
+    "OLLAMA_BASE_URL": "http://localhost:11434",
+    "DEBUG": False,
+}
+
+constructed = 0
+_init = Config.__init__
+
+
+def counting_init(self, **data):
+    global constructed
+    constructed += 1
+    _init(self, **data)
+
+
+async def graph_turn(graph_id: str, text: str):
+    config = run_config(VALVES)
+    input_state = {"messages": [{"role": "user", "content": text}], "query": text}
+    async for _ in graph_registry[graph_id].astream(input=input_state, config=config, stream_mode=["messages", "custom"]):
+        pass
+
+
+async def llm_lookups():
+    config = run_config(VALVES)
+    for _ in range(3):
+        fren_get_llm(config)
+        research_get_llm(config)
+
+
+def main():
+    global constructed
+    Config.__init__ = counting_init
+
+    failed = False
+    for name, turn in [
+        ("echobot turn", lambda: graph_turn("echobot", "hello")),
+        ("fren /random turn", lambda: graph_turn("fren", "/random 5")),
+        ("research /help turn", lambda: graph_turn("research", "/help")),
+        ("6x get_llm in one run", llm_lookups),
+    ]:
+        constructed = 0
+        asyncio.run(turn())
+        ok = constructed == 1
+        failed |= not ok
+        print(f"{name:<24} {constructed} Config constructed  {'ok' if ok else 'FAIL (expected 1)'}")
+
+    Config.__init__ = _init
+    config = run_config(VALVES)
+    resolved_us = min(timeit.repeat(lambda: Config.from_runnable_config(config), number=20_000, repeat=5)) / 20_000 * 1e6
+    fresh_us = min(timeit.repeat(lambda: Config.from_runnable_config({"configurable": VALVES}), number=20_000, repeat=5)) / 20_000 * 1e6
+    print(f"\nfrom_runnable_config: {fresh_us:.2f} us resolving, {resolved_us:.2f} us with the run's Config")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Prefill time vs. chat history length, with and without the context budget.
+
+    python bench/context_prefill.py                       # estimator cost only, no Ollama needed
+    python bench/context_prefill.py --ollama http://localhost:11434 --model llama3.1:8b
+
+Offline part: what `prompts.build` costs per turn as a chat grows, with the
+per-message token counts cached (each turn counts only its new message) and
+with the cache cleared before every turn (everything counted again).
+
+With `--ollama`: for growing synthetic histories, sends the full history and
+the budgeted one (`CONTEXT_TOKENS` / `--budget`) to `/api/chat` with
+`num_predict=1`, and reports Ollama's own prompt_eval_count and
+prompt_eval_duration - the prefill - next to our token estimate.  Every
+request starts with a fresh nonce so Ollama's prompt cache can't reuse a prefix.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import timeit
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import settings
+from graphs import context, prompts
+from graphs.context import message_tokens, estimate_tokens
+from graphs.fren.state import SYSTEM_PROMPT
+
+
+WORDS = ("the model keeps a cache of every token it has seen so far and each new turn "
+         "adds more of them; prefill cost grows with the prompt while decode stays flat. "
+         "def handler(request): return {'status': 200, 'items': [1, 2, 3]} # config=value").split()
+
+
+def synthetic_history(turns: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"q{i}: " + " ".join(rng.choices(WORDS, k=rng.randint(10, 60)))})
+        messages.append({"role": "assistant", "content": f"a{i}: " + " ".join(rng.choices(WORDS, k=rng.randint(40, 200)))})
+    messages.append({"role": "user", "content": "and what about the last one?"})
+    return messages
+
+
+def assembly_cost(turns: int, model: str):
+    history = synthetic_history(turns)
+
+    def per_turn_us(clear: bool) -> float:
+        def turn():
+            if clear:
+                context._counts.clear()
+            prompts.build(None, SYSTEM_PROMPT, history, model)
+        turn()
+        return min(timeit.repeat(turn, number=50, repeat=5)) / 50 * 1e6
+
+    return per_turn_us(clear=False), per_turn_us(clear=True)
+
+
+def prefill(client: httpx.Client, url: str, model: str, messages: list[dict], num_ctx: int) -> tuple[int, float, float]:
+    nonce = {"role": "system", "content": f"session {random.getrandbits(64):x}"}
+    t0 = time.perf_counter()
+    response = client.post(f"{url}/api/chat", json={
+        "model": model,
+        "messages": [nonce] + messages,
+        "stream": False,
+        "options": {"num_predict": 1, "num_ctx": num_ctx},
+    }, timeout=600)
+    response.raise_for_status()
+    elapsed = (time.perf_counter() - t0) * 1000
+    body = response.json()
+    return body.get("prompt_eval_count", 0), body.get("prompt_eval_duration", 0) / 1e6, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama", help="Ollama base URL (omit to only time the estimator)")
+    parser.add_argument("--model", default=settings.LLM_MODEL)
+    parser.add_argument("--budget", type=int, help="Context tokens for the budgeted run (default: CONTEXT_TOKENS)")
+    parser.add_argument("--num-ctx", type=int, default=32768, help="num_ctx for both runs, so the full history isn't truncated by Ollama")
+    parser.add_argument("--turns", default="0,4,16,64,128,256")
+    args = parser.parse_args()
+
+    if args.budget:
+        settings.CONTEXT_TOKENS = args.budget
+    lengths = [int(t) for t in args.turns.split(",")]
+
+    text = " ".join(WORDS) * 200
+    us = min(timeit.repeat(lambda: estimate_tokens(text), number=20, repeat=5)) / 20 * 1e6
+    print(f"estimate_tokens: {len(text) / us:.0f} chars/us ({len(text)} chars in {us:.0f} us)\n")
+
+    print(f"{'turns':>6} {'messages':>9} {'est. tokens':>12} {'build cached':>16} {'uncached':>10}")
+    for turns in lengths:
+        history = synthetic_history(turns)
+        total = sum(message_tokens(m) for m in history)
+        cached, uncached = assembly_cost(turns, args.model)
+        print(f"{turns:>6} {len(history):>9} {total:>12} {cached:>13.0f} us {uncached:>7.0f} us")
+
+    if not args.ollama:
+        return
+
+    budget = context.context_budget(args.model)
+    print(f"\nprefill on {args.model}, budget {budget} prompt tokens (num_ctx {args.num_ctx})")
+    print(f"{'turns':>6} | {'full: est':>9} {'ollama':>7} {'prefill':>9} | {'budgeted: est':>13} {'ollama':>7} {'prefill':>9} {'dropped':>8}")
+    with httpx.Client() as client:
+        # Load the model first so the first row isn't a cold start
+        prefill(client, args.ollama, args.model, [{"role": "user", "content": "hi"}], args.num_ctx)
+        for turns in lengths:
+            history = synthetic_history(turns)
+            full = [{"role": "system", "content": SYSTEM_PROMPT}] + history
+            full_est = sum(message_tokens(m) for m in full)
+            full_count, full_ms, _ = prefill(client, args.ollama, args.model, full, args.num_ctx)
+
+            budgeted = prompts.build(None, SYSTEM_PROMPT, history, args.model)
+            count, ms, _ = prefill(client, args.ollama, args.model, budgeted.messages, args.num_ctx)
+            print(f"{turns:>6} | {full_est:>9} {full_count:>7} {full_ms:>6.0f} ms | "
+                  f"{budgeted.tokens:>13} {count:>7} {ms:>6.0f} ms {budgeted.dropped:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""SSE frames/sec: the old dict-builder + json.dumps path vs. the precompiled encoder.
+
+    python bench/encoder_frames.py
+
+Also checks that both paths produce byte-identical frames for a mix of
+ASCII, quotes/backslashes/control characters, non-ASCII and emoji tokens.
+"""
+
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import encoder
+
+
+# The per-token builders `src/helpers.py` used before the encoder existed
+def thinking_tokens(tokens: str):
+    return {'choices': [{'delta': {'reasoning_content': tokens}, 'finish_reason': None}]}
+
+def content_tokens(tokens: str):
+    return {'choices': [{'delta': {'content': tokens}, 'finish_reason': None}]}
+
+def old_emit_event(description: str, done: bool):
+    event = {"event": {"type": "status", "data": {"description": description, "done": done}}}
+    return f"data: {json.dumps(event)}\n\n"
+
+def old_content_frame(text):
+    return f"data: {json.dumps(content_tokens(text))}\n\n"
+
+def old_thinking_frame(text):
+    return f"data: {json.dumps(thinking_tokens(text))}\n\n"
+
+
+TOKENS = [" the", " quick", "\n\n", ' "quoted"', " back\\slash", "\t", "\x00", " café", " 🐸", " 日本語", "", "```python\n"]
+
+
+def check_identical():
+    for token in TOKENS:
+        assert encoder.content_frame(token) == old_content_frame(token), token
+        assert encoder.thinking_frame(token) == old_thinking_frame(token), token
+        for done in (True, False):
+            assert encoder.emit_event(token, done) == old_emit_event(token, done), token
+    assert encoder.NEWLINES_FRAME == old_content_frame("\n\n")
+    assert encoder.THINKING_NEWLINE_FRAME == old_thinking_frame("\n")
+    for reason in (None, "stop", "error"):
+        assert encoder._finish_frame(reason) == f"data: {json.dumps({'choices': [{'delta': {}, 'finish_reason': reason}]})}\n\n"
+
+
+def frames_per_sec(fn, number=20_000):
+    def run():
+        for token in TOKENS:
+            fn(token)
+    seconds = min(timeit.repeat(run, number=number, repeat=5))
+    return number * len(TOKENS) / seconds
+
+
+def main():
+    check_identical()
+    print("frames are byte-identical")
+
+    for name, old, new in [
+        ("content", old_content_frame, encoder.content_frame),
+        ("reasoning", old_thinking_frame, encoder.thinking_frame),
+        ("status", lambda t: old_emit_event(t, False), lambda t: encoder.emit_event(t, False)),
+    ]:
+        before = frames_per_sec(old)
+        after = frames_per_sec(new)
+        print(f"{name:>10}: {before:>12,.0f} -> {after:>12,.0f} frames/sec  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Time to first token with and without hedging, when the host a call is routed to is stuck.
+
+    python bench/hedge_ttft.py --stall 3 --hedge-after 0.5 -n 5
+
+Two stub Ollama hosts (see `stub_ollama.py`): the model is loaded on the
+"slow" one, which takes `--stall` seconds to its first token (a host swapping
+models), and only pulled on the "fast" one.  The pool routes every call to the
+slow host; with hedging the call also goes to the fast one after
+`--hedge-after` seconds.  Reports the TTFT of each run both ways, checks that
+the losing request was cancelled, that only one reply's tokens came back and
+that the pool credits the backup host with the answer.  Then, with
+`LLM_SLOTS=1`, checks that a pending backup holds a slot and counts in flight
+on its host, and that no hedge is sent to a host with no free slot.  Exits 1
+if any check fails.  No real Ollama needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+PORTS = (18511, 18512)
+MODEL = "llama3.1:8b"
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--stall", type=float, default=3.0, help="Seconds the slow host takes to its first token")
+parser.add_argument("--hedge-after", type=float, default=0.5, help="LLM_HEDGE_AFTER")
+parser.add_argument("-n", type=int, default=5, help="Runs each way")
+args = parser.parse_args()
+
+os.environ["OLLAMA_HOSTS"] = ",".join(f"http://127.0.0.1:{p}" for p in PORTS)
+os.environ["OLLAMA_PROBE_INTERVAL"] = "3600"
+os.environ["LLM_HEDGE_AFTER"] = str(args.hedge_after)
+
+from stub_ollama import StubOllama
+from ollama_pool import pool
+from dispatcher import dispatcher
+import metrics
+from graphs.config import Config, run_config
+from graphs.llm import chat_ollama, astream_chat
+
+
+async def call(hedge: bool) -> tuple[float, int, str]:
+    llm = chat_ollama(Config(LLM_MODEL=MODEL), hedge=hedge)
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    async for chunk in astream_chat(llm, [{"role": "user", "content": "hi"}], run_config({})):
+        if chunk.content:
+            ttft = ttft or time.perf_counter() - started
+            tokens += 1
+    return ttft, tokens, llm.base_url
+
+
+async def main() -> int:
+    slow = StubOllama(PORTS[0], models=[MODEL], loaded=[MODEL], first=args.stall, tokens=10).start()
+    fast = StubOllama(PORTS[1], models=[MODEL], loaded=[], load=0.2, tokens=10).start()
+    await pool.probe()
+    fast.loaded.clear()  # pulled, not loaded - the pool prefers the slow host
+
+    results = {}
+    for hedge in (False, True):
+        slow.calls = slow.cancelled = fast.calls = 0
+        runs = [await call(hedge) for _ in range(args.n)]
+        results[hedge] = runs
+        print(f"{'hedged' if hedge else 'unhedged':>9}: TTFT " + " ".join(f"{r[0]:.2f}s" for r in runs)
+              + f"  (median {statistics.median(r[0] for r in runs):.2f}s; calls slow/fast {slow.calls}/{fast.calls},"
+              f" cancelled on slow {slow.cancelled})")
+
+    failures = []
+
+    if not all(r[2] == slow.url for r in results[True] + results[False]):
+        failures.append("calls weren't routed to the slow host first")
+    if not all(r[0] < args.hedge_after + 1.0 for r in results[True]):
+        failures.append("hedged TTFT isn't close to the threshold")
+    if slow.cancelled != args.n:
+        failures.append(f"{slow.cancelled} of {args.n} losing requests cancelled")
+    if not all(r[1] == 10 for r in results[True]):
+        failures.append("a hedged reply didn't have exactly one answer's tokens")
+    if MODEL not in next(b for b in pool.status() if b["url"] == fast.url)["loaded"]:
+        failures.append("the backup answered, but the pool doesn't count the model as loaded there")
+    if any(b["in_flight"] for b in pool.status()):
+        failures.append(f"calls still counted in flight: {pool.status()}")
+
+    # A pending backup is load on its host: it counts in flight there and holds one of its slots
+    dispatcher.slots = 1
+    fast.first = args.stall * 2  # keep the backup pending until the primary answers
+    running = asyncio.ensure_future(call(True))
+    await asyncio.sleep(args.hedge_after + 0.2)
+    backup = next(b for b in pool.status() if b["url"] == fast.url)
+    busy = dispatcher.hosts[fast.url].busy if fast.url in dispatcher.hosts else 0
+    if backup["in_flight"] != 1 or busy != 1:
+        failures.append(f"a pending backup isn't counted on its host (in flight {backup['in_flight']}, slots busy {busy})")
+    await running
+    fast.first = 0.05
+
+    # With the backup host's only slot taken, the call isn't hedged there
+    fast.calls = 0
+    async with dispatcher.slot(fast.url):
+        ttft, _, _ = await call(True)
+    if fast.calls or ttft < args.stall:
+        failures.append(f"hedged onto a host with no free slot ({fast.calls} backup calls, TTFT {ttft:.2f}s)")
+    if any(queue.busy for queue in dispatcher.hosts.values()):
+        failures.append(f"dispatcher slots still taken: { {h: q.busy for h, q in dispatcher.hosts.items()} }")
+    dispatcher.slots = 0
+    dispatcher.hosts.clear()
+
+    print()
+    print("\n".join(line for line in metrics.render().splitlines() if "hedge" in line and not line.startswith("#")
+                    and ("_bucket" not in line)))
+    for stub in (slow, fast):
+        stub.stop()
+    print("\n" + ("\n".join(f"FAIL {f}" for f in failures) if failures else "all checks passed"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
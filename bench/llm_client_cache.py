@@ -0,0 +1,53 @@
+"""Per-turn LLM client overhead: building a ChatOllama every node call vs. the LRU cache.
+
+    python bench/llm_client_cache.py
+
+Times what a node does before it can start streaming - resolve the Config
+from the RunnableConfig and get a ChatOllama - with `LLM_CACHE_SIZE=0`
+(a fresh client per call, the old behaviour) and with the cache on.  No
+Ollama server is needed; nothing here opens a connection.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import settings
+from graphs.config import Config
+from graphs.llm import chat_ollama, invalidate_llms
+
+
+CONFIG = {"configurable": {
+    "LLM_MODEL": "llama3.1:8b",
+    "KEEP_ALIVE": "5m",
+    "OLLAMA_BASE_URL": "http://localhost:11434",
+}}
+
+
+def turn():
+    return chat_ollama(Config.from_runnable_config(CONFIG))
+
+
+def per_turn_us(cache_size: int, number: int) -> float:
+    settings.LLM_CACHE_SIZE = cache_size
+    invalidate_llms()
+    turn()  # the first turn always builds the client
+    return min(timeit.repeat(turn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    config_us = min(timeit.repeat(lambda: Config.from_runnable_config(CONFIG), number=2000, repeat=5)) / 2000 * 1e6
+    uncached = per_turn_us(0, number=200)
+    cached = per_turn_us(8, number=2000)
+
+    print(f"Config.from_runnable_config alone: {config_us:>8.1f} us")
+    print(f"new ChatOllama per turn:           {uncached:>8.1f} us")
+    print(f"cached ChatOllama:                 {cached:>8.1f} us  ({uncached / cached:.0f}x less per-turn overhead)")
+
+    assert turn() is turn(), "cache should hand back the same client"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""CPU and memory per turn for the graphs' message history: `list` + `operator.add` vs. `MessageLog`.
+
+    python bench/message_log.py
+
+Two measurements at 10, 100 and 1000 messages of history:
+
+- turn: a 3-node graph shaped like ours (pydantic State, each node adds one
+  message) run on the history, as the server runs a turn.  Time per turn, and
+  the peak memory allocated during it (tracemalloc).
+- growth: a conversation built up to that length one update at a time through
+  the reducer alone - O(n^2) copying with `operator.add`, O(n) with the log.
+- query: a `MessageLog` turn whose nodes, like fren's `ollama`, build their
+  prompt (a slice of the history, as `prompts.build` makes) plus the user's
+  query - by adding it to the shared log first (`.add`, which makes the
+  reducer fork the log for the reply) vs. after the slice, as `extra`.  Time
+  per turn and peak memory.
+
+No Ollama or network needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import operator
+import tracemalloc
+from typing import Annotated
+
+from pydantic import BaseModel, Field
+from langgraph.graph.state import StateGraph
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from graphs.messages import MessageLog, add_messages
+
+
+class ListState(BaseModel):
+    messages: Annotated[list, operator.add] = Field(default_factory=list)
+
+
+class LogState(BaseModel):
+    messages: Annotated[MessageLog, add_messages] = Field(default_factory=MessageLog)
+
+
+def build(state_type, query: str = ""):
+    async def node(state):
+        # what our nodes do: read the latest message, add one
+        history = state.messages
+        if query == "add":
+            history = history.add({"role": "user", "content": "query"})
+            prompt = history[0:]
+        elif query == "extra":
+            prompt = history[0:] + [{"role": "user", "content": "query"}]
+        else:
+            prompt = history
+        return {"messages": [{"role": "assistant", "content": prompt[-1]["content"][:20]}]}
+
+    builder = StateGraph(state_type)
+    for name in ("check", "work", "reply"):
+        builder.add_node(name, node)
+    builder.add_edge("__start__", "check")
+    builder.add_edge("check", "work")
+    builder.add_edge("work", "reply")
+    builder.add_edge("reply", "__end__")
+    return builder.compile()
+
+
+def history(n: int) -> list[dict]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 200} for i in range(n)]
+
+
+async def turn_cost(graph, n: int, turns: int = 30) -> tuple[float, float]:
+    messages = history(n)
+    await graph.ainvoke({"messages": messages})
+
+    started = time.perf_counter()
+    for _ in range(turns):
+        await graph.ainvoke({"messages": messages})
+    per_turn = (time.perf_counter() - started) / turns
+
+    tracemalloc.start()
+    await graph.ainvoke({"messages": messages})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_turn, peak
+
+
+def growth_cost(reducer, empty, n: int) -> float:
+    messages = history(n)
+    started = time.perf_counter()
+    value = empty()
+    for message in messages:
+        value = reducer(value, [message])
+    return time.perf_counter() - started
+
+
+async def main():
+    graphs = {"list": build(ListState), "MessageLog": build(LogState),
+              "add": build(LogState, "add"), "extra": build(LogState, "extra")}
+
+    print(f"{'messages':>8} | {'turn: list':>11} {'MessageLog':>11} | {'peak: list':>11} {'MessageLog':>11} "
+          f"| {'growth: list':>13} {'MessageLog':>11} | {'query: .add':>21} {'extra':>21}")
+    for n in (10, 100, 1000):
+        (list_s, list_peak), (log_s, log_peak) = [await turn_cost(graphs[name], n) for name in ("list", "MessageLog")]
+        list_growth = growth_cost(operator.add, list, n)
+        log_growth = growth_cost(add_messages, MessageLog, n)
+        (add_s, add_peak), (local_s, local_peak) = [await turn_cost(graphs[name], n) for name in ("add", "extra")]
+        print(f"{n:>8} | {list_s * 1e3:>8.2f} ms {log_s * 1e3:>8.2f} ms | {list_peak / 1024:>8.0f} KB {log_peak / 1024:>8.0f} KB "
+              f"| {list_growth * 1e3:>10.2f} ms {log_growth * 1e3:>8.2f} ms | {add_s * 1e3:>8.2f} ms {add_peak / 1024:>6.0f} KB  {local_s * 1e3:>8.2f} ms {local_peak / 1024:>6.0f} KB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""Check the Ollama host pool's routing against local stub Ollama servers.
+
+    python bench/pool_routing.py
+
+Starts three stub hosts (see `stub_ollama.py`) and drives real LLM calls
+through `chat_ollama` / `astream_chat` as the graphs do:
+
+1. the call goes to the host that has the model loaded, not one that only has
+   it pulled or doesn't have it at all,
+2. concurrent calls spread over the hosts that have it loaded (least in flight),
+   also with `LLM_SLOTS` set, where a burst of calls waits in the dispatcher,
+3. a chat stays on its host while that's no busier,
+4. a host that goes away is ejected on the first failed call and gets no
+   more traffic,
+5. once it's back it's probed again after `OLLAMA_EJECT_SECONDS` and routed to.
+
+Prints each check and exits 1 if any failed.  No real Ollama needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+PORTS = (18501, 18502, 18503)
+EJECT_SECONDS = 1.0
+MODEL = "llama3.1:8b"
+
+os.environ["OLLAMA_HOSTS"] = ",".join(f"http://127.0.0.1:{p}" for p in PORTS)
+os.environ["OLLAMA_EJECT_SECONDS"] = str(EJECT_SECONDS)
+os.environ["OLLAMA_PROBE_INTERVAL"] = "3600"  # probes only when the checks ask for them
+
+from stub_ollama import StubOllama
+from ollama_pool import pool
+from dispatcher import dispatcher
+from graphs.config import Config, run_config
+from graphs.llm import chat_ollama, astream_chat
+
+
+failures = []
+
+
+def check(name: str, ok: bool, detail: str = ""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+async def call(chat: str = None) -> str:
+    llm = chat_ollama(Config(LLM_MODEL=MODEL), chat)
+    async for _ in astream_chat(llm, [{"role": "user", "content": "hi"}], run_config({})):
+        pass
+    return llm.base_url
+
+
+async def main():
+    loaded, pulled, bare = (
+        StubOllama(PORTS[0], models=[MODEL], loaded=[MODEL]).start(),
+        StubOllama(PORTS[1], models=[MODEL], load=0.2).start(),
+        StubOllama(PORTS[2], models=["qwen2.5:7b"]).start(),
+    )
+    await pool.probe()
+    check("all hosts healthy after the first probe", all(b["healthy"] for b in pool.status()))
+
+    # 1. residency
+    url = await call()
+    check("routed to the host with the model loaded", url == loaded.url, url)
+
+    # 2. least loaded - a second host gets the model loaded, then calls overlap
+    pulled.loaded.add(MODEL)
+    await pool.probe()
+    loaded.calls = pulled.calls = bare.calls = 0
+    calls = []
+    for _ in range(4):
+        calls.append(asyncio.create_task(call()))
+        await asyncio.sleep(0.03)  # let each call get in flight before the next is routed
+    await asyncio.gather(*calls)
+    check("concurrent calls split over the loaded hosts", (loaded.calls, pulled.calls, bare.calls) == (2, 2, 0),
+          f"calls per host {loaded.calls}/{pulled.calls}/{bare.calls}")
+
+    # ...and a burst routed all at once, waiting for one slot per host: the queued calls count too
+    dispatcher.slots = 1
+    loaded.calls = pulled.calls = bare.calls = 0
+    await asyncio.gather(*(call() for _ in range(6)))
+    dispatcher.slots = 0
+    dispatcher.hosts.clear()
+    check("a burst waiting for LLM_SLOTS splits over the loaded hosts", (loaded.calls, pulled.calls, bare.calls) == (3, 3, 0),
+          f"calls per host {loaded.calls}/{pulled.calls}/{bare.calls}")
+
+    # 3. affinity
+    first = await call("chat-1")
+    again = [await call("chat-1") for _ in range(3)]
+    check("a chat stays on its host", all(u == first for u in again), f"{first} then {again}")
+
+    # 4. ejection
+    loaded.stop()
+    pool._affinity.clear()
+    failed = None
+    for _ in range(2):  # whichever of the two loaded hosts the first call goes to
+        try:
+            await call()
+        except Exception as e:
+            failed = e
+            break
+    down = next(b for b in pool.status() if b["url"] == loaded.url)
+    check("a host that went away is ejected on the failed call", failed is not None and not down["healthy"],
+          f"{type(failed).__name__}: {down['error']}")
+    urls = [await call() for _ in range(3)]
+    check("no calls go to the ejected host", loaded.url not in urls, str(urls))
+
+    # 5. re-probe
+    loaded = StubOllama(PORTS[0], models=[MODEL], loaded=[MODEL]).start()
+    await pool.probe()
+    check("not probed again before its ejection is up",
+          not next(b for b in pool.status() if b["url"] == loaded.url)["healthy"])
+    time.sleep(EJECT_SECONDS)
+    await pool.probe()
+    check("probed and back in rotation after OLLAMA_EJECT_SECONDS",
+          next(b for b in pool.status() if b["url"] == loaded.url)["healthy"])
+    urls = {await call(f"chat-{i}") for i in range(4)}
+    check("routed to again", loaded.url in urls, str(sorted(urls)))
+
+    for stub in (loaded, pulled, bare):
+        stub.stop()
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nall checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,109 @@
+"""How much of each turn's prompt Ollama can serve from its KV cache, pinned cut vs. sliding window.
+
+    python bench/prefix_reuse.py --budget 2048                     # prompt prefixes only, no Ollama needed
+    python bench/prefix_reuse.py --budget 2048 --ollama http://localhost:11434 --model llama3.1:8b
+
+Plays one synthetic chat turn by turn.  "sliding" trims the history to the
+budget every turn by dropping just enough of the oldest messages - so once the
+chat is over budget, the prompt's start moves on every turn.  "pinned" is
+`prompts.build` with a chat key: the cut point only moves when the history
+outgrows the budget again.
+
+For each turn the table shows how many leading messages the prompt shares
+with the previous turn's; with `--ollama` it also sends both prompts
+(`num_predict=1`) and shows Ollama's prompt_eval_count and prefill time.  The
+two strategies get different nonces so they don't share cache slots' prefixes.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import settings
+from graphs import context, prompts
+from graphs.fren.state import SYSTEM_PROMPT
+from context_prefill import synthetic_history
+
+
+def sliding(history: list[dict], model: str) -> list[dict]:
+    system = [{"role": "system", "content": SYSTEM_PROMPT}]
+    start, _ = context.fit(system, history, context.context_budget(model))
+    return system + history[start:]
+
+
+def shared_prefix(a: list[dict], b: list[dict]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def prefill(client: httpx.Client, url: str, model: str, nonce: str, messages: list[dict], num_ctx: int) -> tuple[int, float]:
+    response = client.post(f"{url}/api/chat", json={
+        "model": model,
+        "messages": [{"role": "system", "content": nonce}] + messages,
+        "stream": False,
+        "options": {"num_predict": 1, "num_ctx": num_ctx},
+    }, timeout=600)
+    response.raise_for_status()
+    body = response.json()
+    return body.get("prompt_eval_count", 0), body.get("prompt_eval_duration", 0) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama", help="Ollama base URL (omit to only compare prompt prefixes)")
+    parser.add_argument("--model", default=settings.LLM_MODEL)
+    parser.add_argument("--budget", type=int, default=2048, help="CONTEXT_TOKENS for the run")
+    parser.add_argument("--turns", type=int, default=40)
+    args = parser.parse_args()
+
+    settings.CONTEXT_TOKENS = args.budget
+    settings.CONTEXT_REPLY_TOKENS = min(settings.CONTEXT_REPLY_TOKENS, args.budget // 4)
+    num_ctx = args.budget
+    chat = synthetic_history(args.turns)
+    config = {"configurable": {"thread_id": f"bench:{random.getrandbits(32):x}"}}
+    nonces = {name: f"session {random.getrandbits(64):x}" for name in ("sliding", "pinned")}
+    client = httpx.Client() if args.ollama else None
+
+    print(f"budget {context.context_budget(args.model)} prompt tokens, trim to {settings.CONTEXT_TRIM_TO:.0%}")
+    header = f"{'turn':>4} | {'sliding: msgs':>13} {'shared':>6}"
+    header += f" {'evaluated':>9} {'prefill':>9}" if client else ""
+    header += f" | {'pinned: msgs':>12} {'shared':>6}"
+    header += f" {'evaluated':>9} {'prefill':>9}" if client else ""
+    print(header)
+
+    previous = {"sliding": [], "pinned": []}
+    totals = {"sliding": [0, 0.0], "pinned": [0, 0.0]}
+    for turn in range(args.turns):
+        history = chat[:2 * turn + 1]  # every user message so far, and the replies before it
+        built = {
+            "sliding": sliding(history, args.model),
+            "pinned": prompts.build(config, SYSTEM_PROMPT, history, args.model).messages,
+        }
+        row = f"{turn:>4}"
+        for name, messages in built.items():
+            row += f" | {len(messages):>{13 if name == 'sliding' else 12}} {shared_prefix(previous[name], messages):>6}"
+            if client:
+                evaluated, ms = prefill(client, args.ollama, args.model, nonces[name], messages, num_ctx)
+                totals[name][0] += evaluated
+                totals[name][1] += ms
+                row += f" {evaluated:>9} {ms:>6.0f} ms"
+            previous[name] = messages
+        print(row)
+
+    if client:
+        client.close()
+        for name, (evaluated, ms) in totals.items():
+            print(f"{name:>8}: {evaluated} prompt tokens evaluated, {ms / 1000:.1f} s prefill in total")
+
+
+if __name__ == "__main__":
+    main()
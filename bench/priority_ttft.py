@@ -0,0 +1,106 @@
+"""Interactive time to first token while background traffic saturates Ollama, with and without priority dispatch.
+
+    python bench/priority_ttft.py --seconds 20 --background 6 --interval 1.0
+
+Runs the server in-process against a stub Ollama (see `stub_ollama.py`) that
+generates one call at a time, like a single-GPU host with
+OLLAMA_NUM_PARALLEL=1.  `--background` workers, spread over three users, keep
+posting background-priority chats back to back, so Ollama always has a queue;
+meanwhile two users each start an interactive chat every `--interval` seconds.
+
+First with `LLM_SLOTS=0` (calls pile up in Ollama's FIFO queue), then with
+`LLM_SLOTS=1` (they wait in the dispatcher, interactive first).  Reports the
+interactive chats' p50 / p95 TTFT and how many background chats still
+completed.  Admission limits are lifted so runs queue for the LLM, not for a
+run slot.  No real Ollama needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+PORT = 18531
+MODEL = "llama3.1:8b"
+os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ["MAX_RUNS_PER_GRAPH"] = "0"
+os.environ["MAX_RUNS_PER_MODEL"] = "0"
+os.environ["MAX_QUEUED_RUNS"] = "1000"
+
+import httpx
+
+from stub_ollama import StubOllama
+from dispatcher import dispatcher
+from server import app
+
+
+async def chat(client: httpx.AsyncClient, text: str, priority: str, user: str) -> float:
+    """Time to the first answer token."""
+    body = {"query": text, "messages": [{"role": "user", "content": text}], "config": {"LLM_MODEL": MODEL},
+            "priority": priority, "user": {"id": user}}
+    started = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/graph/fren", json=body) as response:
+        async for line in response.aiter_lines():
+            if ttft is None and '"content": "tok' in line:
+                ttft = time.perf_counter() - started
+    return ttft if ttft is not None else float("nan")
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    deadline = time.monotonic() + args.seconds
+    completed = 0
+
+    async def background(i: int):
+        nonlocal completed
+        while time.monotonic() < deadline:
+            await chat(client, f"background {i}", "background", f"batch-user-{i % 3}")
+            completed += 1
+
+    async def interactive(user: str) -> list[float]:
+        ttfts = []
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            ttfts.append(await chat(client, "hello", "interactive", user))
+            await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+        return ttfts
+
+    workers = [asyncio.create_task(background(i)) for i in range(args.background)]
+    await asyncio.sleep(1.0)  # let the background queue build up first
+    results = await asyncio.gather(interactive("alice"), interactive("bob"))
+    await asyncio.gather(*workers)
+    return [t for ttfts in results for t in ttfts], completed
+
+
+async def main(args):
+    stub = StubOllama(PORT, models=[MODEL], loaded=[MODEL], first=0.15, delay=0.02, tokens=20, parallel=1).start()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        await chat(client, "warm up", "interactive", "bench")
+        print(f"{'':>16} {'interactive TTFT p50':>21} {'p95':>7} {'chats':>6} {'background done':>16}")
+        for slots in (0, 1):
+            dispatcher.slots = slots
+            dispatcher.hosts.clear()
+            ttfts, completed = await run(client, args)
+            label = f"LLM_SLOTS={slots}"
+            print(f"{label:>16} {statistics.median(ttfts):>20.2f}s {percentile(ttfts, 95):>6.2f}s "
+                  f"{len(ttfts):>6} {completed:>16}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20, help="Length of each run")
+    parser.add_argument("--background", type=int, default=6, help="Background chats kept in flight")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between a user's interactive chats")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""Cost of the per-user rate limit check on the hot path, and a heavy user being held to their share.
+
+    python bench/rate_limit_check.py
+
+- check: time per `check()` + `charge()` with 1, 1,000 and 100,000 users
+  being limited (the cost must stay in microseconds as users pile up).
+- heavy user: one user starting a run every 100 ms for a simulated minute,
+  each run generating 800 tokens, against 20 runs/min and 10,000 tokens/min;
+  another user's first run must still go through.
+- restart: the state written to SQLite and read back by a new limiter,
+  including a request given back after the last sync.
+
+Exits 1 if a limit isn't enforced or the state doesn't survive the restart.
+No server or Ollama needed.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import rate_limits
+from rate_limits import RateLimiter
+
+
+def check_cost(users: int, calls: int = 200_000) -> float:
+    limiter = RateLimiter(requests_per_min=1e9, tokens_per_min=1e9, path="")
+    names = [f"user-{i}" for i in range(users)]
+    for name in names:
+        limiter.check(name)
+    started = time.perf_counter()
+    for i in range(calls):
+        name = names[i % users]
+        limiter.check(name)
+        limiter.charge(name, 100)
+    return (time.perf_counter() - started) / calls
+
+
+def heavy_user(limiter: RateLimiter) -> tuple[int, dict]:
+    now = 1_000_000.0
+    allowed = 0
+    refused = {"requests": 0, "tokens": 0}
+    with mock.patch.object(rate_limits.time, "time", lambda: now):
+        for _ in range(600):  # a run every 100 ms for a minute
+            limited = limiter.check("heavy")
+            if limited is None:
+                allowed += 1
+                limiter.charge("heavy", 800)
+            else:
+                refused[limited.limit] += 1
+            now += 0.1
+    return allowed, refused
+
+
+async def restart(path: str) -> tuple[float, float]:
+    first = RateLimiter(requests_per_min=20, tokens_per_min=10_000, path=path)
+    for _ in range(5):
+        first.check("alice")
+    first.charge("alice", 4_000)
+    await first.sync()
+    first.refund("alice")  # given back after a sync - the next one must still write it
+    await first.close()
+
+    second = RateLimiter(requests_per_min=20, tokens_per_min=10_000, path=path)
+    await second.load()
+    bucket = second._buckets.get("alice")
+    await second.close()
+    return (bucket.requests, bucket.tokens) if bucket else (20, 10_000)
+
+
+def main() -> int:
+    failures = []
+    for users in (1, 1_000, 100_000):
+        print(f"check + charge, {users:>7,} users: {check_cost(users) * 1e6:.2f} µs")
+
+    limiter = RateLimiter(requests_per_min=20, tokens_per_min=10_000, path="")
+    allowed, refused = heavy_user(limiter)
+    print(f"\nheavy user: {allowed} of 600 runs allowed in a minute ({allowed * 800:,} tokens), refused {refused}")
+    # One minute's burst plus a minute's refill is the most that can get through
+    if not 2 <= allowed <= 2 * 10_000 // 800 + 2:
+        failures.append(f"heavy user got {allowed} runs")
+    if limiter.check("someone-else") is not None:
+        failures.append("another user was limited by the heavy one")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        requests, tokens = asyncio.run(restart(os.path.join(tmp, "limits.sqlite")))
+    print(f"\nafter a restart alice has {requests:.1f} requests (5 taken, 1 given back) and {tokens:,.0f} tokens left (of 20 / 10,000)")
+    if requests > 17 or tokens > 6_100:
+        failures.append("the buckets didn't survive the restart")
+    if requests < 16:
+        failures.append("a refund after the last sync was lost in the restart")
+
+    print("\n" + ("\n".join(f"FAIL {f}" for f in failures) if failures else "all checks passed"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
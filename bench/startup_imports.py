@@ -0,0 +1,84 @@
+"""Server cold-start import time, per module.
+
+    python bench/startup_imports.py [--top 20] [--budget-ms 1500]
+
+Runs `python -X importtime -c "import server"` in a fresh interpreter and
+reports the slowest top-level packages, then times
+importing + compiling each graph separately.
+
+Exits non-zero if importing the server pulls in a graph framework
+(langgraph / langchain_*) - graphs are supposed to load lazily - or if
+`--budget-ms` is given and the server import takes longer than that.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Packages that must not be imported just to start the server
+LAZY = ("langgraph", "langchain_core", "langchain_ollama", "langchain_openai", "graphs.fren", "graphs.research", "graphs.echobot")
+
+
+def importtime(statement: str) -> list[tuple[int, int, str]]:
+    """(self us, cumulative us, module) for every module imported by `statement` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SRC, capture_output=True, text=True,
+        env={**os.environ, "GRAPH_WARMUP": "false"},
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))  # keep the nesting indent
+    return rows
+
+
+def package_totals(rows) -> dict[str, int]:
+    """Import time per top-level package - the sum of its modules' own ("self") time."""
+    totals = defaultdict(int)
+    for self_us, _, name in rows:
+        totals[name.strip().split(".")[0]] += self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="how many packages to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if `import server` takes longer")
+    args = parser.parse_args()
+
+    rows = importtime("import server")
+    total_ms = sum(cumulative for _, cumulative, name in rows if not name.startswith(" ")) / 1000
+    print(f"import server: {total_ms:,.0f} ms, {len(rows)} modules\n")
+
+    for name, us in sorted(package_totals(rows).items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:>9,.1f} ms  {name}")
+
+    eager = sorted({prefix for _, _, name in rows for prefix in LAZY if name.strip().startswith(prefix)})
+    print()
+    for module in ("graphs.fren.graph", "graphs.echobot.graph", "graphs.research.graph"):
+        graph_rows = importtime(f"import server, {module}")
+        graph_ms = (sum(c for _, c, n in graph_rows if not n.startswith(" ")) / 1000) - total_ms
+        print(f"  + {module:<24} {graph_ms:>9,.0f} ms  (import + compile, on first request or warm-up)")
+
+    failed = False
+    if eager:
+        print(f"\nFAIL: importing the server loaded {', '.join(eager)} - graphs should be imported lazily")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nFAIL: import server took {total_ms:,.0f} ms, budget is {args.budget_ms:,.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""A stand-in Ollama server for the benches - no GPU, predictable timing.
+
+    python bench/stub_ollama.py --port 11435 --models llama3.1:8b,qwen2.5:7b --loaded llama3.1:8b
+
+Answers `/api/tags`, `/api/ps`, `/api/version`, `/api/chat` (streamed ndjson or
+one JSON object) and `/api/generate` the way Ollama does, closely enough for
+langchain-ollama and our catalog / warm-up / pool code.  A chat with a model
+that isn't loaded waits `--load` seconds first and then counts as loaded, each
+answer is `--tokens` tokens `--delay` seconds apart after `--first` seconds of
+"prefill".
+
+Benches start stubs in-process with `StubOllama(...).start()`.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+import contextlib
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def _name(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+class StubOllama:
+    def __init__(self, port: int, models=("llama3.1:8b",), loaded=(), load: float = 1.0,
+                 first: float = 0.05, delay: float = 0.01, tokens: int = 20, parallel: int = 0):
+        self.port = port
+        self.models = {_name(m) for m in models}
+        self.loaded = {_name(m) for m in loaded}
+        self.load = load
+        self.first = first
+        self.delay = delay
+        self.tokens = tokens
+        # Like OLLAMA_NUM_PARALLEL: calls beyond this many wait for a slot (0 = no limit)
+        self.parallel = parallel
+        self._slots = None
+        # What the benches check
+        self.calls = 0
+        self.calls_by_model: dict[str, int] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.cancelled = 0
+        self.app = self._app()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/api/version")
+        async def version():
+            return {"version": "0.0.0-stub"}
+
+        @app.get("/api/tags")
+        async def tags():
+            return {"models": [
+                {"name": m, "model": m, "size": 4_000_000_000,
+                 "details": {"family": "llama", "parameter_size": "8B", "quantization_level": "Q4_0"}}
+                for m in sorted(self.models)
+            ]}
+
+        @app.get("/api/ps")
+        async def ps():
+            return {"models": [{"name": m, "model": m, "size_vram": 4_000_000_000} for m in sorted(self.loaded)]}
+
+        @app.post("/api/generate")
+        async def generate(request: Request):
+            body = await request.json()
+            await self._ensure_loaded(body["model"])
+            return {"model": body["model"], "response": "", "done": True}
+
+        @app.post("/api/chat")
+        async def chat(request: Request):
+            body = await request.json()
+            if body.get("stream", True):
+                return StreamingResponse(self._stream(body), media_type="application/x-ndjson")
+            self._count(body["model"])
+            async with self._slot():
+                await self._ensure_loaded(body["model"])
+                await asyncio.sleep(self.first)
+            return self._chunk(body["model"], '{"answer": "stub"}' if body.get("format") == "json" else "stub answer", done=True)
+
+        return app
+
+    def _slot(self):
+        if not self.parallel:
+            return contextlib.nullcontext()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.parallel)
+        return self._slots
+
+    def _count(self, model: str):
+        self.calls += 1
+        self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+
+    async def _ensure_loaded(self, model: str):
+        if _name(model) not in self.loaded:
+            await asyncio.sleep(self.load)
+            self.loaded.add(_name(model))
+
+    def _chunk(self, model: str, content: str, done: bool = False) -> dict:
+        chunk = {"model": model, "created_at": "2024-01-01T00:00:00Z",
+                 "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            chunk.update(done_reason="stop", prompt_eval_count=10, prompt_eval_duration=int(self.first * 1e9),
+                         eval_count=self.tokens, eval_duration=int(self.tokens * self.delay * 1e9), load_duration=0)
+        return chunk
+
+    async def _stream(self, body: dict):
+        model = body["model"]
+        self._count(model)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            async with self._slot():
+                await self._ensure_loaded(model)
+                await asyncio.sleep(self.first)
+                for i in range(self.tokens):
+                    yield json.dumps(self._chunk(model, f"tok{i} ")) + "\n"
+                    await asyncio.sleep(self.delay)
+                yield json.dumps(self._chunk(model, "", done=True)) + "\n"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    ##############################################################
+    def start(self) -> "StubOllama":
+        """Serve in a background thread until `stop()`."""
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        """Shut down - like a host going away, new connections are refused."""
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._server = self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", default="llama3.1:8b", help="Pulled models, comma separated")
+    parser.add_argument("--loaded", default="", help="Models loaded at start, comma separated")
+    parser.add_argument("--load", type=float, default=1.0, help="Seconds to load a model that isn't loaded")
+    parser.add_argument("--first", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--delay", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per answer")
+    parser.add_argument("--parallel", type=int, default=0, help="Calls generated at once, the rest wait (0 = no limit)")
+    args = parser.parse_args()
+
+    stub = StubOllama(args.port, [m for m in args.models.split(",") if m], [m for m in args.loaded.split(",") if m],
+                      load=args.load, first=args.first, delay=args.delay, tokens=args.tokens,
+                      parallel=args.parallel)
+    uvicorn.run(stub.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
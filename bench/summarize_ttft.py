@@ -0,0 +1,96 @@
+"""Time to first answer token for `/summarize` on a saved page, vs. waiting for the whole answer.
+
+    python bench/summarize_ttft.py page.html --ollama http://localhost:11434 --model llama3.1:8b -n 3
+
+Runs the research graph in-process, the way the server streams it
+(`stream_mode=["messages", "custom"]`), with the page fetch answered from the
+saved HTML file instead of the network - so every run summarizes exactly the
+same content and only Ollama's timing varies.  For each run it reports when
+the first thought arrived, when the first answer token arrived, and when the
+answer was complete - the last column is what the first token would cost if
+the re-injection were buffered - plus how much text went out as thoughts.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import settings
+import http_client
+from graphs import graph_registry
+from graphs.config import run_config
+
+
+PAGE_URL = "https://saved.page/article"
+
+
+def saved_page_client(path: str) -> httpx.AsyncClient:
+    with open(path, "rb") as f:
+        page = f.read()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=page, headers={"Content-Type": "text/html; charset=utf-8"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def summarize(configurable: dict) -> dict:
+    query = f"/summarize {PAGE_URL}"
+    input_state = {"messages": [{"role": "user", "content": query}], "query": query}
+    t0 = time.perf_counter()
+    first_thought = first_token = None
+    thought_chars = answer_chars = 0
+    async for mode, data in graph_registry["research"].astream(
+            input=input_state, config=run_config(configurable), stream_mode=["messages", "custom"]):
+        if mode == "custom" and data["type"] == "thought":
+            thought_chars += len(data["content"])
+            first_thought = first_thought or time.perf_counter() - t0
+        elif mode == "messages" and data[0].content:
+            answer_chars += len(data[0].content)
+            first_token = first_token or time.perf_counter() - t0
+    return {"thought": first_thought, "token": first_token, "done": time.perf_counter() - t0,
+            "thought_chars": thought_chars, "answer_chars": answer_chars}
+
+
+async def run(args):
+    page_client = saved_page_client(args.page)
+    # Page fetches go to the saved file; ChatOllama keeps using the real pooled transport
+    http_client.client = lambda: page_client
+    configurable = {"OLLAMA_BASE_URL": args.ollama, "LLM_MODEL": args.model}
+    await graph_registry.load("research")  # not part of any run's time
+
+    print(f"{'run':>3} {'1st thought':>12} {'1st token':>10} {'done':>8} {'thoughts':>10} {'answer':>8}")
+    runs = []
+    for i in range(args.n):
+        result = await summarize(configurable)
+        runs.append(result)
+        token = f"{result['token']:>9.2f}s" if result["token"] else f"{'-':>10}"
+        print(f"{i:>3} {result['thought'] or 0:>11.2f}s {token} {result['done']:>7.2f}s "
+              f"{result['thought_chars']:>5} chars {result['answer_chars']:>8}")
+
+    await page_client.aclose()
+    await http_client.aclose()
+    tokens = [r["token"] for r in runs if r["token"]]
+    if tokens:
+        print(f"\nmedian time to first answer token {statistics.median(tokens):.2f}s, "
+              f"to the complete answer (buffered) {statistics.median(r['done'] for r in runs):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("page", help="Saved HTML page to summarize")
+    parser.add_argument("--ollama", default=settings.OLLAMA_BASE_URL)
+    parser.add_argument("--model", default=settings.LLM_MODEL)
+    parser.add_argument("-n", type=int, default=3, help="Runs")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Check that Open WebUI's task requests leave a checkpointed chat's stored thread alone.
+
+    python bench/task_checkpoint_check.py
+
+OUI sends its background prompts (title, tags, follow-ups, query, emoji,
+autocomplete...) with the chat's `chat_id`.  Plays a chat turn through the
+server in-process, then task requests for the same chat - ones the auxiliary
+fast path fails on (no Ollama here, so they fall back to the graph), ones run
+with `AUX_FAST_PATH` off and ones `auxiliary.TASKS` has no prompt for - and
+checks after each that:
+
+- the chat's `thread_activity` row (history hash, turns) is unchanged,
+- the run went at background priority, not interactive,
+
+and finally that the chat's next delta turn is still accepted (no 409).
+Exits 1 if any check fails.  Uses the `echobot` graph - no Ollama needed.
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+TMP = tempfile.mkdtemp()
+os.environ["CHECKPOINT_DB"] = os.path.join(TMP, "checkpoints.sqlite")
+os.environ["OLLAMA_BASE_URL"] = "http://127.0.0.1:9"  # nothing listens - the fast path fails and falls back
+
+import httpx
+
+import settings
+import tracing
+from server import app
+from checkpoints import store
+from plebchat_pipeline import history_hash
+
+
+GRAPH = "echobot"
+CHAT = "chat-1"
+TITLE = "### Task:\nGenerate a concise, 3-5 word title with an emoji summarizing the chat history.\n### Chat History:\n..."
+
+failures = []
+
+
+def check(name: str, ok: bool, detail: str = ""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+async def thread_row() -> tuple:
+    rows = await store._execute("SELECT history_hash, turns FROM thread_activity WHERE thread_id = ?", (f"{GRAPH}:{CHAT}",))
+    return tuple(rows[0]) if rows else None
+
+
+def last_priority() -> str:
+    trace = next(reversed(tracing.RECENT.values()), None)
+    return trace.root.attributes.get("priority", "") if trace else ""
+
+
+async def main() -> int:
+    history = [{"role": "user", "content": "hello"}]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        response = await client.post(f"/graph/{GRAPH}", json={"messages": history, "chat_id": CHAT})
+        before = await thread_row()
+        check("a chat turn is checkpointed", response.status_code == 200 and before is not None and before[0] is not None)
+
+        for task, fast_path in (
+            ("title_generation", True),  # fast path fails (no Ollama), runs the graph
+            ("title_generation", False),
+            ("tags_generation", False),
+            ("query_generation", True),  # no fast-path prompt for these at all
+            ("emoji_generation", True),
+            ("autocomplete_generation", True),
+        ):
+            settings.AUX_FAST_PATH = fast_path
+            tracing.RECENT.clear()
+            response = await client.post(f"/graph/{GRAPH}", json={
+                "messages": [{"role": "user", "content": TITLE}], "chat_id": CHAT, "task": task})
+            after = await thread_row()
+            label = f"{task}{'' if fast_path else ' (AUX_FAST_PATH off)'}"
+            unchanged = response.status_code == 200 and after == before
+            check(f"{label}: thread unchanged", unchanged, "" if unchanged else f"HTTP {response.status_code}, {before} -> {after}")
+            check(f"{label}: background priority", last_priority() == "background", last_priority() or "no run")
+
+        history += [{"role": "assistant", "content": "hello"}, {"role": "user", "content": "and again"}]
+        response = await client.post(f"/graph/{GRAPH}", json={
+            "messages": history[-1:], "chat_id": CHAT, "history_hash": history_hash(history[:-1])})
+        check("the next delta turn is accepted", response.status_code == 200, f"HTTP {response.status_code}")
+
+    await store.close()
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nall checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -21,11 +21,48 @@ DEFAULT_OLLAMA_MODEL = "llama3.1:8b"
 
 import json
 import uuid
+import hashlib
+import logging
 import requests
 from pydantic import BaseModel, Field
 from typing import List, Union, Generator, Iterator, Literal
 
 
+logger = logging.getLogger(__name__)
+
+
+class _lazy_json:
+    """Defers `json.dumps` until the log record is actually emitted."""
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, indent=2, default=repr)
+
+
+def configure_logging(debug: bool):
+    """The pipelines server doesn't configure logging for us - give our logger a handler and follow the DEBUG valve."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+
+
+#NOTE: This has to mirror `history_hash` in the server's src/checkpoints.py
+def history_hash(messages: List[dict]) -> str:
+    """Fingerprint of a chat history, so the server can tell whether its saved copy matches ours."""
+    h = hashlib.sha256()
+    for message in messages:
+        role = message.get("role", "")
+        content = "" if role == "assistant" else message.get("content", "")
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True)
+        h.update(f"{role}\x1f{content}\x1e".encode("utf-8"))
+    return h.hexdigest()
+
+
 def error_generator(e, server_url):
     """Generator function that yields error messages in the expected format.
     
@@ -52,6 +89,25 @@ def error_generator(e, server_url):
     yield f"Please check if the server at {server_url} is running."
 
 
+def busy_generator(retry_after):
+    """Generator function that tells the user the server turned the run away because it's at capacity.
+
+    Args:
+        retry_after: Seconds the server asked us to wait (the `Retry-After` header), if any
+    """
+    yield {
+        "event": {
+            "type": "status",
+            "data": {
+                "description": "⏳ Server is busy",
+                "done": True,
+            },
+        }
+    }
+    wait = f" in {retry_after} seconds" if retry_after else " in a moment"
+    yield f"Too many chats are running right now. Please try again{wait}."
+
+
 class Pipeline:
     class Valves(BaseModel):
         #TODO: how can we dynamically create a Literal type at runtime?  We can populate it with models Ollama has downloaded
@@ -75,20 +131,30 @@ class Pipeline:
         self.name = "PlebChat: "
         # self.name = "🗣️🤖💬 - "
         self.chat_id = None
+        # Set once the server says it doesn't keep chat histories (CHECKPOINT_DB="") - every request carries all of it then
+        self.checkpoints_off = False
 
         self.valves = self.Valves()
+        configure_logging(self.valves.DEBUG)
         self.set_pipelines()
         pass
 
     async def on_startup(self):
-        print(f"PIPE: on_startup: {__name__}")
+        logger.info("PIPE: on_startup: %s", __name__)
         pass
 
     async def on_shutdown(self):
-        print(f"PIPE: on_shutdown: {__name__}")
+        logger.info("PIPE: on_shutdown: %s", __name__)
         pass
 
     async def on_valves_updated(self):
+        configure_logging(self.valves.DEBUG)
+        self.checkpoints_off = False  # maybe a different server now
+        # The server caches LLM clients per model / keep_alive / URL - drop the ones built for the old valves
+        try:
+            requests.post(self.valves.PLEB_SERVER_URL + "/llms/invalidate", timeout=2)
+        except Exception as e:
+            logger.warning("Could not invalidate the server's LLM clients: %s", e)
         self.set_pipelines()
         pass
 
@@ -114,14 +180,22 @@ class Pipeline:
             # Update pipelines with models from server if available
             if server_models and isinstance(server_models, list):
                 self.pipelines = server_models
-                if self.valves.DEBUG:
-                    print(f"[DEBUG] Models loaded from server: {json.dumps(server_models, indent=2)}")
+                logger.debug("Models loaded from server: %s", _lazy_json(server_models))
         except Exception as e:
-            print(f"[WARNING] Failed to fetch models from server: {str(e)}")
-            print("[INFO] Using default models")
+            logger.warning("Failed to fetch models from server: %s", e)
+            logger.info("Using default models")
             raise
         pass
 
+    def _post_graph(self, model_id: str, data: dict, headers: dict):
+        return requests.post(
+            self.valves.PLEB_SERVER_URL + f"/graph/{model_id}",
+            json=data,
+            headers=headers,
+            stream=True,
+            timeout=10.0  # 5 seconds timeout for connection attempt
+        )
+
     def pipe(
         self, 
         user_message: str, 
@@ -138,20 +212,36 @@ class Pipeline:
         # print(user_message)
         # print("*"*30)
         # print(model_id)
-        print("*"*30)
-        print(body)
-        print("*"*30)
-        print("MESSAGES")
-        print(json.dumps(messages, indent=2))
-        print("*"*30)
+        # NOTE: only rendered when the DEBUG valve is on
+        logger.debug("body: %s", _lazy_json(body))
+        logger.debug("messages: %s", _lazy_json(messages))
 
         valve_config = self.valves.model_dump()
+        metadata = body.get("metadata") or {}
+        chat_id = body.get("chat_id") or metadata.get("chat_id")
+        # OUI's background prompts (title, tags, follow-ups, tool selection) name their task - the server answers them directly
+        task = metadata.get("task")
+        user = body.get("user")
+        priority = metadata.get("priority")
+        if priority not in ("interactive", "background", "batch"):
+            priority = "background" if task else "interactive"
 
         data = {
             "query": user_message,  # Include the original user query
             "messages": messages,
-            "config": valve_config  # Include all valve settings as config
+            "config": valve_config,  # Include all valve settings as config
+            "chat_id": chat_id,
+            "task": task,
+            "stream": body.get("stream", True),
+            # Who's asking and how urgent it is - the server serves users fairly and answers ahead of background tasks
+            "user": {key: user.get(key) for key in ("id", "name", "role")} if user else None,
+            "priority": priority,
             }
+        is_tool_selection = bool(messages) and messages[0].get("role") == "system" and "Available Tools" in messages[0].get("content", "")
+        if chat_id and messages and not is_tool_selection and not task and not self.checkpoints_off:
+            # The server keeps this chat's history - send just the new message and a hash of what came before it
+            data["messages"] = messages[-1:]
+            data["history_hash"] = history_hash(messages[:-1])
 
         headers = {
             'accept': 'text/event-stream',
@@ -159,19 +249,28 @@ class Pipeline:
         }
 
         try:
-            #TODO: pass in valves as "config"
-            response = requests.post(
-                self.valves.PLEB_SERVER_URL + f"/graph/{model_id}",
-                json=data,
-                headers=headers,
-                stream=True,
-                timeout=10.0  # 5 seconds timeout for connection attempt
-            )
+            response = self._post_graph(model_id, data, headers)
+            if response.status_code == 409:
+                # The server's copy of the history differs (edited message, regenerated reply, ...) - send all of it
+                logger.debug("history mismatch for chat %s, resending the full history", chat_id)
+                if response.headers.get("X-Checkpoints") == "off":
+                    logger.info("the server doesn't checkpoint chats, sending full histories from now on")
+                    self.checkpoints_off = True
+                response.close()
+                data["messages"] = messages
+                data.pop("history_hash", None)
+                response = self._post_graph(model_id, data, headers)
+            if response.status_code == 429:
+                # The server's admission control turned us away - not a connection failure
+                return busy_generator(response.headers.get("Retry-After"))
             response.raise_for_status()
+            if response.headers.get("Content-Type", "").startswith("application/json"):
+                # A non-streaming answer (OUI's background prompts) - OUI wants just the text
+                return response.json()["choices"][0]["message"]["content"]
             return response.iter_lines()
 
 
         except Exception as e:
-            print(f"ERROR: pipeline connection failed: {str(e)}")
+            logger.error("pipeline connection failed: %s", e)
             # Return a generator that yields error messages
             return error_generator(e, self.valves.PLEB_SERVER_URL)
@@ -9,6 +9,7 @@ from langchain_ollama import ChatOllama
 
 from langgraph.types import StreamWriter
 
+import http_client
 from ..config import Config
 from ..common import write_content, write_thought
 from .state import State, SYSTEM_PROMPT
@@ -32,7 +33,7 @@ def get_llm(config: RunnableConfig):
     )
 
 
-def perform_web_search(query: str, searxng_url: str) -> tuple:
+async def perform_web_search(query: str, searxng_url: str) -> tuple:
     """
     Perform a web search using SearXNG.
     
@@ -44,8 +45,6 @@ def perform_web_search(query: str, searxng_url: str) -> tuple:
         tuple: (results, error_message) where results is a list of search results
                and error_message is an error message if any
     """
-    import requests
-    
     try:
         # Try with the exposed port if using the default container URL
         if searxng_url == "http://searxng:8080":
@@ -72,7 +71,7 @@ def perform_web_search(query: str, searxng_url: str) -> tuple:
         logger.info(f"Sending search request to {searxng_url}/search for query: {query}")
         
         # Make the request to SearXNG - try POST method as it's more reliable
-        response = requests.post(
+        response = await http_client.client().post(
             f"{searxng_url}/search", 
             data=params,
             headers=headers,
@@ -119,7 +118,7 @@ def perform_web_search(query: str, searxng_url: str) -> tuple:
 ############################################################################
 # NODES
 ############################################################################
-def search_web(state: State, config: RunnableConfig, writer: StreamWriter):
+async def search_web(state: State, config: RunnableConfig, writer: StreamWriter):
     """
     Node to perform web search.
     
@@ -143,7 +142,7 @@ def search_web(state: State, config: RunnableConfig, writer: StreamWriter):
     searxng_url = configurable.SEARXNG_URL or "http://searxng:8080"
     
     # Perform the web search
-    search_results, error = perform_web_search(query, searxng_url)
+    search_results, error = await perform_web_search(query, searxng_url)
     
     if error:
         writer(write_thought(f"⚠️ Search error: {error}"))
@@ -0,0 +1,140 @@
+"""Open WebUI's background prompts, answered without running a graph.
+
+Besides the user's message, OUI sends a handful of housekeeping prompts every
+turn - the chat title, tags, follow-up suggestions and the "Available Tools"
+tool-selection call.  Run through `fren` / `research` they went through the
+command check and the persona prompt, and took the big model's time while
+the user was waiting for their actual answer.
+
+`classify()` recognizes them - by the task OUI names in the request metadata
+when the pipeline forwards it, else by OUI's prompt templates - and `answer()`
+sends them straight to Ollama: one non-streaming call, with `AUX_MODEL` if
+set - constrained to JSON output for the kinds OUI parses as JSON (the title
+is plain text).
+"""
+
+import re
+import time
+import uuid
+import logging
+from typing import Optional
+
+import settings
+import metrics
+import http_client
+from ollama_pool import pool
+from dispatcher import dispatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+# OUI's `metadata.task` -> our kind
+TASKS = {
+    "title_generation": "title",
+    "tags_generation": "tags",
+    "follow_up_generation": "follow_ups",
+    "function_calling": "tool_selection",
+}
+
+# The kinds OUI parses the answer of as JSON - Ollama is held to JSON output for these
+JSON_KINDS = {"tags", "follow_ups", "tool_selection"}
+
+# OUI's default task templates, for requests that don't say which task they are
+_TEMPLATES = (
+    (re.compile(r"(?:generate|create) a concise,? 3-5 word title", re.IGNORECASE), "title"),
+    (re.compile(r"generate 1-3 broad tags", re.IGNORECASE), "tags"),
+    (re.compile(r"suggest 3-5 relevant follow-up questions", re.IGNORECASE), "follow_ups"),
+)
+
+REQUESTS = metrics.Counter(
+    "plebchat_aux_requests_total", "Auxiliary OUI requests answered on the fast path, by kind and result",
+    ("kind", "model", "result"))
+SECONDS = metrics.Histogram(
+    "plebchat_aux_seconds", "Time to answer an auxiliary request on the fast path", ("kind",),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+TOKENS = metrics.Counter(
+    "plebchat_aux_tokens_total", "Tokens processed for auxiliary requests, by model and prompt / output", ("model", "type"))
+OFFLOADED = metrics.Counter(
+    "plebchat_aux_offloaded_tokens_total", "Tokens of auxiliary requests that the chat's own model didn't have to process",
+    ("main_model",))
+
+
+def classify(messages: list[dict], task: Optional[str] = None) -> Optional[str]:
+    """"title", "tags", "follow_ups" or "tool_selection" for OUI's background prompts, None for a chat turn."""
+    if task:
+        return TASKS.get(task)
+    if not messages:
+        return None
+    first = messages[0]
+    if len(messages) >= 2 and first.get("role") == "system" and "Available Tools" in (first.get("content") or ""):
+        return "tool_selection"
+    content = messages[-1].get("content")
+    if not isinstance(content, str) or "### Task" not in content[:200]:
+        return None
+    for pattern, kind in _TEMPLATES:
+        if pattern.search(content, 0, 600):
+            return kind
+    return None
+
+
+async def answer(kind: str, messages: list[dict], configurable: dict) -> dict:
+    """Ollama's answer to an auxiliary prompt: {"model", "content", "prompt_tokens", "output_tokens"}."""
+    main_model = configurable["LLM_MODEL"]
+    model = settings.AUX_MODEL or main_model
+    base_url = pool.pick(model) if pool.enabled else configurable["OLLAMA_BASE_URL"]
+    payload = {
+        "model": model,
+        "messages": [{"role": m.get("role", "user"), "content": m.get("content", "")} for m in messages],
+        "stream": False,
+        "keep_alive": configurable.get("KEEP_ALIVE", "5m"),
+        "options": {"num_predict": settings.AUX_MAX_TOKENS},
+    }
+    if kind in JSON_KINDS:
+        payload["format"] = "json"
+    started = time.monotonic()
+    try:
+        with pool.track(base_url, model):
+            async with dispatcher.slot(base_url, configurable.get("priority", "background"), configurable.get("user")):
+                response = await http_client.client().post(f"{base_url.rstrip('/')}/api/chat", json=payload, timeout=settings.AUX_TIMEOUT)
+                response.raise_for_status()
+                body = response.json()
+    except Exception:
+        REQUESTS.inc(kind, model, "error")
+        raise
+
+    REQUESTS.inc(kind, model, "ok")
+    SECONDS.observe(time.monotonic() - started, kind)
+    prompt_tokens, output_tokens = body.get("prompt_eval_count", 0), body.get("eval_count", 0)
+    TOKENS.inc(model, "prompt", amount=prompt_tokens)
+    TOKENS.inc(model, "output", amount=output_tokens)
+    if model != main_model:
+        OFFLOADED.inc(main_model, amount=prompt_tokens + output_tokens)
+    logger.info("auxiliary request answered", extra={
+        "kind": kind, "model": model, "seconds": round(time.monotonic() - started, 2), "output_tokens": output_tokens})
+    return {
+        "model": model,
+        "content": body.get("message", {}).get("content", ""),
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+    }
+
+
+def completion(result: dict) -> dict:
+    """`answer()`'s result as an OpenAI chat completion (the non-streaming response)."""
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": result["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": result["content"]},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": result["prompt_tokens"],
+            "completion_tokens": result["output_tokens"],
+            "total_tokens": result["prompt_tokens"] + result["output_tokens"],
+        },
+    }
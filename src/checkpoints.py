@@ -0,0 +1,205 @@
+"""Server-side conversation state, keyed by Open WebUI's chat_id.
+
+Instead of POSTing a chat's whole history every turn, the pipeline sends only
+the new message plus a hash of the history it already has:
+
+    {"messages": [<new user message>], "chat_id": "...", "history_hash": "..."}
+
+The graph runs with a LangGraph SQLite checkpointer (thread = graph id + chat
+id), so the earlier turns come from disk.  If the hash doesn't match what the
+server stored after the previous turn - a message was edited, a reply
+regenerated, the thread was pruned, or the last run failed - the request is
+refused with a 409 and the pipeline resends the full history (no
+`history_hash`), which replaces the thread.
+
+Threads that haven't been used for `CHECKPOINT_MAX_AGE_DAYS` are deleted, and
+the least recently used ones go first when the database grows past
+`CHECKPOINT_MAX_MB`.
+
+Off unless `CHECKPOINT_DB` names the database file (docker-compose.yaml sets it).
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+import settings
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+#NOTE: This has to mirror `history_hash` inside plebchat_pipeline.py
+def history_hash(messages: list[dict]) -> str:
+    """Fingerprint of a chat history: every message's role, and the content of everything but assistant replies.
+
+    Assistant content is left out because what Open WebUI keeps for a reply
+    (with status lines, reasoning blocks, ...) isn't exactly what the graph
+    saved - a regenerated reply still changes the history's shape.
+    """
+    h = hashlib.sha256()
+    for message in messages:
+        role = message.get("role", "")
+        content = "" if role == "assistant" else message.get("content", "")
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True)
+        h.update(f"{role}\x1f{content}\x1e".encode("utf-8"))
+    return h.hexdigest()
+
+
+EMPTY_HISTORY = history_hash([])
+
+
+TURNS = metrics.Counter("plebchat_chat_turns_total", "Graph runs by how the history arrived (delta / full / stateless)", ("graph", "mode"))
+HISTORY_MISMATCHES = metrics.Counter("plebchat_history_mismatches_total", "Delta requests refused because the history hash didn't match", ("graph",))
+PRUNED_THREADS = metrics.Counter("plebchat_checkpoint_threads_pruned_total", "Checkpointed chats deleted by age or size", ("reason",))
+
+
+class CheckpointStore:
+    def __init__(self, path: str, max_age_days: float, max_mb: float):
+        """
+        Args:
+            path: SQLite database file ("" = checkpointing off, every request must carry the full history)
+            max_age_days: Delete threads that haven't had a turn in this long
+            max_mb: Delete the least recently used threads while the database is bigger than this
+        """
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_mb * 1024 * 1024
+        self._saver = None
+        self._opening = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    async def saver(self):
+        """The LangGraph checkpointer (opened on first use - it imports langgraph)."""
+        async with self._opening:
+            if self._saver is None:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+                from graphs.messages import MessageLogSerializer
+
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                conn = await aiosqlite.connect(self.path)
+                saver = AsyncSqliteSaver(conn, serde=MessageLogSerializer())
+                await saver.setup()
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS thread_activity (
+                        thread_id TEXT PRIMARY KEY,
+                        history_hash TEXT,
+                        turns INTEGER NOT NULL DEFAULT 0,
+                        updated_at REAL NOT NULL
+                    )""")
+                await conn.commit()
+                self._saver = saver
+                logger.info("checkpoints opened", extra={"path": self.path})
+        return self._saver
+
+    async def _execute(self, sql: str, params: tuple = ()) -> list:
+        saver = await self.saver()
+        # Share the checkpointer's lock - it's one connection, and it commits mid-run
+        async with saver.lock:
+            cursor = await saver.conn.execute(sql, params)
+            rows = await cursor.fetchall()
+            await saver.conn.commit()
+        return rows
+
+    ##############################################################
+    async def expected_hash(self, thread_id: str) -> Optional[str]:
+        """The hash a delta request for this thread has to send.
+
+        EMPTY_HISTORY for a thread that isn't stored (a new chat's first turn),
+        None while a turn is running or after one failed - only a full history will do then.
+        """
+        rows = await self._execute("SELECT history_hash FROM thread_activity WHERE thread_id = ?", (thread_id,))
+        return rows[0][0] if rows else EMPTY_HISTORY
+
+    async def reset(self, thread_id: str):
+        """Forget a thread - the next run starts it over from the full history it's given."""
+        saver = await self.saver()
+        await saver.adelete_thread(thread_id)
+        await self._execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+
+    async def begin_turn(self, thread_id: str):
+        # Until the turn completes, the stored history can't be trusted
+        await self._execute("""
+            INSERT INTO thread_activity (thread_id, history_hash, updated_at) VALUES (?, NULL, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET history_hash = NULL, updated_at = excluded.updated_at
+            """, (thread_id, time.time()))
+
+    async def finish_turn(self, thread_id: str, messages: list[dict]):
+        """Store the hash of the thread's history after a completed turn and drop its older checkpoints."""
+        await self._execute(
+            "UPDATE thread_activity SET history_hash = ?, turns = turns + 1, updated_at = ? WHERE thread_id = ?",
+            (history_hash(messages), time.time(), thread_id))
+        # Every checkpoint holds the whole history - only the latest is ever read
+        await self._execute("""
+            DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id <
+                (SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?)""", (thread_id, thread_id))
+        await self._execute("""
+            DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN
+                (SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)""", (thread_id, thread_id))
+
+    ##############################################################
+    async def _delete_threads(self, thread_ids: list[str]):
+        saver = await self.saver()
+        for thread_id in thread_ids:
+            await saver.adelete_thread(thread_id)
+            await self._execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+
+    async def prune(self) -> int:
+        """Delete threads past their age, then the least recently used ones while over the size cap.  Returns how many went."""
+        stale = await self._execute(
+            "SELECT thread_id FROM thread_activity WHERE updated_at < ?", (time.time() - self.max_age,))
+        # Checkpoints without any activity record (e.g. from before it was tracked) count as stale too
+        stale += await self._execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id NOT IN (SELECT thread_id FROM thread_activity)")
+        await self._delete_threads([row[0] for row in stale])
+        PRUNED_THREADS.inc("age", amount=len(stale))
+
+        sizes = await self._execute("""
+            SELECT a.thread_id, COALESCE(SUM(LENGTH(c.checkpoint) + LENGTH(c.metadata)), 0)
+            FROM thread_activity a LEFT JOIN checkpoints c ON c.thread_id = a.thread_id
+            GROUP BY a.thread_id ORDER BY a.updated_at""")
+        total = sum(size for _, size in sizes)
+        oversize = []
+        for thread_id, size in sizes:
+            if total <= self.max_bytes:
+                break
+            oversize.append(thread_id)
+            total -= size
+        await self._delete_threads(oversize)
+        PRUNED_THREADS.inc("size", amount=len(oversize))
+
+        deleted = len(stale) + len(oversize)
+        if deleted:
+            await self._execute("VACUUM")
+            logger.info("checkpoints pruned", extra={"by_age": len(stale), "by_size": len(oversize)})
+        return deleted
+
+    async def prune_forever(self, interval: float):
+        while True:
+            try:
+                await self.prune()
+            except Exception:
+                logger.exception("checkpoint pruning failed")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        if self._saver is not None:
+            await self._saver.conn.close()
+            self._saver = None
+
+
+store = CheckpointStore(
+    path=settings.CHECKPOINT_DB,
+    max_age_days=settings.CHECKPOINT_MAX_AGE_DAYS,
+    max_mb=settings.CHECKPOINT_MAX_MB,
+)
@@ -0,0 +1,248 @@
+"""Priority dispatch of LLM calls: a user's visible answer goes ahead of background work.
+
+Every LLM call the graphs (and the auxiliary fast path) make asks for one of
+an Ollama host's `LLM_SLOTS` first - set it to the host's OLLAMA_NUM_PARALLEL
+so calls wait here, where their priority counts, rather than in Ollama's own
+FIFO queue.  Each call has a class and a user:
+
+- interactive: the reply someone is watching stream in (the default)
+- background:  OUI's title / tags / follow-up / tool-selection prompts
+- batch:       bulk work that can wait for idle time
+
+Free slots are handed out by weighted fair queuing, two levels deep: classes
+share the host by `LLM_PRIORITY_WEIGHTS` (with 8/2/1 an interactive call is
+served 4x as often as a background one while both are waiting), and within
+a class every user gets an equal share, so one user's burst can't push
+everyone else's calls back.  A class or user that was idle doesn't bank
+credit for it.  Any call that has waited `LLM_MAX_WAIT` seconds goes next
+regardless, so background and batch work never starve outright.
+
+    async with dispatcher.slot(base_url, priority, user):
+        ... stream from Ollama ...
+
+With `LLM_SLOTS=0` (the default) calls go straight through.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import settings
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+CLASSES = ("interactive", "background", "batch")
+
+WAIT_SECONDS = metrics.Histogram(
+    "plebchat_dispatch_wait_seconds", "Time an LLM call waited for a slot, by priority class", ("priority",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+DISPATCHED = metrics.Counter(
+    "plebchat_dispatch_calls_total", "LLM calls given a slot, by priority class and whether they had to wait",
+    ("priority", "waited"))
+PROMOTED = metrics.Counter(
+    "plebchat_dispatch_starvation_promotions_total", "Calls served out of turn after waiting LLM_MAX_WAIT", ("priority",))
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """"interactive=8,background=2,batch=1" -> weights; classes left out keep the defaults."""
+    weights = {"interactive": 8.0, "background": 2.0, "batch": 1.0}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() in weights and value.strip():
+            weights[name.strip()] = max(float(value), 0.001)
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("priority", "user", "arrived", "granted")
+
+    def __init__(self, priority: str, user: str):
+        self.priority = priority
+        self.user = user
+        self.arrived = time.monotonic()
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class _Class:
+    """One priority class's waiting calls: a FIFO per user, and the users' fair-queuing tags."""
+    __slots__ = ("weight", "finish", "vtime", "users", "user_finish")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0  # class level: virtual finish time of its last served call
+        self.vtime = 0.0  # user level: virtual time within the class
+        self.users: dict[str, deque] = {}
+        self.user_finish: dict[str, float] = {}
+
+
+class HostQueue:
+    """The slots of one Ollama host, and the calls waiting for them."""
+
+    def __init__(self, slots: int, weights: dict[str, float], max_wait: float):
+        self.slots = slots
+        self.max_wait = max_wait
+        self.busy = 0
+        self.vtime = 0.0
+        self.classes = {name: _Class(weights[name]) for name in CLASSES}
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for c in self.classes.values() for q in c.users.values())
+
+    def waiting_in(self, priority: str) -> int:
+        return sum(len(q) for q in self.classes[priority].users.values())
+
+    def _enqueue(self, waiter: _Waiter):
+        self.classes[waiter.priority].users.setdefault(waiter.user, deque()).append(waiter)
+
+    def _remove(self, waiter: _Waiter):
+        users = self.classes[waiter.priority].users
+        queue = users.get(waiter.user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del users[waiter.user]
+
+    def _next(self) -> Optional[_Waiter]:
+        """Pick (and dequeue) the call to serve next, advancing the fair-queuing clocks."""
+        backlogged = [(name, c) for name, c in self.classes.items() if c.users]
+        if not backlogged:
+            return None
+
+        # Starvation protection: the longest waiting call goes first once it's waited too long
+        oldest = min((q[0] for _, c in backlogged for q in c.users.values()), key=lambda w: w.arrived)
+        promoted = time.monotonic() - oldest.arrived >= self.max_wait
+        if promoted:
+            PROMOTED.inc(oldest.priority)
+            klass, user = self.classes[oldest.priority], oldest.user
+        else:
+            # Class with the smallest start tag, then the user within it with the smallest start tag
+            _, klass = min(backlogged, key=lambda item: max(self.vtime, item[1].finish))
+            user = min(klass.users, key=lambda u: max(klass.vtime, klass.user_finish.get(u, 0.0)))
+
+        # The call is charged to its class and user either way; only an in-turn pick moves the clocks
+        start = max(self.vtime, klass.finish)
+        klass.finish = start + 1 / klass.weight
+        user_start = max(klass.vtime, klass.user_finish.get(user, 0.0))
+        klass.user_finish[user] = user_start + 1
+        if not promoted:
+            self.vtime = start
+            klass.vtime = user_start
+        if len(klass.user_finish) > 4096:
+            # Users without waiting calls are behind the class clock anyway - their tags don't matter
+            klass.user_finish = {u: f for u, f in klass.user_finish.items() if u in klass.users}
+
+        queue = klass.users[user]
+        waiter = queue.popleft()
+        if not queue:
+            del klass.users[user]
+        return waiter
+
+    def _dispatch(self):
+        while self.busy < self.slots:
+            waiter = self._next()
+            if waiter is None:
+                return
+            if waiter.granted.done():
+                continue  # cancelled, the caller just hasn't woken up to leave the queue yet
+            self.busy += 1
+            waiter.granted.set_result(None)
+
+    async def acquire(self, priority: str, user: str):
+        if self.busy < self.slots and not self.waiting:
+            self.busy += 1
+            DISPATCHED.inc(priority, "no")
+            WAIT_SECONDS.observe(0, priority)
+            return
+
+        waiter = _Waiter(priority, user)
+        self._enqueue(waiter)
+        self._dispatch()
+        try:
+            await waiter.granted
+        except asyncio.CancelledError:
+            if waiter.granted.done() and not waiter.granted.cancelled():
+                self.release()  # granted in the same instant the caller went away
+            else:
+                self._remove(waiter)
+            raise
+        DISPATCHED.inc(priority, "yes")
+        WAIT_SECONDS.observe(time.monotonic() - waiter.arrived, priority)
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free and nobody is waiting for it, without queueing."""
+        if self.busy < self.slots and not self.waiting:
+            self.busy += 1
+            return True
+        return False
+
+    def release(self):
+        self.busy -= 1
+        self._dispatch()
+
+
+class Dispatcher:
+    def __init__(self, slots: int, weights: dict[str, float], max_wait: float):
+        """
+        Args:
+            slots: LLM calls allowed at once per Ollama host (0 = no dispatching, calls go straight through)
+            weights: Share of a host's slots for each priority class while they're all waiting
+            max_wait: Seconds after which a waiting call is served next whatever its class
+        """
+        self.slots = slots
+        self.weights = weights
+        self.max_wait = max_wait
+        self.hosts: dict[str, HostQueue] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.slots > 0
+
+    @asynccontextmanager
+    async def slot(self, host: str, priority: Optional[str] = None, user: Optional[str] = None):
+        """Hold one of `host`'s slots for the block, waiting for it in priority order."""
+        if not self.enabled:
+            yield
+            return
+        priority = priority if priority in CLASSES else "interactive"
+        queue = self._queue(host)
+        await queue.acquire(priority, user or "")
+        try:
+            yield
+        finally:
+            queue.release()
+
+    def _queue(self, host: str) -> HostQueue:
+        host = host.rstrip("/")
+        queue = self.hosts.get(host)
+        if queue is None:
+            queue = self.hosts[host] = HostQueue(self.slots, self.weights, self.max_wait)
+        return queue
+
+    def try_acquire(self, host: str) -> bool:
+        """Take one of `host`'s slots only if one is free right now - `release()` it when done.
+
+        For extra work that isn't worth waiting for (a hedge's backup request).
+        """
+        return not self.enabled or self._queue(host).try_acquire()
+
+    def release(self, host: str):
+        """Give back a slot `try_acquire()` took."""
+        if self.enabled:
+            self._queue(host).release()
+
+
+dispatcher = Dispatcher(
+    slots=settings.LLM_SLOTS,
+    weights=parse_weights(settings.LLM_PRIORITY_WEIGHTS),
+    max_wait=settings.LLM_MAX_WAIT,
+)
+
+metrics.Gauge("plebchat_dispatch_waiting_calls", "LLM calls waiting for a slot, by priority class", ("priority",),
+              callback=lambda: {(p,): sum(q.waiting_in(p) for q in dispatcher.hosts.values()) for p in CLASSES})
@@ -0,0 +1,59 @@
+"""SSE frame encoder for the OpenAI-style chunks Open WebUI expects.
+
+Every frame we send has the same fixed JSON structure around one piece of
+text, so the structure is rendered once into a prefix and a suffix and only
+the text is JSON-escaped per frame.  The output is byte-for-byte what
+`f"data: {json.dumps(obj)}\\n\\n"` produced for the equivalent dict.
+"""
+
+# The same string escaper `json.dumps` uses (the C accelerated one when the
+# interpreter has it, the pure-Python fallback otherwise).  Third-party
+# backends like orjson are deliberately not used: they emit raw UTF-8 and no
+# separator spaces, so their frames wouldn't be byte-identical.
+from json.encoder import encode_basestring_ascii as _escape
+
+
+_CONTENT_PREFIX = 'data: {"choices": [{"delta": {"content": '
+_REASONING_PREFIX = 'data: {"choices": [{"delta": {"reasoning_content": '
+_DELTA_SUFFIX = '}, "finish_reason": null}]}\n\n'
+
+_STATUS_PREFIX = 'data: {"event": {"type": "status", "data": {"description": '
+_STATUS_SUFFIX_DONE = ', "done": true}}}\n\n'
+_STATUS_SUFFIX_NOT_DONE = ', "done": false}}}\n\n'
+
+
+def _finish_frame(finish_reason) -> str:
+    reason = "null" if finish_reason is None else _escape(finish_reason)
+    return 'data: {"choices": [{"delta": {}, "finish_reason": ' + reason + '}]}\n\n'
+
+
+############################################################################
+# FRAMES
+############################################################################
+def content_frame(text: str) -> str:
+    """A frame of answer text."""
+    return _CONTENT_PREFIX + _escape(text) + _DELTA_SUFFIX
+
+
+def thinking_frame(text: str) -> str:
+    """A frame of reasoning ("thought") text."""
+    return _REASONING_PREFIX + _escape(text) + _DELTA_SUFFIX
+
+
+def emit_event(description: str, done: bool) -> str:
+    """A status event frame (the little status line above the message in Open WebUI)."""
+    return _STATUS_PREFIX + _escape(description) + (_STATUS_SUFFIX_DONE if done else _STATUS_SUFFIX_NOT_DONE)
+
+
+def is_delta_frame(frame: str) -> bool:
+    """Whether `frame` carries answer or reasoning text (as opposed to a status event or the stream's start / end)."""
+    return frame.startswith(_CONTENT_PREFIX) or frame.startswith(_REASONING_PREFIX)
+
+
+NEWLINES_FRAME = content_frame("\n\n")
+THINKING_NEWLINE_FRAME = thinking_frame("\n")
+
+# Empty delta that opens the stream, and the two ways of closing it
+STREAM_START_FRAME = _finish_frame(None)
+STREAM_STOP_FRAME = _finish_frame("stop")
+STREAM_ERROR_FRAME = _finish_frame("error")
@@ -1,17 +1,114 @@
-from graphs.fren import graph as fren_graph
-from graphs.echobot import graph as echobot_graph
-from graphs.research import graph as research_graph
+"""The graphs the server can run.
 
+Graphs are listed as lightweight descriptors so `/graphs` (and server start-up)
+never imports langgraph / langchain_ollama.  A graph's module is imported and
+compiled the first time it's asked for - or ahead of time by `warm_up()`.
 
-all_graphs = [
-    {"id": "fren", "name": "🐸"},
-    {"id": "echobot", "name": "EchoBot"},
-    {"id": "research", "name": "🔍 Research"}
+    agent = await graph_registry.load("fren")
+"""
+
+import time
+import asyncio
+import logging
+import importlib
+from dataclasses import dataclass
+from typing import Optional
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GraphDescriptor:
+    id: str
+    name: str
+    module: str  # module with a compiled `graph` (and the `graph_builder` it was compiled from)
+
+
+GRAPHS = [
+    GraphDescriptor("fren", "🐸", "graphs.fren.graph"),
+    GraphDescriptor("echobot", "EchoBot", "graphs.echobot.graph"),
+    GraphDescriptor("research", "🔍 Research", "graphs.research.graph"),
 ]
 
-# Dictionary to easily access graphs by ID
-graph_registry = {
-    "fren": fren_graph,
-    "echobot": echobot_graph,
-    "research": research_graph
-}
+all_graphs = [{"id": d.id, "name": d.name} for d in GRAPHS]
+
+
+GRAPH_LOAD_SECONDS = metrics.Gauge(
+    "plebchat_graph_load_seconds", "Time it took to import and compile a graph", ("graph",))
+
+
+class GraphRegistry:
+    """Maps graph ids to compiled graphs, importing each one on first use."""
+
+    def __init__(self, descriptors: list[GraphDescriptor]):
+        self.descriptors = {d.id: d for d in descriptors}
+        self._compiled: dict[str, object] = {}
+        self._checkpointed: dict[str, object] = {}
+        self._loading: dict[str, asyncio.Task] = {}
+        self.failed: dict[str, str] = {}  # graph id -> why its import failed (retried on its next request)
+
+    def __contains__(self, graph_id: str) -> bool:
+        return graph_id in self.descriptors
+
+    def __iter__(self):
+        return iter(self.descriptors)
+
+    def is_loaded(self, graph_id: str) -> bool:
+        return graph_id in self._compiled
+
+    def __getitem__(self, graph_id: str):
+        """The compiled graph, importing its module now if needed (blocking - prefer `load()` on the event loop)."""
+        graph = self._compiled.get(graph_id)
+        if graph is not None:
+            return graph
+
+        descriptor = self.descriptors[graph_id]
+        started = time.perf_counter()
+        try:
+            graph = importlib.import_module(descriptor.module).graph
+        except Exception as e:
+            self.failed[graph_id] = f"{type(e).__name__}: {e}"
+            raise
+        elapsed = time.perf_counter() - started
+
+        self._compiled[graph_id] = graph
+        self.failed.pop(graph_id, None)
+        GRAPH_LOAD_SECONDS.set(elapsed, graph_id)
+        logger.info("graph loaded", extra={"graph": graph_id, "ms": round(elapsed * 1000)})
+        return graph
+
+    async def load(self, graph_id: str):
+        """The compiled graph, importing it on a worker thread so the event loop keeps serving other streams."""
+        graph = self._compiled.get(graph_id)
+        if graph is not None:
+            return graph
+
+        # A request and the warm-up asking at the same time share one import
+        task = self._loading.get(graph_id)
+        if task is None:
+            task = self._loading[graph_id] = asyncio.create_task(asyncio.to_thread(self.__getitem__, graph_id))
+            task.add_done_callback(lambda _: self._loading.pop(graph_id, None))
+        return await asyncio.shield(task)
+
+    async def load_checkpointed(self, graph_id: str, checkpointer):
+        """The graph compiled with `checkpointer`, so runs with a `thread_id` pick up the saved conversation."""
+        graph = self._checkpointed.get(graph_id)
+        if graph is None:
+            await self.load(graph_id)
+            builder = importlib.import_module(self.descriptors[graph_id].module).graph_builder
+            graph = self._checkpointed[graph_id] = builder.compile(checkpointer=checkpointer)
+        return graph
+
+    async def warm_up(self, graph_ids: Optional[list[str]] = None):
+        """Import and compile graphs ahead of their first request (all of them by default)."""
+        for graph_id in graph_ids or list(self.descriptors):
+            try:
+                await self.load(graph_id)
+            except Exception:
+                logger.exception("graph failed to load", extra={"graph": graph_id})
+
+
+graph_registry = GraphRegistry(GRAPHS)
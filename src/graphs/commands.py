@@ -1,3 +1,15 @@
+import asyncio
+import inspect
+import logging
+
+import httpx
+
+import tracing
+import http_client
+
+logger = logging.getLogger(__name__)
+
+
 class CommandOutput:
     def __init__(self,
             cmdOutput: str,
@@ -18,11 +30,63 @@ class CommandOutput:
 
 
 
+MAX_REDIRECTS = 5
+
+
+async def _get_https(url: str) -> httpx.Response:
+    """GET `url`, following redirects by hand - every hop has to be https:// too, like the URL the user gave."""
+    client = http_client.client()
+    for _ in range(MAX_REDIRECTS + 1):
+        response = await client.get(url, timeout=10)
+        if not response.is_redirect:
+            return response
+        url = str(response.url.join(response.headers["location"]))
+        if not url.startswith("https://"):
+            raise httpx.UnsupportedProtocol(f"Redirected to a non-https URL: {url}")
+    raise httpx.TooManyRedirects(f"More than {MAX_REDIRECTS} redirects")
+
+
+def _html_to_markdown(response: httpx.Response) -> tuple[str, str]:
+    """The page's title and its main content (per readability) as markdown."""
+    from readability import Document
+    import html2text
+
+    # Decode the content - handle encoding issues
+    try:
+        # Try to get the encoding from the response
+        content = response.content.decode(response.encoding or 'utf-8')
+    except UnicodeDecodeError:
+        # Fallback to latin-1 which rarely fails
+        content = response.content.decode('latin-1')
+
+    # Parse the content with readability
+    with tracing.span("readability", bytes=len(content)) as parse:
+        doc = Document(content)
+        title = doc.title()
+        summary = doc.summary()
+        parse.set(summary_bytes=len(summary))
+
+    # Convert HTML to markdown
+    with tracing.span("html2text", bytes=len(summary)) as convert:
+        h = html2text.HTML2Text()
+        h.ignore_links = False
+        h.ignore_images = False
+        h.body_width = 0  # No wrapping
+        markdown_content = h.handle(summary)
+        convert.set(markdown_bytes=len(markdown_content))
+
+    return title, markdown_content
+
+
+
 class CommandHandler:
     @classmethod
-    def _run(cls, command: str, arguments: list[str]):
+    async def _run(cls, command: str, arguments: list[str]):
         """Handle a command and its arguments.
 
+        Commands can be plain or `async` classmethods - anything doing I/O
+        (like `/url`) should be async so it doesn't block the event loop.
+
         Args:
             command: The command name without the leading slash
             arguments: String arguments for the command
@@ -33,7 +97,10 @@ class CommandHandler:
         # commands starting in '_' can't be called (like this one, '_run()')
         if callable(method) and not command.startswith('_'):
             # If method exists and is callable, invoke it
-            return method(arguments)
+            result = method(arguments)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
         else:
             # Get the help command output
             help_output = cls.help()
@@ -115,17 +182,13 @@ For detailed help on a specific command, type `/help command_name`
 
 ####################################################################################
     @classmethod
-    def url(cls, args: list[str] = None):
+    async def url(cls, args: list[str] = None):
         """Extract and display the main content from a website URL.
 
         Usage: /url https://example.com
         Scrapes the content from the provided URL and displays it in the chat.
         This allows you to discuss, summarize, or analyze web content directly.
         """
-        import requests
-        from readability import Document
-        import html2text
-
         # Check if URL was provided
         if not args or len(args) == 0:
             error_msg = "⚠️ Please provide a URL.\n\n**Example:**\n```\n/url https://example.com\n```"
@@ -145,29 +208,14 @@ For detailed help on a specific command, type `/help command_name`
 
         try:
             # Fetch the webpage content
-            print(f"Fetching content from: {url}")
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            
-            # Decode the content - handle encoding issues
-            try:
-                # Try to get the encoding from the response
-                content = response.content.decode(response.encoding or 'utf-8')
-            except UnicodeDecodeError:
-                # Fallback to latin-1 which rarely fails
-                content = response.content.decode('latin-1')
-
-            # Parse the content with readability
-            doc = Document(content)
-            title = doc.title()
-            summary = doc.summary()
-
-            # Convert HTML to markdown
-            h = html2text.HTML2Text()
-            h.ignore_links = False
-            h.ignore_images = False
-            h.body_width = 0  # No wrapping
-            markdown_content = h.handle(summary)
+            logger.info("fetching content from: %s", url)
+            with tracing.span("http GET", url=url) as fetch:
+                response = await _get_https(url)
+                fetch.set(status=response.status_code, bytes=len(response.content))
+                response.raise_for_status()  # Raise exception for 4XX/5XX responses
+
+            # Parsing a big page takes a while - do it on a worker thread
+            title, markdown_content = await asyncio.to_thread(_html_to_markdown, response)
 
             # Prepare the output
             result = f"# {title}\n\n"
@@ -181,7 +229,7 @@ For detailed help on a specific command, type `/help command_name`
 
             return CommandOutput(cmdOutput=result)
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             error_msg = f"⚠️ Error fetching the URL: {str(e)}"
             return CommandOutput(cmdOutput=error_msg)
         except Exception as e:
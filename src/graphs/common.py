@@ -1,5 +1,11 @@
+import time
+import inspect
+import functools
 from enum import Enum
 
+import metrics
+import tracing
+
 # OLLAMA_HOST = "http://host.docker.internal:11434"
 
 # class KeepAlive(str, Enum):
@@ -32,3 +38,54 @@ def write_content(content: str):
         'type': 'content',
         'content': content
     }
+
+
+def preview(text: str, limit: int) -> str:
+    """`text` cut to `limit` characters (0 = no limit), noting how much was left out."""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}\n\n*... {len(text) - limit:,} more characters*"
+
+
+
+############################################################################
+# NODE INSTRUMENTATION
+############################################################################
+def _model_of(kwargs: dict) -> str:
+    config = kwargs.get("config") or {}
+    return (config.get("configurable") or {}).get("LLM_MODEL", "")
+
+
+def instrumented(graph_id: str, node_name: str, node):
+    """Wrap a graph node so its wall time and failures are recorded in the metrics (and as a trace span).
+
+    The wrapper keeps the node's signature (via `functools.wraps`) so LangGraph
+    still injects `config` / `writer` exactly as it would for the bare node.
+
+        graph_builder.add_node("ollama", instrumented("fren", "ollama", ollama))
+    """
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"node {node_name}", graph=graph_id, node=node_name):
+                    return await node(*args, **kwargs)
+            except Exception:
+                metrics.NODE_ERRORS.inc(graph_id, node_name, _model_of(kwargs))
+                raise
+            finally:
+                metrics.NODE_SECONDS.observe(time.perf_counter() - started, graph_id, node_name, _model_of(kwargs))
+    else:
+        @functools.wraps(node)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"node {node_name}", graph=graph_id, node=node_name):
+                    return node(*args, **kwargs)
+            except Exception:
+                metrics.NODE_ERRORS.inc(graph_id, node_name, _model_of(kwargs))
+                raise
+            finally:
+                metrics.NODE_SECONDS.observe(time.perf_counter() - started, graph_id, node_name, _model_of(kwargs))
+    return wrapper
@@ -1,13 +1,20 @@
 import os
-from typing import Optional, Any
+from typing import TYPE_CHECKING, Optional, Any
 from pydantic import BaseModel, Field
-from langchain_core.runnables import RunnableConfig
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
+
+
+# Key in `configurable` carrying the Config resolved once for the whole run (see `run_config`).
+# The leading "__" keeps LangGraph from copying it into checkpoint metadata.
+RESOLVED_KEY = "__plebchat_config"
 
 
 #NOTE: This has to mirror the Valve class inside plebchat_pipeline.py
 class Config(BaseModel):
     """The configurable fields for the graph."""
-    LLM_MODEL: str = Field(default="llama3.1:8")
+    LLM_MODEL: str = Field(default="llama3.1:8b")
     KEEP_ALIVE: str = Field(default="5m")
 
     DISABLE_COMMANDS: bool = Field(default=False)
@@ -17,16 +24,46 @@ class Config(BaseModel):
     DEBUG: bool = Field(default=False)
 
     ##############################################################
+    @classmethod
+    def resolve(cls, configurable: dict) -> "Config":
+        """Build a Config from per-chat values (the pipeline valves).
+
+        Precedence is the same for every field and every lookup: environment
+        (read once at start-up) > valve > field default.  Only a missing or
+        `None` value falls through - a valve set to `False` or `""` counts.
+        """
+        values: dict[str, Any] = {
+            name: configurable[name]
+            for name in cls.model_fields
+            if configurable.get(name) is not None
+        }
+        values.update(_ENV)
+        return cls(**values)
+
     @classmethod
     def from_runnable_config(
-        cls, config: Optional[RunnableConfig] = None
+        cls, config: Optional["RunnableConfig"] = None
     ) -> "Config":
-        """Create a Configuration instance from a RunnableConfig."""
+        """The run's Config - resolved once by the server, or resolved here when called outside of a server run."""
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
-        values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
-            for name in cls.model_fields.keys()
-        }
-        return cls(**{k: v for k, v in values.items() if v})
+        resolved = configurable.get(RESOLVED_KEY)
+        if resolved is not None:
+            return resolved
+        return cls.resolve(configurable)
+
+
+# Environment overrides, snapshotted at import so every lookup in the process agrees
+_ENV: dict[str, str] = {
+    name: os.environ[name.upper()]
+    for name in Config.model_fields
+    if os.environ.get(name.upper()) not in (None, "")
+}
+
+
+def run_config(configurable: dict) -> dict:
+    """The RunnableConfig for one graph run: the resolved values as configurables, plus the
+    Config itself so every node's `Config.from_runnable_config` returns it without re-resolving."""
+    config = Config.resolve(configurable)
+    return {"configurable": {**configurable, **config.model_dump(), RESOLVED_KEY: config}}
@@ -0,0 +1,95 @@
+"""Token accounting for the prompts sent to Ollama.
+
+Ollama silently drops the oldest part of a prompt that doesn't fit its
+`num_ctx`, and until then every extra turn of history is paid for again in
+prefill on every reply.  Each model gets a budget (`CONTEXT_TOKENS`, or its
+entry in `CONTEXT_TOKENS_BY_MODEL`, less `CONTEXT_REPLY_TOKENS` kept free for
+the reply) and `fit` works out how much of a chat's recent history fits it.
+`graphs.prompts` builds the actual messages.
+
+Tokens are estimated locally - no tokenizer, no call to Ollama - and each
+message's count is cached by its content, so a turn only counts the messages
+that are new since the last one.
+"""
+
+import re
+from collections import OrderedDict
+
+import settings
+
+
+############################################################################
+# TOKEN ESTIMATE
+############################################################################
+# Roughly how BPE vocabularies split text: a word costs a token per ~4 characters,
+# every punctuation mark / symbol is a token of its own
+_PIECES = re.compile(r"\w{1,4}|[^\w\s]")
+# Chat template tokens around every message (role header, end-of-turn)
+MESSAGE_OVERHEAD = 4
+
+_counts: "OrderedDict[str, int]" = OrderedDict()
+_COUNT_CACHE_SIZE = 4096
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated token count of `text` - within ~15% of Llama / Qwen tokenizers on English prose and code."""
+    return len(_PIECES.findall(text))
+
+
+def message_tokens(message: dict) -> int:
+    """Estimated tokens of one chat message, template overhead included.  Cached by content."""
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = str(content)
+
+    count = _counts.get(content)
+    if count is None:
+        count = _counts[content] = estimate_tokens(content)
+        if len(_counts) > _COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    else:
+        _counts.move_to_end(content)
+    return count + MESSAGE_OVERHEAD
+
+
+############################################################################
+# BUDGET
+############################################################################
+def _parse_budgets(value: str) -> dict[str, int]:
+    budgets = {}
+    for entry in value.split(","):
+        model, _, tokens = entry.partition("=")
+        if model.strip() and tokens.strip():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+_BUDGETS = _parse_budgets(settings.CONTEXT_TOKENS_BY_MODEL)
+
+
+def context_budget(model: str) -> int:
+    """Prompt tokens allowed for `model`: its context size less the room kept for the reply."""
+    return _BUDGETS.get(model, settings.CONTEXT_TOKENS) - settings.CONTEXT_REPLY_TOKENS
+
+
+def fit(system: list[dict], history: list[dict], budget: float, extra: list[dict] = ()) -> tuple[int, int]:
+    """Where `history` has to start for system + history + extra to fit `budget`: (start index, tokens).
+
+    The latest history message always goes in, even on its own over budget, and
+    the kept history never opens with an assistant reply to a question that was cut.
+    """
+    tokens = sum(message_tokens(m) for m in system) + sum(message_tokens(m) for m in extra)
+
+    start = len(history)
+    while start > 0:
+        cost = message_tokens(history[start - 1])
+        if tokens + cost > budget and start < len(history):
+            break
+        tokens += cost
+        start -= 1
+
+    while start < len(history) - 1 and history[start].get("role") == "assistant":
+        tokens -= message_tokens(history[start])
+        start += 1
+
+    return start, tokens
@@ -1,7 +1,12 @@
+import logging
+
 from .VERSION import VERSION
 
 from ..commands import CommandHandler as BaseCommandHandler, CommandOutput
 
+logger = logging.getLogger(__name__)
+
+
 class CommandHandler(BaseCommandHandler):
     # This class inherits all methods from BaseCommandHandler
     # We only need to define methods that are specific to this graph or that override base methods
@@ -63,9 +68,7 @@ Or, just start asking questions!  I'm here to help.
         """
         import random
         
-        # Debug output
-        print("&"*30)
-        print(f"DEBUG random command received args: {args}")
+        logger.debug("random command received args: %s", args)
 
         # Handle None or empty list
         if args is None or not args:
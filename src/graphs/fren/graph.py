@@ -5,15 +5,15 @@
 from langgraph.graph.state import StateGraph
 
 from ..config import Config
-from ..common import NodeOutputType
+from ..common import NodeOutputType, instrumented
 from .state import State
 graph_builder = StateGraph(State, input=State, config_schema=Config)
 
 
 ## ADD ALL OUR NODES
 from .nodes import ollama, _check_for_command, handle_command
-graph_builder.add_node("ollama", ollama, metadata={"node_output_type": NodeOutputType.ANSWER})
-graph_builder.add_node("handle_command", handle_command)
+graph_builder.add_node("ollama", instrumented("fren", "ollama", ollama), metadata={"node_output_type": NodeOutputType.ANSWER})
+graph_builder.add_node("handle_command", instrumented("fren", "handle_command", handle_command))
 
 
 ## CONNECT ALL OUR NODES
@@ -1,14 +1,19 @@
-import json
+import logging
 
 from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import HumanMessage
-from langchain_ollama import ChatOllama
 
 from langgraph.types import StreamWriter
 
 from ..config import Config
+from ..llm import astream_chat, chat_ollama
+from .. import prompts
 from .state import State, SYSTEM_PROMPT
 from .commands import CommandHandler
+import settings
+from logs import lazy_json
+
+logger = logging.getLogger(__name__)
 
 # from ..common import OLLAMA_HOST
 
@@ -18,13 +23,9 @@ from .commands import CommandHandler
 def get_llm(config: RunnableConfig):
     configurable = Config.from_runnable_config(config)
 
-    print("@#$"*15)
-    print(configurable)
-    return ChatOllama(
-        model=configurable.LLM_MODEL,
-        keep_alive=configurable.KEEP_ALIVE,
-        base_url=configurable.OLLAMA_BASE_URL
-    )
+    logger.debug("llm config: %s", configurable)
+    # Both of fren's LLM calls are the reply the user is waiting on - worth hedging when a host is slow to start
+    return chat_ollama(configurable, prompts.chat_key(config), hedge=True)
 
 
 ############################################################################
@@ -42,12 +43,12 @@ def _check_for_command(state: State, config: RunnableConfig):
         return "handle_command"
     return "ollama"
 
-from ..common import write_content
+from ..common import write_content, write_thought, preview
 
 ############################################################################
 # NODE
 ############################################################################
-def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
+async def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
     # extract command
     query = state.messages[-1]['content']
     split = query.split(" ")
@@ -60,44 +61,39 @@ def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
         command = ""
 
     # Get command output
-    cmd_output = CommandHandler._run(command, arguments)
+    cmd_output = await CommandHandler._run(command, arguments)
 
     # Handle the command output based on its properties
     if cmd_output.returnDirect:
         # Return the output directly to the user
         writer(write_content(cmd_output.cmdOutput))
-        return
+        # ...and keep it in the history, like any other reply
+        return {"messages": [{"role": "assistant", "content": cmd_output.cmdOutput}]}
 
     else:
         # The output should be processed by an LLM before returning to the user
         writer(write_thought(f"Processing command output with LLM..."))
         writer(write_thought( '---' ))
         writer(write_thought( "### command output:" ))
-        writer(write_thought( cmd_output.cmdOutput ))
+        # Just a taste - a scraped page can be tens of thousands of characters, the model gets all of it
+        writer(write_thought( preview(cmd_output.cmdOutput, settings.COMMAND_PREVIEW_CHARS) ))
 
 
         # Create prompt for LLM
         prompt = cmd_output.reinjectionPrompt or "Process this information and provide a helpful response:"
 
-        # Get the LLM
-
-        # Prepare messages for the LLM
-        messages = [
-            {"role": "system", "content": cmd_output.reinjectionPrompt},
-            {"role": "user", "content": f"{prompt}\n\n{cmd_output.cmdOutput}"}
-        ]
-
+        # The chat so far (a prefix Ollama has cached), then the command output for this call only
         llm = get_llm(config)
-        response = llm.stream(state.messages)
+        messages = prompts.build(config, SYSTEM_PROMPT, state.messages, llm.model, extra=[
+            {"role": "user", "content": f"{prompt}\n\n{cmd_output.cmdOutput}"}
+        ]).messages
 
-        # Join all chunks into a single response
-        full_response = "".join(chunk.content for chunk in response)
+        # The tokens reach the client as they're generated (the "messages" stream mode), this only keeps the answer for the history
+        chunks = [chunk.content async for chunk in astream_chat(llm, messages, config)]
+        full_response = "".join(chunks)
 
-        # Add the assistant's response to the message history
+        # Return the new response - the reducer adds it to the message history
         assistant_message = {"role": "assistant", "content": full_response}
-        state.messages.append(assistant_message)
-
-        # Return the updated messages list with the new response
         return {"messages": [assistant_message]}
 
 
@@ -106,49 +102,37 @@ def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
 ############################################################################
 # NODE
 ############################################################################
-def ollama(state: State, config: RunnableConfig):
+async def ollama(state: State, config: RunnableConfig):
 
 
     # llm = get_llm(config)
     # configurable = Config.from_runnable_config(config)
 
     # If we have a new user query, add it to the messages
+    # (sent with this call only - adding it to the shared log would make the reducer fork (copy) it for our reply)
+    history = state.messages
+    query = []
     if state.query:
-        # Add the user's query to the message history
         user_message = {"role": "user", "content": state.query}
         # Ensure we're not duplicating the message if it's already in the state
-        if not state.messages or state.messages[-1] != user_message:
-            state.messages.append(user_message)
-
-    # Add system prompt to messages if it's not already there
-    # Check if the first message is a system message
-    if not state.messages or state.messages[0].get("role") != "system":
-        # Prepend system prompt to messages
-        state.messages = [{"role": "system", "content": SYSTEM_PROMPT}] + state.messages
-
+        if not history or history[-1] != user_message:
+            query = [user_message]
 
+    # System prompt first, then as much of the recent history as fits the model's context budget
+    llm = get_llm(config)
+    messages = prompts.build(config, SYSTEM_PROMPT, history, llm.model, extra=query).messages
 
-    print("*"*30)
-    print("GRAPH STATE INSIDE THE NODE")
-    for m in state.messages:
-        print(json.dumps(m, indent=2))
-    print("*"*30)
+    logger.debug("graph state inside the node: %s", lazy_json(messages, indent=2))
 
-    # Call the LLM with the full conversation history
-    llm = get_llm(config)
-    response = llm.stream(state.messages)
+    chunks = [chunk.content async for chunk in astream_chat(llm, messages, config)]
 
     # Join all chunks into a single response
-    full_response = "".join(chunk.content for chunk in response)
+    full_response = "".join(chunks)
 
-    # Add the assistant's response to the message history
+    # The reducer adds the assistant's response to the message history
     assistant_message = {"role": "assistant", "content": full_response}
-    state.messages.append(assistant_message)
 
-    print('='*40)
-    print("THE ASSISTANT SAID..")
-    print(assistant_message)
-    print('='*40)
+    logger.debug("the assistant said: %s", lazy_json(assistant_message))
 
     # Return the updated messages list with the new response
     return {"messages": [assistant_message]}
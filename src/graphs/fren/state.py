@@ -1,7 +1,8 @@
-import operator
 from typing import Optional, Annotated
 from pydantic import BaseModel, Field
 
+from ..messages import MessageLog, add_messages
+
 
 ############################################################################
 # PROMPTS
@@ -28,4 +29,4 @@ If the user seems confused of unskilled at chatting, tell them to run `/help`
 ############################################################################
 class State(BaseModel):
     query: Optional[str] = None
-    messages: Annotated[list, operator.add] = Field(default_factory=list)
+    messages: Annotated[MessageLog, add_messages] = Field(default_factory=MessageLog)
@@ -0,0 +1,154 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_ollama import ChatOllama
+
+import settings
+import metrics
+import tracing
+import http_client
+from ollama_pool import pool, HedgedTransport
+from dispatcher import dispatcher
+from .config import Config
+from .context import message_tokens
+
+
+logger = logging.getLogger(__name__)
+
+
+############################################################################
+# LLM CLIENTS
+############################################################################
+# (model, keep_alive, base_url, hedged) -> ChatOllama, least recently used first
+_LLMS: "OrderedDict[tuple, ChatOllama]" = OrderedDict()
+
+LLM_CACHE = metrics.Counter("plebchat_llm_client_cache_total", "ChatOllama lookups by cache result", ("result",))
+
+
+def chat_ollama(configurable: Config, chat: Optional[str] = None, hedge: bool = False) -> ChatOllama:
+    """A ChatOllama for the configured model that streams over the shared, pooled HTTP transport.
+
+    Clients are reused across turns (up to `LLM_CACHE_SIZE` of them) - building
+    one means pydantic validation plus a sync and an async Ollama client.
+
+    With `OLLAMA_HOSTS` set the host comes from the Ollama pool instead of
+    `OLLAMA_BASE_URL` (`chat` keeps a conversation on the same host when it can),
+    and `hedge` sends a reply that's slow to start to a second host as well
+    (`LLM_HEDGE_AFTER`, see `ollama_pool.HedgedTransport`).
+    """
+    base_url = pool.pick(configurable.LLM_MODEL, chat) if pool.enabled else configurable.OLLAMA_BASE_URL
+    hedge = hedge and pool.enabled and settings.LLM_HEDGE_AFTER > 0
+    key = (configurable.LLM_MODEL, configurable.KEEP_ALIVE, base_url, hedge)
+    llm = _LLMS.get(key)
+    if llm is not None:
+        _LLMS.move_to_end(key)
+        LLM_CACHE.inc("hit")
+        return llm
+
+    LLM_CACHE.inc("miss")
+    transport = http_client.transport()
+    if hedge:
+        transport = HedgedTransport(transport, configurable.LLM_MODEL, settings.LLM_HEDGE_AFTER)
+    llm = ChatOllama(
+        model=configurable.LLM_MODEL,
+        keep_alive=configurable.KEEP_ALIVE,
+        base_url=base_url,
+        async_client_kwargs={"transport": transport},
+    )
+    if settings.LLM_CACHE_SIZE > 0:
+        _LLMS[key] = llm
+        while len(_LLMS) > settings.LLM_CACHE_SIZE:
+            evicted, _ = _LLMS.popitem(last=False)
+            logger.debug("evicted LLM client %s", evicted)
+    return llm
+
+
+def invalidate_llms(model: Optional[str] = None, base_url: Optional[str] = None) -> int:
+    """Drop cached clients - all of them, or only those for `model` / `base_url`.  Returns how many were dropped."""
+    stale = [
+        key for key in _LLMS
+        if (model is None or key[0] == model) and (base_url is None or key[2] == base_url)
+    ]
+    for key in stale:
+        del _LLMS[key]
+    return len(stale)
+
+
+############################################################################
+# STREAMING
+############################################################################
+PREFILL_SECONDS = metrics.Histogram(
+    "plebchat_llm_prefill_seconds", "Ollama's prompt evaluation time per LLM call", ("model",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+PROMPT_TOKENS_SENT = metrics.Counter(
+    "plebchat_llm_prompt_tokens_sent_total", "Prompt tokens sent to Ollama (estimated)", ("model",))
+PROMPT_TOKENS_EVALUATED = metrics.Counter(
+    "plebchat_llm_prompt_tokens_evaluated_total", "Prompt tokens Ollama actually evaluated - the rest came from its KV cache", ("model",))
+
+
+async def astream_chat(llm, messages, config: RunnableConfig):
+    """Stream a chat completion from `llm`, tracing the call with its prefill / decode split.
+
+    Prefill is the time until the first chunk arrives, decode is the rest.  Ollama's own
+    counters from the final chunk (prompt_eval_count, eval_count, ...) are attached too;
+    prompt_eval_count only covers what wasn't in the KV cache, so next to our estimate
+    of the prompt's size it shows how much of the prefix was reused.
+
+    The call first waits for a slot on its Ollama host in the run's priority class (see
+    `dispatcher`) - the "priority" and "user" configurables the server sets per run.
+
+    NOTE: `config` is passed through so the "messages" stream mode sees the tokens (required on Python < 3.11)
+    """
+    model = getattr(llm, "model", "")
+    host = getattr(llm, "base_url", None) or ""
+    configurable = (config or {}).get("configurable", {})
+    sent = sum(message_tokens(m) for m in messages if isinstance(m, dict))
+    started = time.time_ns()
+    admitted = first = None
+    chunks = 0
+    metadata = {}
+    error = None
+    try:
+        # Counted against the host while it waits for a slot too, or a burst all routed to the same host
+        with pool.track(host, model):
+            async with dispatcher.slot(host, configurable.get("priority"), configurable.get("user")):
+                admitted = time.time_ns()
+                async for chunk in llm.astream(messages, config):
+                    if first is None:
+                        first = time.time_ns()
+                    chunks += 1
+                    if chunk.response_metadata:
+                        metadata = chunk.response_metadata
+                    yield chunk
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        ended = time.time_ns()
+        if "prompt_eval_count" in metadata:
+            PREFILL_SECONDS.observe(metadata.get("prompt_eval_duration", 0) / 1e9, model)
+            PROMPT_TOKENS_SENT.inc(model, amount=sent)
+            PROMPT_TOKENS_EVALUATED.inc(model, amount=metadata["prompt_eval_count"])
+        call = tracing.record_span(
+            "llm.chat", started, ended,
+            model=model,
+            host=host,
+            priority=configurable.get("priority", ""),
+            messages=len(messages),
+            chunks=chunks,
+            prompt_tokens_est=sent,
+            prompt_tokens=metadata.get("prompt_eval_count", ""),
+            output_tokens=metadata.get("eval_count", ""),
+            ollama_prefill_ms=round(metadata.get("prompt_eval_duration", 0) / 1e6, 1),
+            ollama_load_ms=round(metadata.get("load_duration", 0) / 1e6, 1),
+        )
+        if call is not None:
+            call.error = error
+            if admitted is not None and dispatcher.enabled:
+                tracing.record_span("llm.queue", started, admitted, parent=call)
+            if first is not None:
+                tracing.record_span("llm.prefill", admitted, first, parent=call)
+                tracing.record_span("llm.decode", first, ended, parent=call, chunks=chunks)
@@ -0,0 +1,130 @@
+"""The chat history type every graph's State uses, and its reducer.
+
+With `messages: Annotated[list, operator.add]` each state update built a new
+list holding the whole history, and every node's State validated (copied) it
+again - several full copies per turn, O(n^2) over a conversation.
+
+`MessageLog` is an immutable view of the first `len` messages of a shared
+backing list, like a Go slice.  Adding to the newest view appends to the
+backing list in place and returns a longer view - O(1), nothing copied - while
+every older view (in an earlier checkpoint, a state snapshot, ...) keeps
+seeing exactly the messages it had.  Only adding to an older view again
+(a fork) copies its prefix.
+
+    class State(BaseModel):
+        messages: Annotated[MessageLog, add_messages] = Field(default_factory=MessageLog)
+
+Nodes return `{"messages": [new_message]}` as before.  Checkpoints store the
+log as a plain list (`MessageLogSerializer`), so they don't depend on this type.
+"""
+
+from itertools import islice
+from collections.abc import Sequence
+from typing import Any, Iterable, Iterator, Union
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+
+class MessageLog(Sequence):
+    __slots__ = ("_items", "_len")
+
+    def __init__(self, messages: Iterable[dict] = ()):
+        """A log holding a copy of `messages`."""
+        self._items = list(messages)
+        self._len = len(self._items)
+
+    @classmethod
+    def _view(cls, items: list, length: int) -> "MessageLog":
+        log = cls.__new__(cls)
+        log._items = items
+        log._len = length
+        return log
+
+    @classmethod
+    def of(cls, value: Union["MessageLog", Iterable[dict], None]) -> "MessageLog":
+        """`value` as a MessageLog - logs are returned as they are, anything else is copied once."""
+        if isinstance(value, MessageLog):
+            return value
+        return cls(value or ())
+
+    ##############################################################
+    def add(self, *messages: dict) -> "MessageLog":
+        """This log with `messages` added at the end.  `self` is unchanged."""
+        return self.extend(messages)
+
+    def extend(self, messages: Iterable[dict]) -> "MessageLog":
+        """This log with `messages` added at the end.  `self` is unchanged."""
+        if isinstance(messages, MessageLog):
+            messages = islice(messages._items, messages._len)
+        items = self._items
+        if self._len != len(items):
+            # Something was already added after our end - fork rather than overwrite it
+            items = items[:self._len]
+        items.extend(messages)
+        return MessageLog._view(items, len(items))
+
+    def tolist(self) -> list[dict]:
+        return self._items[:self._len]
+
+    ##############################################################
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._items[:self._len][index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("message index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[dict]:
+        return islice(self._items, self._len)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MessageLog, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"MessageLog({self.tolist()!r})"
+
+    ##############################################################
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        from pydantic_core import core_schema
+
+        # No per-message validation: State is rebuilt for every node, and the history is only ever appended to
+        return core_schema.no_info_plain_validator_function(
+            cls.of, serialization=core_schema.plain_serializer_function_ser_schema(cls.tolist))
+
+
+def add_messages(left: Union[MessageLog, list, None], right: Union[MessageLog, list, dict, None]) -> MessageLog:
+    """Reducer for a State's `messages`: `right` (a message or a list of them) added after `left`."""
+    log = MessageLog.of(left)
+    if right is None:
+        return log
+    if isinstance(right, dict):
+        return log.add(right)
+    return log.extend(right)
+
+
+class MessageLogSerializer(JsonPlusSerializer):
+    """The checkpointer's default serializer, with message logs stored as plain lists."""
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        return super().dumps_typed(_plain(obj))
+
+
+def _plain(obj: Any) -> Any:
+    if isinstance(obj, MessageLog):
+        return obj.tolist()
+    if isinstance(obj, dict):
+        values = obj.get("channel_values")
+        if isinstance(values, dict) and any(isinstance(v, MessageLog) for v in values.values()):
+            # A checkpoint - a shallow copy with the logs swapped out
+            return {**obj, "channel_values": {k: _plain(v) for k, v in values.items()}}
+        if any(isinstance(v, MessageLog) for v in obj.values()):
+            return {k: _plain(v) for k, v in obj.items()}
+    return obj
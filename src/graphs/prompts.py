@@ -0,0 +1,109 @@
+"""Prompt assembly with a byte-stable prefix, so Ollama can reuse its KV cache across turns.
+
+Ollama keeps the KV cache of the last prompt in each of the model's slots, and
+a new request only has to prefill from the first byte that differs.  Every LLM
+call in the graphs builds its messages here, always in the same shape:
+
+    [system prompt] + history (append order) + extra (this call only)
+
+The system prompt is the graph's constant (or the client's own leading system
+message), and nothing is ever inserted in front of the history, so turn N+1's
+prompt starts with turn N's byte for byte.
+
+Trimming to the context budget would break that on every turn if it slid the
+window by one message each time.  Instead a chat's cut point is pinned: once
+the history overflows, it's cut back to `CONTEXT_TRIM_TO` of the budget and
+stays there - with the same prefix - until the history overflows again.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+import settings
+import metrics
+import tracing
+from .context import context_budget, fit, message_tokens
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+PROMPT_TOKENS = metrics.Histogram(
+    "plebchat_context_tokens", "Estimated prompt tokens sent to the LLM", ("model",),
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536))
+DROPPED = metrics.Counter(
+    "plebchat_context_messages_dropped_total", "History messages left out of a prompt to fit the context budget", ("model",))
+RECUTS = metrics.Counter(
+    "plebchat_context_recuts_total", "Times a chat's history was cut back (each one costs a full prefill)", ("model",))
+
+
+class Prompt(NamedTuple):
+    messages: list[dict]
+    tokens: int
+    dropped: int
+
+
+# Where each chat's history currently starts (index into its message list)
+_cuts: "OrderedDict[str, int]" = OrderedDict()
+_PINNED_CHATS = 4096
+
+
+def chat_key(config: Optional["RunnableConfig"]) -> Optional[str]:
+    """The conversation a run belongs to - its checkpoint thread - or None for stateless requests."""
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+
+def _start(chat: Optional[str], system: list[dict], history: list[dict], extra: list[dict], budget: int) -> tuple[int, int, bool]:
+    pinned = _cuts.get(chat) if chat else None
+    if pinned is not None and pinned < len(history):
+        tokens = sum(message_tokens(m) for m in system + history[pinned:] + extra)
+        if tokens <= budget:
+            _cuts.move_to_end(chat)
+            return pinned, tokens, False
+
+    start, tokens = fit(system, history, budget, extra)
+    if start == 0 or chat is None:
+        # Everything fits (or there's no chat to remember the cut for)
+        return start, tokens, False
+
+    # Over budget: cut deeper than needed, so the next turns have room to grow on the same prefix
+    start, tokens = fit(system, history, budget * settings.CONTEXT_TRIM_TO, extra)
+    _cuts[chat] = start
+    _cuts.move_to_end(chat)
+    if len(_cuts) > _PINNED_CHATS:
+        _cuts.popitem(last=False)
+    return start, tokens, True
+
+
+def build(config: Optional["RunnableConfig"], system_prompt: str, history: list[dict], model: str, extra: list[dict] = ()) -> Prompt:
+    """The messages for one LLM call: system prompt, as much of the history as fits `model`'s budget, then `extra`.
+
+    `extra` (e.g. a command's output to work from) is sent with this call only;
+    it isn't part of the chat's history, so it never shifts a later prefix.
+    """
+    if history and history[0].get("role") == "system":
+        system, history = [history[0]], history[1:]
+    else:
+        system = [{"role": "system", "content": system_prompt}]
+    extra = list(extra)
+
+    with tracing.span("prompt.build", model=model, messages=len(history)) as span:
+        start, tokens, recut = _start(chat_key(config), system, history, extra, context_budget(model))
+        span.set(tokens=tokens, dropped=start, recut=recut)
+
+    if recut:
+        RECUTS.inc(model)
+        logger.debug("history cut back", extra={"model": model, "dropped": start, "kept": len(history) - start, "tokens": tokens})
+    if start:
+        DROPPED.inc(model, amount=start)
+    PROMPT_TOKENS.observe(tokens, model)
+    return Prompt(system + history[start:] + extra, tokens, start)
+
+
+def forget(chat: str):
+    """Drop a chat's pinned cut - its history was replaced, so the old index means nothing."""
+    _cuts.pop(chat, None)
@@ -27,7 +27,7 @@ Here's my [source code on GitHub](https://github.com/PlebeiusGaragicus/plebchatp
         return CommandOutput(cmdOutput=about_text)
         
     @classmethod
-    def summarize(cls, args: list[str] = None):
+    async def summarize(cls, args: list[str] = None):
         """Extract and summarize the main content from a website URL.
 
         Usage: /summarize https://example.com
@@ -35,7 +35,7 @@ Here's my [source code on GitHub](https://github.com/PlebeiusGaragicus/plebchatp
         This allows you to quickly understand the key points from web content.
         """
         # Get the URL content using the base url command
-        url_result = BaseCommandHandler.url(args)
+        url_result = await BaseCommandHandler.url(args)
 
         # Create a reinjection prompt for summarization
         reinjection_prompt = f"""
@@ -1,7 +1,6 @@
 """This research graph outlines a LangGraph agent for web research."""
 
 
-import operator
 from typing import Optional, Annotated, List, Dict, Any
 from pydantic import BaseModel, Field
 
@@ -13,17 +12,18 @@ from typing import Dict, Any, List, Optional
 
 
 from langchain_core.runnables import RunnableConfig
-from langchain_ollama import ChatOllama
 from langgraph.graph.state import StateGraph
 from langgraph.types import StreamWriter
 
+import settings
 from ..config import Config
-from ..common import write_content, write_thought, NodeOutputType
+from ..llm import astream_chat, chat_ollama
+from ..messages import MessageLog, add_messages
+from .. import prompts
+from ..common import write_content, write_thought, preview, NodeOutputType, instrumented
 
 from .commands import CommandHandler
 
-# Configure logging
-logging.basicConfig(level=logging.INFO) 
 logger = logging.getLogger(__name__)
 
 
@@ -48,7 +48,7 @@ Always base your answers solely on the provided search results. If the search re
 class State(BaseModel):
     """State for the research agent graph."""
     query: Optional[str] = None
-    messages: Annotated[list, operator.add] = Field(default_factory=list)
+    messages: Annotated[MessageLog, add_messages] = Field(default_factory=MessageLog)
 
     search_results: List[Dict[str, Any]] = Field(default_factory=list, description="Results from search engine")
     answer: Optional[str] = Field(default=None, description="The final answer to return to the user")
@@ -62,11 +62,7 @@ def get_llm(config: RunnableConfig):
     """Get the LLM model based on the configuration."""
     configurable = Config.from_runnable_config(config)
     
-    return ChatOllama(
-        model=configurable.LLM_MODEL,
-        keep_alive=configurable.KEEP_ALIVE,
-        base_url=configurable.OLLAMA_BASE_URL
-    )
+    return chat_ollama(configurable, prompts.chat_key(config))
 
 
 ############################################################################
@@ -96,7 +92,7 @@ def _check_for_command(state: State, config: RunnableConfig, writer: StreamWrite
 ############################################################################
 # NODE
 ############################################################################
-def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
+async def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
     # extract command
     query = state.messages[-1]['content']
     split = query.split(" ")
@@ -109,44 +105,39 @@ def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
         command = ""
 
     # Get command output
-    cmd_output = CommandHandler._run(command, arguments)
+    cmd_output = await CommandHandler._run(command, arguments)
 
     # Handle the command output based on its properties
     if cmd_output.returnDirect:
         # Return the output directly to the user
         writer(write_content(cmd_output.cmdOutput))
-        return
+        # ...and keep it in the history, like any other reply
+        return {"messages": [{"role": "assistant", "content": cmd_output.cmdOutput}]}
 
     else:
         # The output should be processed by an LLM before returning to the user
         writer(write_thought(f"Processing command output with LLM..."))
         writer(write_thought( '---' ))
         writer(write_thought( "### command output:" ))
-        writer(write_thought( cmd_output.cmdOutput ))
+        # Just a taste - a scraped page can be tens of thousands of characters, the model gets all of it
+        writer(write_thought( preview(cmd_output.cmdOutput, settings.COMMAND_PREVIEW_CHARS) ))
 
 
         # Create prompt for LLM
         prompt = cmd_output.reinjectionPrompt or "Process this information and provide a helpful response:"
 
-        # Get the LLM
-
-        # Prepare messages for the LLM
-        messages = [
-            {"role": "system", "content": cmd_output.reinjectionPrompt},
-            {"role": "user", "content": f"{prompt}\n\n{cmd_output.cmdOutput}"}
-        ]
-
+        # The chat so far (a prefix Ollama has cached), then the command output for this call only
         llm = get_llm(config)
-        response = llm.stream(state.messages)
+        messages = prompts.build(config, SYSTEM_PROMPT, state.messages, llm.model, extra=[
+            {"role": "user", "content": f"{prompt}\n\n{cmd_output.cmdOutput}"}
+        ]).messages
 
-        # Join all chunks into a single response
-        full_response = "".join(chunk.content for chunk in response)
+        # The tokens reach the client as they're generated (the "messages" stream mode), this only keeps the answer for the history
+        chunks = [chunk.content async for chunk in astream_chat(llm, messages, config)]
+        full_response = "".join(chunks)
 
-        # Add the assistant's response to the message history
+        # Return the new response - the reducer adds it to the message history
         assistant_message = {"role": "assistant", "content": full_response}
-        state.messages.append(assistant_message)
-
-        # Return the updated messages list with the new response
         return {"messages": [assistant_message]}
 
 
@@ -154,19 +145,30 @@ def handle_command(state: State, config: RunnableConfig, writer: StreamWriter):
 ############################################################################
 # NODE
 ############################################################################
-def router(state: State, config: RunnableConfig, writer: StreamWriter):
+async def router(state: State, config: RunnableConfig, writer: StreamWriter):
+
+    streamed = []
 
-    writer( write_thought("nothing") )
+    def think(text: str):
+        thought = write_thought(text)
+        streamed.append("\n" + thought["content"])  # the newline frame the server sends before each thought
+        writer( thought )
+
+    think("nothing")
 
 
     # check if the last message was from the 'assistant' - if so, this convo was continued.  If not, this convo is NEW
     if state.messages[-1].get("role", None) == 'assistant':
-        print(">>>>> NEW CONVO DETECTED")
-        writer( write_thought(">>>>> NEW CONVO DETECTED") )
+        logger.debug("new convo detected")
+        think(">>>>> NEW CONVO DETECTED")
         return "search"
     else:
-        print(">>>>> CONVO IS BEING CONTINUED")
-        writer( write_thought(">>>>> CONVO IS BEING CONTINUED") )
+        logger.debug("convo is being continued")
+        think(">>>>> CONVO IS BEING CONTINUED")
+
+    # OUI keeps what was streamed as this turn's reply - keep it in our history too, or a checkpointed
+    # chat's history never matches the client's on the next turn
+    return {"messages": [{"role": "assistant", "content": "".join(streamed)}]}
 
 
     # # If we have a new user query, add it to the messages
@@ -224,8 +226,8 @@ graph_builder = StateGraph(State, input=State, config_schema=Config)
 
 graph_builder.add_conditional_edges("__start__", _check_for_command)
 # We route to either of these...
-graph_builder.add_node("handle_command", handle_command)
-graph_builder.add_node("router", router, metadata={"node_output_type": NodeOutputType.THOUGHT})
+graph_builder.add_node("handle_command", instrumented("research", "handle_command", handle_command))
+graph_builder.add_node("router", instrumented("research", "router", router), metadata={"node_output_type": NodeOutputType.THOUGHT})
 
 
 
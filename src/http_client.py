@@ -0,0 +1,178 @@
+"""The process-wide async HTTP client for every outbound call.
+
+Ollama (`/models`, warm-up, and ChatOllama's own client), SearXNG and the
+`/url` page fetches all share one `httpx.AsyncClient`, so keep-alive
+connections are reused across turns instead of paying TCP/TLS set-up on each
+call.  Every upstream host gets its own connection pool, capped at
+`HTTP_MAX_CONNECTIONS_PER_HOST` - a slow upstream can only tie up its own
+sockets, and callers beyond the cap wait (up to `HTTP_POOL_TIMEOUT`) for one
+to free up.  Host names are resolved once per `DNS_CACHE_TTL`.
+
+    response = await http_client.client().get(url)
+
+The client is created on first use and closed by the server's lifespan hook.
+"""
+
+import time
+import socket
+import asyncio
+import logging
+import ipaddress
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+import httpcore
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """httpcore's default backend, with `getaddrinfo` results cached per host.
+
+    Only the TCP connect goes to the cached address - TLS still verifies
+    against (and sends SNI for) the host name in the URL.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._backend = httpcore.AnyIOBackend()
+        self._addresses: dict[str, tuple[str, float]] = {}
+
+    async def _resolve(self, host: str, port: int) -> str:
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        cached = self._addresses.get(host)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        self._addresses[host] = (address, time.monotonic() + self.ttl)
+        return address
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = await self._resolve(host, port)
+        try:
+            return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+        except httpcore.ConnectError:
+            # The host may have moved - look it up again next time
+            self._addresses.pop(host, None)
+            raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+class _HostTransport(httpx.AsyncHTTPTransport):
+    """httpx's transport for a single host, with the DNS-caching backend plugged into its pool."""
+
+    pool: httpcore.AsyncConnectionPool
+
+    def __init__(self, limits: httpx.Limits, ssl_context, backend: httpcore.AsyncNetworkBackend):
+        super().__init__(verify=ssl_context, limits=limits)
+        self._pool = self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=backend,
+        )
+
+
+class PerHostTransport(httpx.AsyncBaseTransport):
+    """Routes each request to a connection pool of its own for its (scheme, host, port)."""
+
+    def __init__(self, limits: httpx.Limits, max_hosts: int, dns_ttl: float):
+        """
+        Args:
+            limits: Connection limits for *each* host's pool
+            max_hosts: Pools kept open at once; beyond this the least recently used idle pool is closed
+            dns_ttl: Seconds a resolved address is reused
+        """
+        self.limits = limits
+        self.max_hosts = max_hosts
+        self._backend = CachingNetworkBackend(dns_ttl)
+        self._ssl_context = httpx.create_ssl_context()
+        self._hosts: "OrderedDict[tuple, _HostTransport]" = OrderedDict()
+
+    def _transport_for(self, url: httpx.URL) -> _HostTransport:
+        key = (url.scheme, url.host, url.port)
+        host = self._hosts.get(key)
+        if host is not None:
+            self._hosts.move_to_end(key)
+            return host
+
+        host = self._hosts[key] = _HostTransport(self.limits, self._ssl_context, self._backend)
+        self._evict()
+        return host
+
+    def _evict(self):
+        # Oldest first, and never a pool with a request in flight (e.g. a long Ollama stream)
+        for key in list(self._hosts)[:-self.max_hosts]:
+            if all(connection.is_idle() for connection in self._hosts[key].pool.connections):
+                asyncio.get_running_loop().create_task(self._hosts.pop(key).aclose())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport_for(request.url).handle_async_request(request)
+
+    async def aclose(self):
+        hosts, self._hosts = list(self._hosts.values()), OrderedDict()
+        for host in hosts:
+            await host.aclose()
+
+
+_transport: Optional[PerHostTransport] = None
+_client: Optional[httpx.AsyncClient] = None
+
+
+def transport() -> PerHostTransport:
+    """The shared pooled transport - for clients we don't build ourselves (ChatOllama's)."""
+    global _transport
+    if _transport is None:
+        _transport = PerHostTransport(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            max_hosts=settings.HTTP_MAX_HOSTS,
+            dns_ttl=settings.DNS_CACHE_TTL,
+        )
+    return _transport
+
+
+def client() -> httpx.AsyncClient:
+    """The shared client.  Per-request `timeout=` overrides the defaults below."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            transport=transport(),
+            timeout=httpx.Timeout(
+                settings.HTTP_TIMEOUT,
+                connect=settings.HTTP_CONNECT_TIMEOUT,
+                pool=settings.HTTP_POOL_TIMEOUT,
+            ),
+            # Off - a caller that follows redirects has to check where they lead (see `/url`)
+            follow_redirects=False,
+        )
+    return _client
+
+
+async def aclose():
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()  # closes the transport too
+    elif _transport is not None:
+        await _transport.aclose()
+    _client = _transport = None
@@ -0,0 +1,92 @@
+"""Logging setup for the server.
+
+Modules log through the standard library (`logging.getLogger(__name__)`), so
+levels can be set per module:
+
+    LOG_LEVEL=INFO  LOG_LEVELS="server=DEBUG,graphs.fren=DEBUG"
+
+Records are written as one line each - `key=value` pairs by default, or a
+JSON object per line with `LOG_FORMAT=json`.  Anything passed through
+`extra={...}` shows up as a field.
+
+Expensive debug output should be passed as an argument, never pre-formatted,
+so it's only rendered when the record is actually emitted:
+
+    logger.debug("state update: %s", lazy_json(data))
+"""
+
+import sys
+import json
+import time
+import logging
+
+import settings
+
+
+# Attributes every LogRecord has - anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class lazy_json:
+    """Defers `json.dumps` until the log record is formatted.  Never raises on odd objects."""
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj, indent: int = None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        try:
+            return json.dumps(self.obj, indent=self.indent, default=repr, ensure_ascii=False)
+        except Exception:
+            return repr(self.obj)
+
+
+def _extras(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        line = f"{ts} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = _extras(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_extras(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging():
+    """Install the formatter on the root logger and apply LOG_LEVEL / LOG_LEVELS.  Safe to call twice."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if settings.LOG_FORMAT == "json" else KeyValueFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, "_plebchat", False):
+            root.removeHandler(existing)
+    handler._plebchat = True
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    for item in settings.LOG_LEVELS.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
@@ -0,0 +1,161 @@
+"""Prometheus-style metrics, rendered by the `/metrics` endpoint.
+
+Deliberately tiny: counters, gauges and fixed-bucket histograms stored in
+plain dicts keyed by label-value tuples.  Everything runs on the server's
+event loop, so there are no locks - recording a value is a dict lookup, a
+`bisect` and an integer increment.
+
+    TTFT.observe(0.42, "fren", "llama3.1:8b")
+    REQUESTS.inc("fren")
+"""
+
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _REGISTRY.append(self)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def _samples(self):
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_num(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable[[], dict]] = None):
+        """
+        Args:
+            callback: Optional function returning `{label_values_tuple: value}`, read at render time
+                      (for values that already live somewhere else, like the scheduler's queue length)
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._callback = callback
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def _samples(self):
+        values = self._callback() if self._callback else self._values
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_num(v)}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    # seconds - from a single token (~10ms) up to a long research run
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., count above the last bucket], sum
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, *labels):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def _samples(self):
+        lines = []
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, labels)} {_num(self._sums[labels])}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _REGISTRY) + "\n"
+
+
+############################################################################
+# METRICS
+############################################################################
+REQUESTS = Counter("plebchat_requests_total", "Graph requests received", ("graph",))
+REJECTED = Counter("plebchat_requests_rejected_total", "Graph requests turned away by admission control", ("graph", "model"))
+INFLIGHT = Gauge("plebchat_runs_in_flight", "Graph runs currently streaming (queued or running)", ("graph",))
+ERRORS = Counter("plebchat_errors_total", "Graph runs that ended with an error", ("graph",))
+
+TTFT = Histogram("plebchat_time_to_first_token_seconds", "Time from run start to the first LLM token", ("graph", "model"))
+STREAM_DURATION = Histogram("plebchat_stream_duration_seconds", "Time from run start to the end of the stream", ("graph", "model"))
+TOKENS_PER_SECOND = Histogram(
+    "plebchat_tokens_per_second", "LLM token chunks per second after the first token", ("graph", "model"),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+NODE_SECONDS = Histogram("plebchat_node_seconds", "Wall time spent in a graph node", ("graph", "node", "model"))
+NODE_ERRORS = Counter("plebchat_node_errors_total", "Graph nodes that raised", ("graph", "node", "model"))
+
+TOKENS_RECEIVED = Counter("plebchat_sse_token_chunks_total", "LLM token chunks received from graphs")
+FRAMES_EMITTED = Counter("plebchat_sse_token_frames_total", "SSE frames sent for those token chunks")
+
+CANCELLED_RUNS = Counter("plebchat_cancelled_runs_total", "Graph runs cancelled because the client disconnected", ("graph",))
+CANCEL_SECONDS_SAVED = Counter(
+    "plebchat_cancel_generation_seconds_saved_total",
+    "Estimated generation time saved by cancelling runs of disconnected clients", ("graph",),
+)
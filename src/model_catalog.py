@@ -0,0 +1,117 @@
+"""Cached list of the models Ollama has, for the `/models` endpoint.
+
+Open WebUI asks for the model list on every settings page load, so the list
+is kept for `MODELS_CACHE_TTL` seconds.  Once it is older than that it's still
+returned right away while a single background refresh fetches a new one -
+and if Ollama is down, the last good list keeps being served.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import settings
+import http_client
+
+
+logger = logging.getLogger(__name__)
+
+
+def _model_entry(model: dict, loaded: set) -> dict:
+    details = model.get("details") or {}
+    return {
+        "name": model["name"],
+        "size": model.get("size"),
+        "parameter_size": details.get("parameter_size"),
+        "quantization": details.get("quantization_level"),
+        "family": details.get("family"),
+        "modified_at": model.get("modified_at"),
+        "loaded": model["name"] in loaded,
+    }
+
+
+class ModelCatalog:
+    def __init__(self, base_url: str, ttl: float, timeout: float):
+        """
+        Args:
+            base_url: Ollama's base URL
+            ttl: Seconds a fetched list is fresh before it is refreshed in the background
+            timeout: Timeout (seconds) for each Ollama API call
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self._models: Optional[list[dict]] = None
+        self._fetched_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the cached list was fetched (None if there is none yet)."""
+        return None if self._models is None else time.monotonic() - self._fetched_at
+
+    async def _fetch(self) -> list[dict]:
+        client = http_client.client()
+        tags, ps = await asyncio.gather(
+            client.get(f"{self.base_url}/api/tags", timeout=self.timeout),
+            client.get(f"{self.base_url}/api/ps", timeout=self.timeout),
+            return_exceptions=True,
+        )
+        if isinstance(tags, BaseException):
+            raise tags
+        tags.raise_for_status()
+
+        # Which models are loaded is nice to have - don't fail the whole list over it
+        loaded = set()
+        if isinstance(ps, BaseException) or ps.is_error:
+            logger.debug("could not read loaded models from /api/ps: %s", ps)
+        else:
+            loaded = {m["name"] for m in ps.json().get("models", [])}
+
+        return [
+            _model_entry(model, loaded)
+            for model in tags.json().get("models", [])
+            if "embed" not in model["name"]  # skip embedding models
+        ]
+
+    async def _refresh(self):
+        started = time.monotonic()
+        try:
+            self._models = await self._fetch()
+            self._fetched_at = time.monotonic()
+            logger.debug("model list refreshed in %.0f ms", (self._fetched_at - started) * 1000)
+        except Exception as e:
+            if self._models is None:
+                raise
+            logger.warning("could not refresh Ollama models, serving a list %.0fs old: %s", self.age, e)
+
+    def _start_refresh(self) -> asyncio.Task:
+        # Single flight: every caller shares the one refresh in progress
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+
+    async def get(self) -> list[dict]:
+        """The model list - fresh, or stale while a refresh runs in the background.
+
+        Raises:
+            httpx.HTTPError: only when Ollama can't be reached and nothing was ever cached
+        """
+        if self._models is None:
+            await asyncio.shield(self._start_refresh())
+        elif self.age > self.ttl:
+            self._start_refresh()
+        return self._models
+
+    def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+
+
+catalog = ModelCatalog(
+    base_url=settings.OLLAMA_BASE_URL,
+    ttl=settings.MODELS_CACHE_TTL,
+    timeout=settings.OLLAMA_API_TIMEOUT,
+)
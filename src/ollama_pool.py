@@ -0,0 +1,410 @@
+"""A pool of Ollama hosts, and which one each LLM call goes to.
+
+With `OLLAMA_HOSTS` set (comma separated base URLs) the graphs' LLM calls
+aren't tied to one `OLLAMA_BASE_URL` any more.  Every `OLLAMA_PROBE_INTERVAL`
+seconds each host is asked for its models (`/api/tags`) and what it has
+loaded right now (`/api/ps`), and each call is routed to, in order of
+preference:
+
+1. a host that has the model loaded already (no load time),
+2. a host that has it pulled,
+3. any other healthy host,
+
+and among those to the one with the fewest calls in flight - counting the
+ones waiting there for a dispatcher slot (`LLM_SLOTS`), so a burst doesn't
+all queue on one host.  The host a chat used last gets the call if it's no
+busier than that, since its KV cache probably still holds the chat's prefix
+(see `graphs.prompts`).
+
+A host that can't be reached, or fails a call with a connection error, is
+ejected for `OLLAMA_EJECT_SECONDS` and then probed again before it gets
+traffic.  If every host is ejected, calls still go to the least recently
+ejected one rather than failing outright.
+
+Without `OLLAMA_HOSTS` the pool is off and calls go to the configured
+`OLLAMA_BASE_URL` as before.
+
+Chat replies can be hedged (`LLM_HEDGE_AFTER`, see `HedgedTransport`): a
+host that's busy loading a model or swapping doesn't hold the reply up for
+longer than the threshold when another host could answer it.
+"""
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+import httpx
+
+import settings
+import metrics
+import http_client
+from dispatcher import dispatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+ROUTED = metrics.Counter(
+    "plebchat_ollama_routed_total", "LLM calls routed per host, by whether it had the model loaded / pulled / neither",
+    ("host", "residency"))
+EJECTIONS = metrics.Counter("plebchat_ollama_ejections_total", "Times an Ollama host was taken out of rotation", ("host",))
+
+# What a call failing because of the host (rather than the request) looks like - the Ollama client
+# turns a refused connection into a builtin ConnectionError, a host dying mid-stream surfaces from httpx
+CONNECTION_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+HEDGE_CALLS = metrics.Counter(
+    "plebchat_llm_hedge_calls_total", "Chat calls eligible for hedging, by whether the hedge was sent", ("model", "hedged"))
+HEDGE_WINS = metrics.Counter(
+    "plebchat_llm_hedge_wins_total", "Hedged calls by which host answered first (primary / backup / none - no other host)",
+    ("model", "winner"))
+HEDGE_TTFT = metrics.Histogram(
+    "plebchat_llm_hedge_ttft_seconds",
+    "Time to the first response bytes of hedge-eligible chat calls, by winner (unhedged / primary / backup / none)",
+    ("model", "winner"), buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60))
+HEDGE_BACKUP_TTFT = metrics.Histogram(
+    "plebchat_llm_hedge_backup_ttft_seconds", "Time from sending a hedge to the backup's first response bytes",
+    ("model",), buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60))
+
+
+def model_name(name: str) -> str:
+    """Ollama's canonical name for a model - an untagged name means `:latest`."""
+    return name if ":" in name else f"{name}:latest"
+
+
+class Backend:
+    __slots__ = ("url", "in_flight", "loaded", "available", "ejected_until", "error", "probed_at")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.loaded: set[str] = set()
+        self.available: set[str] = set()
+        self.ejected_until = 0.0
+        self.error: Optional[str] = None
+        self.probed_at: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.probed_at is not None and self.ejected_until <= time.monotonic()
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "loaded": sorted(self.loaded),
+            "available": len(self.available),
+            "error": self.error,
+        }
+
+
+class _Call:
+    """The host a tracked call is counted against - a hedge's backup can take it over."""
+    __slots__ = ("url",)
+
+    def __init__(self, url: str):
+        self.url = url
+
+
+# The call `track()` is running in this task, for `HedgedTransport` to report its winner to
+_current_call: ContextVar[Optional[_Call]] = ContextVar("ollama_call", default=None)
+
+
+class OllamaPool:
+    def __init__(self, hosts: list[str], probe_interval: float, eject_seconds: float, timeout: float):
+        """
+        Args:
+            hosts: Ollama base URLs (empty = pool off)
+            probe_interval: Seconds between reading every host's /api/tags and /api/ps
+            eject_seconds: How long a failed host gets no traffic before it's probed again
+            timeout: Timeout (seconds) for each probe
+        """
+        self.backends = {url: Backend(url) for url in (h.rstrip("/") for h in hosts)}
+        self.probe_interval = probe_interval
+        self.eject_seconds = eject_seconds
+        self.timeout = timeout
+        # chat -> the host its last call went to
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.backends)
+
+    def status(self) -> list[dict]:
+        return [b.as_dict() for b in self.backends.values()]
+
+    ##############################################################
+    def eject(self, url: str, error: str):
+        backend = self.backends.get(url)
+        if backend is None:
+            return
+        if backend.ejected_until <= time.monotonic():
+            EJECTIONS.inc(url)
+            logger.warning("ollama host ejected", extra={"host": url, "error": error, "seconds": self.eject_seconds})
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.error = error
+
+    async def _probe(self, backend: Backend):
+        client = http_client.client()
+        try:
+            tags, ps = await asyncio.gather(
+                client.get(f"{backend.url}/api/tags", timeout=self.timeout),
+                client.get(f"{backend.url}/api/ps", timeout=self.timeout),
+            )
+            tags.raise_for_status()
+            ps.raise_for_status()
+        except Exception as e:
+            self.eject(backend.url, f"{type(e).__name__}: {e}")
+            return
+        backend.available = {model_name(m["name"]) for m in tags.json().get("models", [])}
+        backend.loaded = {model_name(m["name"]) for m in ps.json().get("models", [])}
+        backend.probed_at = time.monotonic()
+        if backend.error is not None:
+            logger.info("ollama host back", extra={"host": backend.url})
+        backend.ejected_until = 0.0
+        backend.error = None
+
+    async def probe(self):
+        """Read every host's models now.  Ejected hosts are only probed once their time is up."""
+        now = time.monotonic()
+        await asyncio.gather(*(self._probe(b) for b in self.backends.values() if b.ejected_until <= now))
+
+    async def run(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("ollama host probe failed")
+            await asyncio.sleep(self.probe_interval)
+
+    ##############################################################
+    def pick(self, model: str, chat: Optional[str] = None, exclude: Iterable[str] = ()) -> str:
+        """The base URL to send a call for `model` to (see the module docstring for the order)."""
+        model = model_name(model)
+        candidates = [b for b in self.backends.values() if b.healthy and b.url not in exclude]
+        if not candidates:
+            # Nothing healthy - better to try the host that's been out the longest than to fail right away
+            fallback = [b for b in self.backends.values() if b.url not in exclude] or list(self.backends.values())
+            backend = min(fallback, key=lambda b: b.ejected_until)
+            ROUTED.inc(backend.url, "unhealthy")
+            return backend.url
+
+        for residency, matches in (
+            ("loaded", [b for b in candidates if model in b.loaded]),
+            ("pulled", [b for b in candidates if model in b.available]),
+            ("none", candidates),
+        ):
+            if matches:
+                break
+
+        backend = min(matches, key=lambda b: b.in_flight)
+        previous = self.backends.get(self._affinity.get(chat)) if chat else None
+        if previous is not None and previous in matches and previous.in_flight <= backend.in_flight:
+            backend = previous
+
+        if chat:
+            self._affinity[chat] = backend.url
+            self._affinity.move_to_end(chat)
+            if len(self._affinity) > 4096:
+                self._affinity.popitem(last=False)
+        ROUTED.inc(backend.url, residency)
+        return backend.url
+
+    @contextmanager
+    def track(self, url: str, model: str):
+        """Count a call to `url` as in flight while the block runs; a connection failure ejects the host.
+
+        Enter it right after `pick()`, before waiting for a dispatcher slot - the wait counts as load.
+        """
+        backend = self.backends.get(url.rstrip("/"))
+        if backend is None:
+            yield
+            return
+        call = _Call(backend.url)
+        token = _current_call.set(call)
+        backend.in_flight += 1
+        try:
+            yield
+            # It answered, so whatever it serves now includes this model
+            self.backends[call.url].loaded.add(model_name(model))
+        except CONNECTION_ERRORS as e:
+            self.eject(call.url, f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.backends[call.url].in_flight -= 1
+            try:
+                _current_call.reset(token)
+            except ValueError:
+                _current_call.set(None)  # closed from another context (a generator finalized late)
+
+    def served_by(self, url: str):
+        """The call `track()` is running here is answered by `url` (a hedge's backup won) - count it, and how it ends, there."""
+        call = _current_call.get()
+        target = self.backends.get(url)
+        if call is None or target is None or call.url == url:
+            return
+        self.backends[call.url].in_flight -= 1
+        target.in_flight += 1
+        call.url = url
+
+
+############################################################################
+# HEDGING
+############################################################################
+class _Replay(httpx.AsyncByteStream):
+    """A response body whose first chunk was already read."""
+
+    def __init__(self, first: bytes, rest, response: httpx.Response):
+        self.first = first
+        self.rest = rest
+        self.response = response
+
+    async def __aiter__(self):
+        if self.first:
+            yield self.first
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+class HedgedTransport(httpx.AsyncBaseTransport):
+    """Sends a streamed `/api/chat` call to a second pool host if the first is slow to answer.
+
+    With no response bytes (the first token, or an error) from the host the
+    client was routed to after `after` seconds, the same request also goes to
+    the best other host for the model.  Whichever answers first is returned and
+    the other request is cancelled on the spot - its connection is dropped, so
+    Ollama stops generating for it.  Only the winner's tokens ever reach the
+    caller.  Everything else passes straight through.
+
+    A pending backup is load like any other call: it counts in flight on its
+    host and takes one of the host's dispatcher slots (`LLM_SLOTS`) - if none
+    is free, the call isn't hedged.
+
+    Tuning `LLM_HEDGE_AFTER`: the hedge rate is `plebchat_llm_hedge_calls_total`,
+    how often the backup wins is `plebchat_llm_hedge_wins_total`, and
+    `plebchat_llm_hedge_ttft_seconds` by winner ("unhedged" for the calls that
+    answered within the threshold, else primary / backup / none) next to
+    `plebchat_llm_hedge_backup_ttft_seconds` shows what a hedge bought - a
+    winning backup answered at the threshold plus its own time, while the
+    primary hadn't answered yet.  Backups that rarely win mean the threshold is
+    too low and the hedges are just extra load.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, model: str, after: float):
+        self.transport = transport
+        self.model = model
+        self.after = after
+
+    async def _first(self, request: httpx.Request) -> tuple[httpx.Response, bytes, object]:
+        response = await self.transport.handle_async_request(request)
+        chunks = response.stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = b""
+        except BaseException:
+            await response.aclose()
+            raise
+        return response, first, chunks
+
+    @staticmethod
+    def _respond(result) -> httpx.Response:
+        response, first, chunks = result
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=_Replay(first, chunks, response))
+
+    @staticmethod
+    async def _discard(task: asyncio.Task):
+        task.cancel()
+        try:
+            result = await task
+        except BaseException:
+            return
+        await result[0].aclose()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or request.url.path != "/api/chat" or not pool.enabled:
+            return await self.transport.handle_async_request(request)
+
+        started = time.monotonic()
+        primary_url = f"{request.url.scheme}://{request.url.netloc.decode()}"
+        primary = asyncio.ensure_future(self._first(request))
+        done, _ = await asyncio.wait({primary}, timeout=self.after)
+        if done:
+            HEDGE_CALLS.inc(self.model, "no")
+            HEDGE_TTFT.observe(time.monotonic() - started, self.model, "unhedged")
+            return self._respond(primary.result())
+
+        await request.aread()
+        backup_url = pool.pick(self.model, exclude={primary_url})
+        if backup_url == primary_url or not dispatcher.try_acquire(backup_url):
+            # No other host, or no free slot on it - a hedge would only queue behind its calls
+            HEDGE_CALLS.inc(self.model, "no")
+            HEDGE_WINS.inc(self.model, "none")
+            result = await primary
+            HEDGE_TTFT.observe(time.monotonic() - started, self.model, "none")
+            return self._respond(result)
+
+        HEDGE_CALLS.inc(self.model, "yes")
+        hedged_at = time.monotonic()
+        headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"host"]
+        host = httpx.URL(backup_url)
+        backup_request = httpx.Request(
+            request.method, request.url.copy_with(scheme=host.scheme, host=host.host, port=host.port),
+            headers=headers, content=request.content, extensions=request.extensions)
+        backup = asyncio.ensure_future(self._first(backup_request))
+        logger.info("hedging slow LLM call", extra={"model": self.model, "primary": primary_url, "backup": backup_url})
+
+        # The backup is load on its host while it's pending, like any call there
+        pool.backends[backup_url].in_flight += 1
+        try:
+            pending = {primary, backup}
+            winner = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The primary first if both answered in the same instant - it's already counted in flight
+                for task in sorted(done, key=lambda t: t is backup):
+                    if winner is None and task.exception() is None:
+                        winner = task
+            if winner is None:
+                # Both failed - the primary's error is the one the caller asked for
+                return self._respond(primary.result())
+        finally:
+            for task in (primary, backup):
+                if task is not winner:
+                    await self._discard(task)
+            pool.backends[backup_url].in_flight -= 1
+            dispatcher.release(backup_url)
+
+        ttft = time.monotonic() - started
+        if winner is primary:
+            HEDGE_WINS.inc(self.model, "primary")
+            HEDGE_TTFT.observe(ttft, self.model, "primary")
+            return self._respond(primary.result())
+
+        HEDGE_WINS.inc(self.model, "backup")
+        HEDGE_TTFT.observe(ttft, self.model, "backup")
+        HEDGE_BACKUP_TTFT.observe(time.monotonic() - hedged_at, self.model)
+        pool.served_by(backup_url)
+        return self._respond(backup.result())
+
+
+pool = OllamaPool(
+    hosts=[h.strip() for h in settings.OLLAMA_HOSTS.split(",") if h.strip()],
+    probe_interval=settings.OLLAMA_PROBE_INTERVAL,
+    eject_seconds=settings.OLLAMA_EJECT_SECONDS,
+    timeout=settings.OLLAMA_API_TIMEOUT,
+)
+
+metrics.Gauge("plebchat_ollama_in_flight", "LLM calls in flight (or waiting for a slot) per Ollama host",
+              ("host",), callback=lambda: {(b.url,): b.in_flight for b in pool.backends.values()})
+metrics.Gauge("plebchat_ollama_healthy", "1 if an Ollama host is in rotation",
+              ("host",), callback=lambda: {(b.url,): int(b.healthy) for b in pool.backends.values()})
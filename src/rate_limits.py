@@ -0,0 +1,195 @@
+"""Per-user rate limits on graph runs: requests per minute and generated tokens per minute.
+
+Each user (Open WebUI's user id, forwarded by the pipeline) has two token
+buckets, each holding up to one minute's worth and refilling continuously:
+
+- requests: a run takes one when it's admitted (and gives it back if it
+  doesn't run after all - a 409, a cached answer, a full queue),
+- tokens: a finished run is charged what the model generated (Ollama's
+  `eval_count` for each LLM call, the chunks streamed for one that was cut
+  off).  The bucket can go into debt - one long `/summarize` may cost more
+  than a minute's allowance - and the user's next run waits until it's paid
+  off.
+
+`check()` runs before every graph run and is a dict lookup plus a little
+arithmetic, so it costs microseconds.  State lives in memory; with
+`RATE_LIMIT_DB` set it's also written to SQLite every
+`RATE_LIMIT_SYNC_INTERVAL` seconds and read back at start-up, so a restart
+doesn't hand everyone a fresh allowance.  Buckets that have refilled
+completely are dropped - a new user starts full anyway.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import NamedTuple, Optional
+
+import settings
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+REJECTED = metrics.Counter("plebchat_rate_limited_total", "Graph runs refused by a per-user rate limit", ("limit",))
+CHARGED = metrics.Counter("plebchat_rate_limit_tokens_charged_total", "Generated tokens charged to users' token buckets")
+
+
+class Limited(NamedTuple):
+    limit: str  # "requests" or "tokens"
+    retry_after: float  # seconds until the run would be allowed
+
+
+class Bucket:
+    __slots__ = ("requests", "tokens", "updated")
+
+    def __init__(self, requests: float, tokens: float, updated: float):
+        self.requests = requests
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    def __init__(self, requests_per_min: float, tokens_per_min: float, path: str):
+        """
+        Args:
+            requests_per_min: Runs per user per minute (0 = unlimited)
+            tokens_per_min: Generated tokens per user per minute (0 = unlimited)
+            path: SQLite file to keep the buckets in across restarts ("" = memory only)
+        """
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self.path = path
+        self._buckets: dict[str, Bucket] = {}
+        self._dirty: set[str] = set()
+        self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_min or self.tokens_per_min)
+
+    @property
+    def users(self) -> int:
+        return len(self._buckets)
+
+    def _refill(self, user: str, now: float) -> Bucket:
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = Bucket(self.requests_per_min, self.tokens_per_min, now)
+            return bucket
+        elapsed = now - bucket.updated
+        if elapsed > 0:
+            bucket.requests = min(self.requests_per_min, bucket.requests + elapsed * self.requests_per_min / 60)
+            bucket.tokens = min(self.tokens_per_min, bucket.tokens + elapsed * self.tokens_per_min / 60)
+            bucket.updated = now
+        return bucket
+
+    ##############################################################
+    def check(self, user: Optional[str]) -> Optional[Limited]:
+        """None if `user` may start a run now (which takes one request), else which limit they hit."""
+        if not user or not self.enabled:
+            return None
+        bucket = self._refill(user, time.time())
+        if self.tokens_per_min and bucket.tokens <= 0:
+            REJECTED.inc("tokens")
+            return Limited("tokens", (1 - bucket.tokens) * 60 / self.tokens_per_min)
+        if self.requests_per_min:
+            if bucket.requests < 1:
+                REJECTED.inc("requests")
+                return Limited("requests", (1 - bucket.requests) * 60 / self.requests_per_min)
+            bucket.requests -= 1
+        self._dirty.add(user)
+        return None
+
+    def refund(self, user: Optional[str]):
+        """Give back the request an admitting `check()` took - the run didn't happen after all."""
+        if not user or not self.requests_per_min:
+            return
+        bucket = self._buckets.get(user)
+        if bucket is not None:
+            bucket.requests = min(self.requests_per_min, bucket.requests + 1)
+            self._dirty.add(user)
+
+    def charge(self, user: Optional[str], tokens: int):
+        """Take what a finished run generated out of `user`'s token bucket."""
+        if not user or not self.tokens_per_min or tokens <= 0:
+            return
+        self._refill(user, time.time()).tokens -= tokens
+        self._dirty.add(user)
+        CHARGED.inc(amount=tokens)
+
+    ##############################################################
+    async def _open(self):
+        if self._db is None:
+            import aiosqlite
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = await aiosqlite.connect(self.path)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    user TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            await db.commit()
+            self._db = db
+        return self._db
+
+    async def load(self):
+        """Read the buckets kept by an earlier run of the server."""
+        if not self.path or not self.enabled:
+            return
+        db = await self._open()
+        async with db.execute("SELECT user, requests, tokens, updated FROM rate_limits") as cursor:
+            async for user, requests, tokens, updated in cursor:
+                self._buckets[user] = Bucket(requests, tokens, updated)
+        logger.info("rate limits loaded", extra={"users": len(self._buckets)})
+
+    async def sync(self):
+        """Drop buckets that have refilled completely, and write the changed ones to disk."""
+        now = time.time()
+        full = [
+            user for user in self._buckets
+            if (b := self._refill(user, now)).requests >= self.requests_per_min and b.tokens >= self.tokens_per_min
+        ]
+        for user in full:
+            del self._buckets[user]
+        dirty, self._dirty = self._dirty, set()
+        if not self.path:
+            return
+        db = await self._open()
+        await db.executemany(
+            "INSERT OR REPLACE INTO rate_limits (user, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+            [(u, b.requests, b.tokens, b.updated) for u in dirty if (b := self._buckets.get(u)) is not None])
+        await db.executemany("DELETE FROM rate_limits WHERE user = ?", [(u,) for u in full])
+        await db.commit()
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("rate limit sync failed")
+
+    async def close(self):
+        if self.enabled:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("rate limit sync failed")
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+limiter = RateLimiter(
+    requests_per_min=settings.RATE_LIMIT_REQUESTS_PER_MIN,
+    tokens_per_min=settings.RATE_LIMIT_TOKENS_PER_MIN,
+    path=settings.RATE_LIMIT_DB,
+)
+
+metrics.Gauge("plebchat_rate_limit_users", "Users with a partly used rate limit bucket",
+              callback=lambda: {(): limiter.users})
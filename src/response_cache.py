@@ -0,0 +1,195 @@
+"""Exact-match cache of finished graph responses (opt-in with `RESPONSE_CACHE`).
+
+Open WebUI sends the same background prompts over and over - title and tag
+generation, the "Available Tools" tool-selection call - and people re-ask the
+same one-shot question.  A completed run's answer frames are kept under a hash
+of everything that decides the answer:
+
+    (graph id, model, normalized messages, sampling params)
+
+and the next identical request replays them as a normal SSE stream (the frames
+carry no ids or timestamps, so it's byte-for-byte what the graph sent) without
+queueing for a slot or touching Ollama.
+
+Entries live in memory (LRU, `RESPONSE_CACHE_MAX_MB`) and expire after
+`RESPONSE_CACHE_TTL`; with `RESPONSE_CACHE_DB` set they're also written to a
+SQLite file, which survives restarts and is read when memory misses.
+
+Only stateless runs are cached: a checkpointed chat has to run its graph so the
+reply lands in its stored history, and commands (`/random`, `/url`, ...) are
+never assumed to be deterministic.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import settings
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# Request config keys that change what the model generates
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k", "min_p", "seed", "num_predict", "num_ctx", "repeat_penalty")
+
+LOOKUPS = metrics.Counter(
+    "plebchat_response_cache_lookups_total", "Response cache lookups by result (memory / disk hit, miss)", ("graph", "result"))
+BYTES_SAVED = metrics.Counter(
+    "plebchat_response_cache_bytes_saved_total", "Response bytes replayed from the cache instead of generated", ("graph",))
+SECONDS_SAVED = metrics.Counter(
+    "plebchat_response_cache_seconds_saved_total", "Generation time the replayed responses originally took", ("graph",))
+
+
+def cache_key(graph_id: str, model: str, messages: list[dict], configurable: dict) -> str:
+    """Hash of everything that decides a run's answer.  Messages are reduced to role and trimmed content."""
+    normalized = [
+        (m.get("role", ""), m.get("content", "").strip() if isinstance(m.get("content"), str) else m.get("content"))
+        for m in messages
+    ]
+    params = {name: configurable[name] for name in SAMPLING_PARAMS if configurable.get(name) is not None}
+    blob = json.dumps([graph_id, model, normalized, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Entry:
+    __slots__ = ("frames", "size", "seconds", "expires_at")
+
+    def __init__(self, frames: list[str], seconds: float, expires_at: float):
+        self.frames = frames
+        self.size = sum(len(f) for f in frames)
+        self.seconds = seconds
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, enabled: bool, max_mb: float, ttl: float, path: str):
+        """
+        Args:
+            enabled: Off unless asked for - a cached answer is the same answer every time
+            max_mb: Memory for cached frames; least recently used entries go first beyond this
+            ttl: Seconds an entry is served for
+            path: SQLite file for the disk tier ("" = memory only)
+        """
+        self.enabled = enabled
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = ttl
+        self.path = path
+        self.size = 0
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._db = None
+        self._opening = asyncio.Lock()
+
+    def cacheable(self, messages: list[dict], checkpointed: bool) -> bool:
+        if not self.enabled or checkpointed or not messages:
+            return False
+        content = messages[-1].get("content")
+        return isinstance(content, str) and not content.lstrip().startswith("/")
+
+    ##############################################################
+    def _put_memory(self, key: str, entry: Entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def _get_memory(self, key: str) -> Optional[Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            del self._entries[key]
+            self.size -= entry.size
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _open(self):
+        async with self._opening:
+            if self._db is None:
+                import aiosqlite
+
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                db = await aiosqlite.connect(self.path)
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        frames TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )""")
+                await db.execute("CREATE INDEX IF NOT EXISTS responses_expiry ON responses (expires_at)")
+                await db.commit()
+                self._db = db
+        return self._db
+
+    ##############################################################
+    async def get(self, graph_id: str, key: str) -> Optional[Entry]:
+        """The cached answer for `key`, from memory or else from disk - None on a miss."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            LOOKUPS.inc(graph_id, "memory")
+        elif self.path:
+            try:
+                db = await self._open()
+                cursor = await db.execute(
+                    "SELECT frames, seconds, expires_at FROM responses WHERE key = ? AND expires_at >= ?", (key, time.time()))
+                row = await cursor.fetchone()
+            except Exception:
+                logger.exception("response cache read failed")
+                row = None
+            if row is not None:
+                entry = Entry(json.loads(row[0]), row[1], row[2])
+                self._put_memory(key, entry)
+                LOOKUPS.inc(graph_id, "disk")
+
+        if entry is None:
+            LOOKUPS.inc(graph_id, "miss")
+            return None
+        BYTES_SAVED.inc(graph_id, amount=entry.size)
+        SECONDS_SAVED.inc(graph_id, amount=entry.seconds)
+        return entry
+
+    async def put(self, key: str, frames: list[str], seconds: float):
+        """Keep a completed run's answer frames (`seconds` = how long generating them took)."""
+        entry = Entry(frames, seconds, time.time() + self.ttl)
+        self._put_memory(key, entry)
+        if not self.path:
+            return
+        try:
+            db = await self._open()
+            await db.execute(
+                "INSERT OR REPLACE INTO responses (key, frames, seconds, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(frames), seconds, entry.expires_at))
+            await db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            await db.commit()
+        except Exception:
+            logger.exception("response cache write failed")
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+cache = ResponseCache(
+    enabled=settings.RESPONSE_CACHE,
+    max_mb=settings.RESPONSE_CACHE_MAX_MB,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    path=settings.RESPONSE_CACHE_DB,
+)
+
+metrics.Gauge("plebchat_response_cache_bytes", "Bytes of cached responses held in memory",
+              callback=lambda: {(): cache.size})
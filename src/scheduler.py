@@ -0,0 +1,138 @@
+"""Admission control for graph runs.
+
+Every POST to `/graph/{graph_id}` asks the scheduler for a ticket before the
+graph starts.  A run is admitted right away when both its graph and its LLM
+model are under their concurrency limits; otherwise it waits (FIFO) in a
+bounded queue.  When the queue is full the request is turned away so the
+caller can retry later instead of piling more streams onto Ollama.
+"""
+
+import asyncio
+from collections import Counter
+from typing import AsyncIterator, Optional
+
+import settings
+import metrics
+
+
+class QueueFull(Exception):
+    """Raised when a run can't start now and the wait queue is already full."""
+
+
+class RunTicket:
+    """A single graph run's place in the scheduler."""
+    __slots__ = ("graph_id", "model", "admitted", "released", "_wakeup")
+
+    def __init__(self, graph_id: str, model: str):
+        self.graph_id = graph_id
+        self.model = model
+        self.admitted = False
+        self.released = False
+        self._wakeup = asyncio.Event()
+
+
+class RunScheduler:
+    def __init__(self, max_per_graph: int, max_per_model: int, max_queued: int):
+        """
+        Args:
+            max_per_graph: Runs allowed at once for one graph id (0 = unlimited)
+            max_per_model: Runs allowed at once for one LLM model (0 = unlimited)
+            max_queued: Runs allowed to wait for a slot before new ones are rejected
+        """
+        self.max_per_graph = max_per_graph
+        self.max_per_model = max_per_model
+        self.max_queued = max_queued
+
+        self._running_graph: Counter = Counter()
+        self._running_model: Counter = Counter()
+        self._waiting: list[RunTicket] = []
+
+    @property
+    def running(self) -> int:
+        return sum(self._running_graph.values())
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def _fits(self, ticket: RunTicket) -> bool:
+        if self.max_per_graph and self._running_graph[ticket.graph_id] >= self.max_per_graph:
+            return False
+        if self.max_per_model and self._running_model[ticket.model] >= self.max_per_model:
+            return False
+        return True
+
+    def _start(self, ticket: RunTicket):
+        ticket.admitted = True
+        self._running_graph[ticket.graph_id] += 1
+        self._running_model[ticket.model] += 1
+        ticket._wakeup.set()
+
+    ##############################################################
+    def admit(self, graph_id: str, model: str) -> RunTicket:
+        """Get a ticket for a run, admitting it immediately if there is room.
+
+        Raises:
+            QueueFull: if the run has to wait and the wait queue is full
+        """
+        ticket = RunTicket(graph_id, model)
+        # Don't let new arrivals jump a queue that is waiting on the same limits
+        if self._fits(ticket) and not any(
+                t.graph_id == graph_id or t.model == model for t in self._waiting):
+            self._start(ticket)
+            return ticket
+
+        if len(self._waiting) >= self.max_queued:
+            raise QueueFull(f"{len(self._waiting)} runs already waiting")
+
+        self._waiting.append(ticket)
+        return ticket
+
+    async def wait(self, ticket: RunTicket) -> AsyncIterator[int]:
+        """Wait until the ticket is admitted, yielding the number of runs ahead of it whenever that changes."""
+        last_ahead: Optional[int] = None
+        while not ticket.admitted:
+            ahead = self._waiting.index(ticket)
+            if ahead != last_ahead:
+                last_ahead = ahead
+                yield ahead
+            ticket._wakeup.clear()
+            await ticket._wakeup.wait()
+
+    def release(self, ticket: RunTicket):
+        """Give back a ticket's slot (or its place in the queue).  Safe to call more than once."""
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if ticket.admitted:
+            self._running_graph[ticket.graph_id] -= 1
+            self._running_model[ticket.model] -= 1
+        else:
+            self._waiting.remove(ticket)
+
+        # Admit whatever fits now, oldest first.  A run blocked on a busy graph
+        # doesn't hold back a run for a different graph and model.
+        still_waiting = []
+        for waiting in self._waiting:
+            if self._fits(waiting):
+                self._start(waiting)
+            else:
+                still_waiting.append(waiting)
+        self._waiting = still_waiting
+
+        # Everyone left in line moved up (or might have) - let them report their new position
+        for waiting in self._waiting:
+            waiting._wakeup.set()
+
+
+scheduler = RunScheduler(
+    max_per_graph=settings.MAX_RUNS_PER_GRAPH,
+    max_per_model=settings.MAX_RUNS_PER_MODEL,
+    max_queued=settings.MAX_QUEUED_RUNS,
+)
+
+metrics.Gauge("plebchat_scheduler_running_runs", "Graph runs holding a scheduler slot",
+              callback=lambda: {(): scheduler.running})
+metrics.Gauge("plebchat_scheduler_queued_runs", "Graph runs waiting for a scheduler slot",
+              callback=lambda: {(): scheduler.queued})
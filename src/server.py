@@ -1,16 +1,48 @@
-import json
+import math
+import time
+import uuid
 import asyncio
+import logging
 import traceback
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import Annotated, List, Dict, Any, Optional
-
-from fastapi import FastAPI, Body
-from fastapi.responses import StreamingResponse
-
+from typing import Annotated, List, Dict, Any, Literal, Optional
+
+from fastapi import FastAPI, Body, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
+
+import settings
+import metrics
+import tracing
+import http_client
+from logs import configure_logging, lazy_json
+from graphs import all_graphs, graph_registry
 from graphs.common import NodeOutputType
-from helpers import content_tokens, newlines, thinking_tokens, thinking_newline, emit_event
+from graphs.config import run_config
+from graphs import prompts
+from encoder import (
+    content_frame, thinking_frame, emit_event, is_delta_frame,
+    NEWLINES_FRAME, THINKING_NEWLINE_FRAME,
+    STREAM_START_FRAME, STREAM_STOP_FRAME, STREAM_ERROR_FRAME,
+)
+from scheduler import scheduler, QueueFull
+from model_catalog import catalog
+from checkpoints import store as checkpoints, TURNS, HISTORY_MISMATCHES
+from response_cache import cache as response_cache, cache_key
+import auxiliary
+from warmup import warmup
+from ollama_pool import pool as ollama_pool
+from rate_limits import limiter as rate_limiter, Limited
+from streaming import (
+    TokenCoalescer, EventPump, ClientDisconnected, CONTENT, THOUGHT, TICK,
+    record_completed_run, record_cancelled_run,
+)
 
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Define Pydantic models for request validation
 class Message(BaseModel):
     role: str
@@ -20,209 +52,478 @@ class GraphRequest(BaseModel):
     query: Optional[str] = None
     messages: List[dict]
     config: Optional[Dict[str, Any]] = Field(default_factory=dict)
-
+    # Open WebUI's chat id - with it the conversation is checkpointed on the server (see checkpoints.py)
+    chat_id: Optional[str] = None
+    # Hash of the history the client has *before* `messages` - set when `messages` holds only the new turn
+    history_hash: Optional[str] = None
+    # Open WebUI's `metadata.task` for its background prompts (title_generation, ...) - None for a chat turn
+    task: Optional[str] = None
+    # False when the client wants one JSON chat completion instead of an SSE stream (auxiliary requests only)
+    stream: Optional[bool] = None
+    # Open WebUI's user ({"id", "name", "role"}) - LLM calls are shared fairly between users
+    user: Optional[Dict[str, Any]] = None
+    # Priority class of the run's LLM calls (see dispatcher.py) - default interactive, background for auxiliary requests
+    priority: Optional[Literal["interactive", "background", "batch"]] = None
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models into Ollama and compile graphs in the background - /health answers right away, /ready once it's done
+    warming = asyncio.create_task(warmup.run())
+    pruning = asyncio.create_task(checkpoints.prune_forever(settings.CHECKPOINT_PRUNE_INTERVAL)) if checkpoints.enabled else None
+    # Keep track of which Ollama hosts are up and what they have loaded (OLLAMA_HOSTS)
+    probing = asyncio.create_task(ollama_pool.run()) if ollama_pool.enabled else None
+    # Per-user rate limits: pick up where the last run left off, keep the state on disk from here on
+    syncing = None
+    if rate_limiter.enabled:
+        await rate_limiter.load()
+        syncing = asyncio.create_task(rate_limiter.run(settings.RATE_LIMIT_SYNC_INTERVAL))
+    yield
+    warming.cancel()
+    for task in (pruning, probing, syncing):
+        if task is not None:
+            task.cancel()
+    await rate_limiter.close()
+    await checkpoints.close()
+    await response_cache.close()
+    catalog.close()
+    await http_client.aclose()
 
 
 app = FastAPI(
     title="PlebChat Agents API",
     description="A collection of agents, implemented with LangGraph",
+    lifespan=lifespan,
 )
 
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint for Docker healthcheck"""
+    """Liveness check - the process is up and serving requests"""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+def readiness_check():
+    """Readiness check for the Docker healthcheck / load balancer - 503 until models and graphs are warm"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/runs", response_class=PlainTextResponse)
+def get_recent_runs():
+    """Recently finished graph runs (newest first), see /debug/runs/{run_id} for the waterfall"""
+    lines = [f"{'run id':<34} {'graph':<10} {'ms':>9}  status"]
+    for run_id, trace in reversed(tracing.RECENT.items()):
+        status = trace.root.error or "ok"
+        lines.append(f"{run_id:<34} {trace.root.attributes.get('graph', ''):<10} {trace.root.duration_ms:>9.1f}  {status}")
+    return "\n".join(lines) + "\n"
+
+
+@app.get("/debug/runs/{run_id}", response_class=PlainTextResponse)
+def get_run_waterfall(run_id: str):
+    """Waterfall of one recent graph run's spans"""
+    trace = tracing.RECENT.get(run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Run '{run_id}' not found (only the last {settings.TRACE_KEEP_RUNS} are kept)")
+    return tracing.render_waterfall(trace)
+
+
 @app.get("/graphs")
 async def get_graphs():
-    from graphs import all_graphs
     return all_graphs
 
-OLLAMA_HOST = "http://host.docker.internal:11434"
-
-
 @app.get("/models")
-async def get_models():
-    import requests
-    
+async def get_models(details: bool = False):
+    """Ollama's chat model names - with `?details=true`, their size, quantization and whether they're loaded right now"""
     try:
-        ollama_url = f"{OLLAMA_HOST}/api/tags"
+        models = await catalog.get()
+        return models if details else [m["name"] for m in models]
+    except Exception as e:
+        logger.warning("error fetching Ollama models: %s", e)
+        return {"error": f"Failed to fetch Ollama models: {str(e)}"}
 
-        response = requests.get(ollama_url)
-        response.raise_for_status()
 
-        # Extract the model names from the Ollama response
-        ollama_data = response.json()
-        models = []
+@app.get("/backends")
+def get_backends():
+    """The Ollama host pool - each host's health, calls in flight and loaded models (empty without OLLAMA_HOSTS)"""
+    return ollama_pool.status()
 
-        for model in ollama_data['models']:
-            if 'embed' not in model['name']: # skip some embedding models
-                models.append( model['name'] )
 
-        return models
-    except Exception as e:
-        print(f"Error fetching Ollama models: {str(e)}")
-        return {"error": f"Failed to fetch Ollama models: {str(e)}"}
+@app.post("/llms/invalidate")
+def invalidate_llm_clients(model: Optional[str] = None):
+    """Drop cached LLM clients (all, or just one model's) - the pipeline calls this when its valves change"""
+    if not any(graph_registry.is_loaded(g) for g in graph_registry):
+        return {"evicted": 0}  # no graph has run, so nothing is cached (and no need to import langchain)
+    from graphs.llm import invalidate_llms
+    return {"evicted": invalidate_llms(model=model)}
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache, no-transform",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+    "X-Accel-Buffering": "no",  # Disable buffering in Nginx
+    "Transfer-Encoding": "chunked",
+}
+
+
+async def replay(frames: list[str]):
+    """An answer that's already complete (cached, or from the auxiliary fast path), framed like a live run's stream."""
+    yield STREAM_START_FRAME
+    yield emit_event("Running...", False)
+    for frame in frames:
+        yield frame
+    yield emit_event("", True)
+    yield STREAM_STOP_FRAME
+
+
+async def rate_limited(limited: Limited):
+    """The stream a run refused by a rate limit gets instead of an answer."""
+    what = "chats" if limited.limit == "requests" else "generated text"
+    wait = math.ceil(limited.retry_after)
+    yield STREAM_START_FRAME
+    yield emit_event("⏳ Rate limit reached", True)
+    yield content_frame(f"You've reached your limit of {what} per minute. Please try again in {wait} seconds.")
+    yield STREAM_ERROR_FRAME
+
+
+# Cache writes still running - the event loop only keeps weak references to tasks
+_cache_writes: set[asyncio.Task] = set()
 
 
+async def cache_on_completion(stream, key: str):
+    """Pass a run's frames through, and cache its answer frames if the run completes."""
+    started = time.monotonic()
+    answer = []
+    async for frame in stream:
+        if is_delta_frame(frame):
+            answer.append(frame)
+        yield frame
+        if frame == STREAM_STOP_FRAME:
+            # The client has its last frame already - the write (maybe to SQLite) happens off the stream
+            write = asyncio.create_task(response_cache.put(key, answer, time.monotonic() - started))
+            _cache_writes.add(write)
+            write.add_done_callback(_cache_writes.discard)
+
 
 @app.post("/graph/{graph_id}")
-async def stream(graph_id: str, request: GraphRequest):
-
-    print("*"*30)
-    print("POST REQUEST TO THE GRAPH ENDPOINT")
-    print("*"*30)
-    
-    # Detect if this is a tool selection call or a regular chat call
-    is_tool_selection = False
-    if request.messages and len(request.messages) >= 2:
-        if request.messages[0].get('role') == 'system' and 'Available Tools' in request.messages[0].get('content', ''):
-            is_tool_selection = True
-    
-    print(f"REQUEST TYPE: {'TOOL SELECTION' if is_tool_selection else 'REGULAR CHAT'}")
-    print("*"*30)
-    
-    print(f"MESSAGES:")
-    for m in request.messages:
-        print(json.dumps(m, indent=2))
-    print(f"CONFIG:")
-    print(json.dumps(request.config, indent=2))
+async def stream(graph_id: str, request: GraphRequest, http_request: Request):
+
+    # Detect OUI's background prompts (title, tags, follow-ups, tool selection) vs. a regular chat call
+    auxiliary_kind = auxiliary.classify(request.messages, request.task)
+
+    logger.info("graph request", extra={
+        "graph": graph_id,
+        "type": auxiliary_kind or request.task or "chat",
+        "messages": len(request.messages),
+    })
+    # NOTE: arguments are only rendered if DEBUG is enabled for this module
+    logger.debug("messages: %s", lazy_json(request.messages, indent=2))
+    logger.debug("config: %s", lazy_json(request.config, indent=2))
     if request.query:
-        print(f"Query: {request.query}")
-    print("*"*30)
-
+        logger.debug("query: %s", request.query)
 
-    from graphs import graph_registry
 
     # Check if the requested graph exists
     if graph_id not in graph_registry:
         return {"error": f"Graph with ID '{graph_id}' not found"}
 
-    # Get the appropriate graph based on the ID
-    agent = graph_registry[graph_id]
+    metrics.REQUESTS.inc(graph_id)
+
+    # Resolve the valves once for the whole run - every node reads this same Config
+    config = run_config(request.config or {})
+    model = config["configurable"]["LLM_MODEL"]
+    # Who the run is for and how urgent it is - the dispatcher orders LLM calls by these
+    # (any OUI task is background work - with or without a fast-path prompt for it in `auxiliary.TASKS`)
+    config["configurable"]["priority"] = request.priority or ("background" if request.task or auxiliary_kind else "interactive")
+    config["configurable"]["user"] = str((request.user or {}).get("id") or "")
+    # OUI's background prompts carry the chat's id too - they must never touch its stored thread
+    checkpointed = bool(request.chat_id and checkpoints.enabled and not request.task and auxiliary_kind is None)
+
+    # Per-user rate limits - a user over their share gets a clean error instead of a run.  Checked before
+    # anything else is done for the run: a refused full-history turn mustn't have reset the chat's thread,
+    # and background prompts count too, whether the fast path or the graph answers them
+    user_id = config["configurable"]["user"]
+    limited = rate_limiter.check(user_id)
+    if limited is not None:
+        logger.info("rate limited", extra={"graph": graph_id, "user": user_id, "limit": limited.limit})
+        return StreamingResponse(rate_limited(limited), media_type="text/event-stream",
+                                 headers={**SSE_HEADERS, "Retry-After": str(math.ceil(limited.retry_after))})
+
+    # Background prompts don't need the graph (or the big model) - one answer straight from Ollama
+    if auxiliary_kind is not None and settings.AUX_FAST_PATH:
+        try:
+            result = await auxiliary.answer(auxiliary_kind, request.messages, config["configurable"])
+        except Exception as e:
+            logger.warning("auxiliary fast path failed, running the graph: %s", e, extra={"graph": graph_id, "kind": auxiliary_kind})
+        else:
+            rate_limiter.charge(user_id, result["output_tokens"])
+            if request.stream is False:
+                return JSONResponse(auxiliary.completion(result))
+            return StreamingResponse(replay([content_frame(result["content"])]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    # Until the run is admitted it can still be turned away (a 409, a full queue) or fail (loading the graph,
+    # the checkpoint store) - the request `check()` took goes back to the user then
+    try:
+        # An identical stateless request already answered - replay it without queueing or running anything
+        key = None
+        if request.history_hash is None and response_cache.cacheable(request.messages, checkpointed):
+            key = cache_key(graph_id, model, request.messages, config["configurable"])
+            cached = await response_cache.get(graph_id, key)
+            if cached is not None:
+                logger.info("response cache hit", extra={"graph": graph_id, "bytes": cached.size})
+                rate_limiter.refund(user_id)  # a replay isn't a run
+                return StreamingResponse(replay(cached.frames), media_type="text/event-stream", headers=SSE_HEADERS)
+
+        # Get the appropriate graph based on the ID (imported and compiled on first use)
+        agent = await graph_registry.load(graph_id)
+
+        # Checkpointed chats: earlier turns come from the server's copy, the client only sends what's new
+        thread_id = None
+        if checkpointed:
+            thread_id = f"{graph_id}:{request.chat_id}"
+            if request.history_hash is not None:
+                expected = await checkpoints.expected_hash(thread_id)
+                if expected != request.history_hash:
+                    HISTORY_MISMATCHES.inc(graph_id)
+                    raise HTTPException(status_code=409, detail="History mismatch - resend the full history")
+                TURNS.inc(graph_id, "delta")
+            else:
+                await checkpoints.reset(thread_id)
+                prompts.forget(thread_id)
+                TURNS.inc(graph_id, "full")
+            agent = await graph_registry.load_checkpointed(graph_id, await checkpoints.saver())
+            config["configurable"]["thread_id"] = thread_id
+        else:
+            if request.history_hash is not None:
+                # Nothing stored to append to - only a full history will do.  With checkpointing off that's
+                # true of every request, and the header tells the pipeline to stop sending deltas
+                raise HTTPException(status_code=409, detail="This request needs the full history",
+                                    headers={"X-Checkpoints": "on" if checkpoints.enabled else "off"})
+            TURNS.inc(graph_id, "stateless")
+
+        # Admission control - either we get a slot (now or after queueing) or the client is told to come back later
+        try:
+            ticket = scheduler.admit(graph_id, model)
+        except QueueFull as e:
+            logger.warning("rejecting run: %s", e, extra={"graph": graph_id, "model": model})
+            metrics.REJECTED.inc(graph_id, model)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Server is busy ({e}), please try again shortly",
+                headers={"Retry-After": str(settings.RETRY_AFTER_SECONDS)},
+            )
+    except BaseException:
+        rate_limiter.refund(user_id)
+        raise
+
+    # `updates` are only consumed by the debug log - don't make the graph produce them otherwise
+    stream_mode = ["messages", "custom"]
+    if logger.isEnabledFor(logging.DEBUG):
+        stream_mode.append("updates")
+
+    async def run_graph():
+        """Wait for our turn, then run the graph - all inside the EventPump so a disconnect cancels either."""
+        async for ahead in scheduler.wait(ticket):
+            yield "queued", ahead
+        yield "running", None
+
+        # Format input according to the State model structure
+        input_state = {
+            "messages": request.messages,
+            "query": request.query
+        }
+
+        # `astream` runs the graph on this event loop, so other chats (and /health) interleave with this one
+        if thread_id is None:
+            items = agent.astream(input=input_state, config=config, stream_mode=stream_mode)
+        else:
+            # One checkpoint when the run ends, instead of one per step (each one holds the whole history)
+            await checkpoints.begin_turn(thread_id)
+            items = agent.astream(input=input_state, config=config, stream_mode=stream_mode, durability="exit")
+        async for item in items:
+            yield item
+
+    run_id = uuid.uuid4().hex
 
     async def event_stream():
+        trace = tracing.start_trace(run_id, "graph.run", graph=graph_id, model=model, messages=len(request.messages),
+                                    priority=config["configurable"]["priority"])
+        run_error = None
+
         # Start the stream with an empty delta to initialize the connection
-        stream_start_msg = {
-            'choices': [
-                {
-                    'delta': {}, 
-                    'finish_reason': None
-                }
-            ]
-        }
-        yield f"data: {json.dumps(stream_start_msg)}\n\n"
+        yield STREAM_START_FRAME
         # await asyncio.sleep(0)  # Force flush
 
-        yield emit_event("Running...", False)
-        await asyncio.sleep(0)  # Force flush
-
         current_node = None
-        
+        coalescer = TokenCoalescer()
+        started = time.monotonic()
+        first_token_at = None
+        # What the rate limit charges: Ollama's eval_count for each LLM call that finished, and the
+        # chunks streamed so far (about a token each) for one cut off before its final chunk
+        generated = 0
+        unfinished_chunks = 0
+        metrics.INFLIGHT.inc(graph_id)
+
         try:
-            # Format input according to the State model structure
-            input_state = {
-                "messages": request.messages,
-                "query": request.query
-            }
-            
-            for event, data in agent.stream(input=input_state, config=request.config, stream_mode=["messages", "custom", "updates"]):
-
-                if event == "updates":
-                    # we will just pretty print the state for debugging
-                    print('$'*30)
-                    print("!!! STATE UPDATE !!!")
-                    print(json.dumps(data, indent=2))
-                    print('$'*30)
-
-                if event == "custom":
-                    content_type = data['type']
-                    msg = data['content']
-
-                    if content_type == "thought":
-                        yield f"data: {json.dumps(thinking_newline())}\n\n"
-                        yield f"data: {json.dumps( thinking_tokens( msg ) )}\n\n"
-                    else:
-                        yield f"data: {json.dumps(newlines())}\n\n"
-                        yield f"data: {json.dumps( content_tokens( msg ) )}\n\n"
-
-                if event == "messages":
-                    reply_content = data[0]
-                    metadata = data[1]
-
-                    # Handle node change
-                    if current_node != metadata["langgraph_node"]:
-                        current_node = metadata["langgraph_node"]
-                        print(f"node: {current_node}")
-                        nice_node_name = current_node.replace('_', ' ')
-                        yield emit_event(f"Running... {nice_node_name}", False)
-                        await asyncio.sleep(0)  # Force flush
-
-                    if hasattr(reply_content, 'content') and reply_content.content:
-                        # print(reply_content.content) #  show tokens as they stream
-
-                        if 'node_output_type' in metadata and metadata['node_output_type'] == NodeOutputType.THOUGHT:
-                            content_msg = thinking_tokens(reply_content.content)
-                        else:
-                            content_msg = content_tokens(reply_content.content)
+            async with EventPump(run_graph(), is_disconnected=http_request.is_disconnected) as events:
+                async for event, data in events:
+
+                    if event == "queued":
+                        yield emit_event(f"Queued ({data} ahead)", False)
+
+                    if event == "running":
+                        started = time.monotonic()
+                        trace.root.set(queued_ms=round(trace.root.duration_ms, 1))
+                        yield emit_event("Running...", False)
+
+                    if event == TICK:
+                        # the model went quiet - don't sit on the tokens we've got
+                        for frame in coalescer.flush():
+                            yield frame
 
-                        yield f"data: {json.dumps(content_msg)}\n\n"
-                        await asyncio.sleep(0)
+                    if event == "updates":
+                        logger.debug("state update: %s", lazy_json(data, indent=2))
+
+                    if event == "custom":
+                        for frame in coalescer.flush():
+                            yield frame
+
+                        content_type = data['type']
+                        msg = data['content']
+
+                        if content_type == "thought":
+                            yield THINKING_NEWLINE_FRAME
+                            yield thinking_frame(msg)
+                        else:
+                            yield NEWLINES_FRAME
+                            yield content_frame(msg)
+
+                    if event == "messages":
+                        reply_content = data[0]
+                        metadata = data[1]
+
+                        # Handle node change
+                        if current_node != metadata["langgraph_node"]:
+                            for frame in coalescer.flush():
+                                yield frame
+                            current_node = metadata["langgraph_node"]
+                            logger.debug("node: %s", current_node, extra={"graph": graph_id})
+                            nice_node_name = current_node.replace('_', ' ')
+                            yield emit_event(f"Running... {nice_node_name}", False)
+                            await asyncio.sleep(0)  # Force flush
+
+                        if hasattr(reply_content, 'content') and reply_content.content:
+                            # print(reply_content.content) #  show tokens as they stream
+
+                            if 'node_output_type' in metadata and metadata['node_output_type'] == NodeOutputType.THOUGHT:
+                                kind = THOUGHT
+                            else:
+                                kind = CONTENT
+
+                            if first_token_at is None:
+                                first_token_at = time.monotonic()
+                                metrics.TTFT.observe(first_token_at - started, graph_id, model)
+
+                            # tokens are batched into frames by time/size (see SSE_FLUSH_MS / SSE_FLUSH_BYTES)
+                            for frame in coalescer.push(kind, reply_content.content):
+                                yield frame
+                            unfinished_chunks += 1
+
+                        # An LLM call's final chunk carries Ollama's counters
+                        eval_count = (getattr(reply_content, "response_metadata", None) or {}).get("eval_count")
+                        if eval_count is not None:
+                            generated += eval_count
+                            unfinished_chunks = 0
+
+                    events.tick_at(coalescer.deadline)
+
+            for frame in coalescer.flush():
+                yield frame
+
+            if thread_id is not None:
+                # Before the stream ends, so the client's next turn already finds the new hash
+                snapshot = await agent.aget_state(config)
+                await checkpoints.finish_turn(thread_id, snapshot.values.get("messages", []))
 
             # yield emit_event("Completed", True)
             yield emit_event("", True)
             
             # End of the stream - moved outside the for loop
-            stream_end_msg = {
-                'choices': [
-                    {
-                        'delta': {},
-                        'finish_reason': 'stop'
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(stream_end_msg)}\n\n"
-
+            yield STREAM_STOP_FRAME
+
+            finished = time.monotonic()
+            record_completed_run(graph_id, finished - started)
+            metrics.STREAM_DURATION.observe(finished - started, graph_id, model)
+            if first_token_at is not None and finished > first_token_at:
+                metrics.TOKENS_PER_SECOND.observe(coalescer.tokens_received / (finished - first_token_at), graph_id, model)
+
+        except (ClientDisconnected, asyncio.CancelledError, GeneratorExit) as e:
+            # The client is gone (Open WebUI's stop button, a closed tab...).  Leaving the
+            # EventPump already cancelled the graph run and closed the Ollama stream.
+            run_error = "client disconnected"
+            saved = record_cancelled_run(graph_id, time.monotonic() - started)
+            logger.info("client disconnected, run cancelled", extra={"graph": graph_id, "est_seconds_saved": round(saved, 2)})
+            if not isinstance(e, ClientDisconnected):
+                raise
 
         except Exception as e:
+            logger.exception("graph run failed", extra={"graph": graph_id})
+            metrics.ERRORS.inc(graph_id)
+            run_error = f"{type(e).__name__}: {e}"
+
+            # Whatever made it out of the model before the failure still belongs to the user
+            for frame in coalescer.flush():
+                yield frame
+
             # Capture the error and send it to the frontend
             error_msg = str(e)
             stack_trace = traceback.format_exc()
 
             # Send the error as a content message to the frontend
             error_content = f"⚠️ Error in graph execution: {error_msg}"
-            yield f"data: {json.dumps(content_tokens(error_content))}\n\n"
-            yield f"data: {json.dumps(newlines())}\n\n"
+            yield content_frame(error_content)
+            yield NEWLINES_FRAME
 
             #TODO: ONLY IN DEBUG MODE!!! OTherwise we expose the working code of our app...
             error_content = f"```{stack_trace}```"
-            yield f"data: {json.dumps(content_tokens(error_content))}\n\n"
+            yield content_frame(error_content)
 
             # End the stream with an error finish reason
-            error_end_msg = {
-                'choices': [
-                    {
-                        'delta': {},
-                        'finish_reason': 'error'
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(error_end_msg)}\n\n"
+            yield STREAM_ERROR_FRAME
             yield emit_event("Graph error!", True)
 
+        finally:
+            scheduler.release(ticket)
+            metrics.INFLIGHT.dec(graph_id)
+            coalescer.record()
+            rate_limiter.charge(user_id, generated + unfinished_chunks)
+            tracing.finish_trace(trace, error=run_error, token_chunks=coalescer.tokens_received)
+            logger.info("stream done", extra={
+                "graph": graph_id,
+                "token_chunks": coalescer.tokens_received,
+                "frames": coalescer.frames_emitted,
+            })
+
 
+    frames = event_stream() if key is None else cache_on_completion(event_stream(), key)
     return StreamingResponse(
-        event_stream(),
+        frames,
         media_type="text/event-stream",
         headers={
-            "Cache-Control": "no-cache, no-transform",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-            "X-Accel-Buffering": "no",  # Disable buffering in Nginx
-            "Transfer-Encoding": "chunked"
-        }
+            **SSE_HEADERS,
+            "X-Run-Id": run_id,  # see /debug/runs/{run_id}
+        },
+        # in case the stream never gets iterated (client gone before the first byte) - release is idempotent
+        background=BackgroundTask(scheduler.release, ticket),
     )
 
 
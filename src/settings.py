@@ -0,0 +1,222 @@
+"""Server-wide settings, read from the environment once at import time.
+
+These are operational knobs for the server itself - per-chat settings live in
+`graphs.config.Config` and are driven by the pipeline valves.
+"""
+
+import os
+
+
+def _int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+def _bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+OLLAMA_BASE_URL = _str("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
+LLM_MODEL = _str("LLM_MODEL", "llama3.1:8b")
+
+
+############################################################################
+# ADMISSION CONTROL
+############################################################################
+# Graph runs allowed to execute at once for a single graph id / a single LLM model (0 = unlimited)
+MAX_RUNS_PER_GRAPH = _int("MAX_RUNS_PER_GRAPH", 4)
+MAX_RUNS_PER_MODEL = _int("MAX_RUNS_PER_MODEL", 2)
+# Runs allowed to wait for a slot; anything beyond this is turned away with a 429
+MAX_QUEUED_RUNS = _int("MAX_QUEUED_RUNS", 16)
+# Value of the `Retry-After` header sent with a 429
+RETRY_AFTER_SECONDS = _int("RETRY_AFTER_SECONDS", 5)
+
+
+############################################################################
+# LLM DISPATCH
+############################################################################
+# LLM calls allowed at once per Ollama host - set to its OLLAMA_NUM_PARALLEL so calls queue here, in priority
+# order, instead of in Ollama (0 = off).  Keep MAX_RUNS_PER_MODEL above it, or runs wait in admission first.
+LLM_SLOTS = _int("LLM_SLOTS", 0)
+# Share of the slots for each priority class while calls of several classes wait
+LLM_PRIORITY_WEIGHTS = _str("LLM_PRIORITY_WEIGHTS", "interactive=8,background=2,batch=1")
+# Seconds after which a waiting call is served next whatever its priority (no starving background work)
+LLM_MAX_WAIT = _float("LLM_MAX_WAIT", 30)
+
+
+############################################################################
+# RATE LIMITS
+############################################################################
+# Graph runs each user may start per minute, and model tokens they may generate per minute (0 = no limit).
+# Bursts up to a full minute's worth are allowed; requests without a user aren't limited.
+RATE_LIMIT_REQUESTS_PER_MIN = _float("RATE_LIMIT_REQUESTS_PER_MIN", 0)
+RATE_LIMIT_TOKENS_PER_MIN = _float("RATE_LIMIT_TOKENS_PER_MIN", 0)
+# SQLite file the limits' state is kept in across restarts ("" = memory only), written every RATE_LIMIT_SYNC_INTERVAL seconds
+RATE_LIMIT_DB = _str("RATE_LIMIT_DB", "")
+RATE_LIMIT_SYNC_INTERVAL = _float("RATE_LIMIT_SYNC_INTERVAL", 10)
+
+
+############################################################################
+# SSE FRAMING
+############################################################################
+# Consecutive token chunks are batched into one SSE frame until the oldest has waited this long...
+SSE_FLUSH_MS = _int("SSE_FLUSH_MS", 20)
+# ...or this much text (in characters) is buffered.  SSE_FLUSH_MS=0 sends every chunk in its own frame.
+SSE_FLUSH_BYTES = _int("SSE_FLUSH_BYTES", 2048)
+# How often a running stream checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = _float("DISCONNECT_POLL_SECONDS", 0.5)
+
+
+############################################################################
+# LOGGING
+############################################################################
+LOG_LEVEL = _str("LOG_LEVEL", "INFO")
+# Per-module overrides, e.g. "server=DEBUG,graphs.fren=DEBUG"
+LOG_LEVELS = _str("LOG_LEVELS", "")
+# "text" (key=value) or "json"
+LOG_FORMAT = _str("LOG_FORMAT", "text")
+
+
+############################################################################
+# TRACING
+############################################################################
+# Append finished run traces to this file as OTLP/JSON lines (empty = don't export)
+TRACE_FILE = _str("TRACE_FILE", "")
+# Finished traces kept in memory for /debug/runs
+TRACE_KEEP_RUNS = _int("TRACE_KEEP_RUNS", 50)
+
+
+############################################################################
+# OLLAMA MODEL LIST
+############################################################################
+# How long the /models list is considered fresh; after that it's served stale while a refresh runs
+MODELS_CACHE_TTL = _float("MODELS_CACHE_TTL", 30)
+# Timeout (seconds) for Ollama's /api/tags and /api/ps
+OLLAMA_API_TIMEOUT = _float("OLLAMA_API_TIMEOUT", 5)
+
+
+############################################################################
+# OLLAMA HOST POOL
+############################################################################
+# Ollama base URLs to spread the graphs' LLM calls over, comma separated (empty = only OLLAMA_BASE_URL / the valve)
+OLLAMA_HOSTS = _str("OLLAMA_HOSTS", "")
+# Seconds between checking every host's models and what it has loaded
+OLLAMA_PROBE_INTERVAL = _float("OLLAMA_PROBE_INTERVAL", 10)
+# Seconds a host that failed gets no traffic before it's probed again
+OLLAMA_EJECT_SECONDS = _float("OLLAMA_EJECT_SECONDS", 30)
+# Hedge a chat reply: with no first token after this many seconds the same request also goes to another host,
+# the first to answer is used and the other cancelled (0 = off; needs at least two OLLAMA_HOSTS)
+LLM_HEDGE_AFTER = _float("LLM_HEDGE_AFTER", 0)
+
+
+############################################################################
+# GRAPHS
+############################################################################
+# Import and compile every graph in the background at start-up (otherwise each one loads on its first request)
+GRAPH_WARMUP = _bool("GRAPH_WARMUP", True)
+# Characters of a command's output (e.g. a scraped page) shown as a thought before the LLM works on it (0 = all)
+COMMAND_PREVIEW_CHARS = _int("COMMAND_PREVIEW_CHARS", 1500)
+
+
+############################################################################
+# WARM-UP / READINESS
+############################################################################
+# Models loaded into Ollama at start-up, comma separated (empty = none).  /ready waits for them.
+WARMUP_MODELS = _str("WARMUP_MODELS", LLM_MODEL)
+# keep_alive sent with the warm-up, same values as the pipeline's KEEP_ALIVE valve ("5m", "-1" = forever)
+KEEP_ALIVE = _str("KEEP_ALIVE", "5m")
+# Timeout (seconds) for loading one model - a cold load of a large model can take minutes
+WARMUP_TIMEOUT = _float("WARMUP_TIMEOUT", 300)
+# Seconds between warm-up attempts while Ollama can't be reached
+WARMUP_RETRY_SECONDS = _float("WARMUP_RETRY_SECONDS", 15)
+
+
+############################################################################
+# OUTBOUND HTTP
+############################################################################
+# Connections open at once to a single upstream host (Ollama, SearXNG, a fetched web page)...
+HTTP_MAX_CONNECTIONS_PER_HOST = _int("HTTP_MAX_CONNECTIONS_PER_HOST", 20)
+# ...of which this many are kept alive while idle, for this many seconds
+HTTP_MAX_KEEPALIVE_PER_HOST = _int("HTTP_MAX_KEEPALIVE_PER_HOST", 10)
+HTTP_KEEPALIVE_EXPIRY = _float("HTTP_KEEPALIVE_EXPIRY", 60)
+# Hosts with an open connection pool; the least recently used pool is closed beyond this
+HTTP_MAX_HOSTS = _int("HTTP_MAX_HOSTS", 64)
+# Default timeouts (seconds): connect, waiting for a free connection when a host is at its cap, and everything else
+HTTP_CONNECT_TIMEOUT = _float("HTTP_CONNECT_TIMEOUT", 5)
+HTTP_POOL_TIMEOUT = _float("HTTP_POOL_TIMEOUT", 10)
+HTTP_TIMEOUT = _float("HTTP_TIMEOUT", 30)
+# Seconds a resolved host address is reused
+DNS_CACHE_TTL = _float("DNS_CACHE_TTL", 300)
+
+
+############################################################################
+# LLM CLIENTS
+############################################################################
+# ChatOllama instances kept for reuse, one per (model, keep_alive, base_url) - 0 builds a new one every call
+LLM_CACHE_SIZE = _int("LLM_CACHE_SIZE", 8)
+
+
+############################################################################
+# CONVERSATION CHECKPOINTS
+############################################################################
+# SQLite file holding each chat's history so the pipeline only sends new messages ("" = off, always send everything)
+CHECKPOINT_DB = _str("CHECKPOINT_DB", "")
+# Chats without a turn for this long are deleted...
+CHECKPOINT_MAX_AGE_DAYS = _float("CHECKPOINT_MAX_AGE_DAYS", 30)
+# ...and the least recently used ones while the database is bigger than this
+CHECKPOINT_MAX_MB = _float("CHECKPOINT_MAX_MB", 512)
+# Seconds between pruning passes
+CHECKPOINT_PRUNE_INTERVAL = _float("CHECKPOINT_PRUNE_INTERVAL", 3600)
+
+
+############################################################################
+# CONTEXT BUDGET
+############################################################################
+# Context size (tokens) the prompt is fitted into - match the model's num_ctx, or Ollama truncates it itself
+CONTEXT_TOKENS = _int("CONTEXT_TOKENS", 4096)
+# Per-model sizes overriding CONTEXT_TOKENS, comma separated: "llama3.1:8b=8192,qwen2.5:14b=16384"
+CONTEXT_TOKENS_BY_MODEL = _str("CONTEXT_TOKENS_BY_MODEL", "")
+# Part of the context kept free for the reply; the oldest history is left out to make room
+CONTEXT_REPLY_TOKENS = _int("CONTEXT_REPLY_TOKENS", 512)
+# When a chat outgrows its budget, its history is cut back to this fraction of it - the prompt prefix
+# (and Ollama's KV cache of it) then stays the same until the history outgrows the budget again
+CONTEXT_TRIM_TO = _float("CONTEXT_TRIM_TO", 0.6)
+
+
+############################################################################
+# RESPONSE CACHE
+############################################################################
+# Replay the answer of an identical earlier request (same graph, model, messages and sampling params)
+# instead of running the graph.  Only for stateless requests - checkpointed chats always run.
+RESPONSE_CACHE = _bool("RESPONSE_CACHE", False)
+# Memory for cached answers (least recently used go first), and how long (seconds) an answer is served
+RESPONSE_CACHE_MAX_MB = _float("RESPONSE_CACHE_MAX_MB", 32)
+RESPONSE_CACHE_TTL = _float("RESPONSE_CACHE_TTL", 3600)
+# SQLite file that also keeps cached answers across restarts ("" = memory only)
+RESPONSE_CACHE_DB = _str("RESPONSE_CACHE_DB", "")
+
+
+############################################################################
+# AUXILIARY REQUESTS
+############################################################################
+# Open WebUI's background prompts (title, tags, follow-ups, tool selection) skip the graph and get a single
+# non-streaming JSON answer from AUX_MODEL
+AUX_FAST_PATH = _bool("AUX_FAST_PATH", True)
+# Model for those answers ("" = the chat's own LLM_MODEL) - a small one keeps them off the big model
+AUX_MODEL = _str("AUX_MODEL", "")
+# Cap on an auxiliary answer's length (tokens), and how long (seconds) to wait for it
+AUX_MAX_TOKENS = _int("AUX_MAX_TOKENS", 512)
+AUX_TIMEOUT = _float("AUX_TIMEOUT", 60)
@@ -0,0 +1,219 @@
+"""Helpers that sit between a graph's event stream and the SSE response.
+
+`TokenCoalescer` batches consecutive LLM token chunks of the same kind into a
+single SSE frame instead of framing (and flushing) every chunk on its own.
+
+`EventPump` runs the graph's async stream in its own task and hands events
+over through a queue, which lets the SSE loop wake up on a timer ("tick") to
+flush a partially-filled batch when the model goes quiet.  It also watches
+the client connection and cancels the run (and with it the Ollama request)
+as soon as the client goes away.
+"""
+
+import time
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import settings
+import metrics
+from encoder import content_frame, thinking_frame
+
+
+CONTENT = "content"
+THOUGHT = "thought"
+
+# Pseudo stream mode yielded by `EventPump` when a scheduled tick fires
+TICK = "tick"
+
+# Smoothed duration of completed runs per graph - the yardstick for "time saved"
+_typical_run_seconds: dict[str, float] = {}
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection - nobody is reading this stream any more."""
+
+
+def record_completed_run(graph_id: str, seconds: float):
+    previous = _typical_run_seconds.get(graph_id)
+    _typical_run_seconds[graph_id] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+
+def record_cancelled_run(graph_id: str, seconds: float) -> float:
+    """Count a cancelled run and return the estimated generation time it saved.
+
+    The estimate is how much longer a typical completed run of this graph
+    takes than this one had been running (0 until a run has completed).
+    """
+    saved = max(0.0, _typical_run_seconds.get(graph_id, 0.0) - seconds)
+    metrics.CANCELLED_RUNS.inc(graph_id)
+    metrics.CANCEL_SECONDS_SAVED.inc(graph_id, amount=saved)
+    return saved
+
+
+def token_frame(kind: str, text: str) -> str:
+    return thinking_frame(text) if kind == THOUGHT else content_frame(text)
+
+
+############################################################################
+# TOKEN COALESCING
+############################################################################
+class TokenCoalescer:
+    def __init__(self, max_latency: float = settings.SSE_FLUSH_MS / 1000, max_bytes: int = settings.SSE_FLUSH_BYTES):
+        """
+        Args:
+            max_latency: Longest a token may sit in the buffer before it is sent, in seconds (0 = no batching)
+            max_bytes: Buffered text size (in characters) that forces a flush
+        """
+        self.max_latency = max_latency
+        self.max_bytes = max_bytes
+
+        self._kind: Optional[str] = None
+        self._parts: list[str] = []
+        self._size = 0
+        self._first_at = 0.0
+
+        self.tokens_received = 0
+        self.frames_emitted = 0
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """`time.monotonic()` value at which the buffered text has to go out, or None if nothing is buffered."""
+        return self._first_at + self.max_latency if self._parts else None
+
+    def push(self, kind: str, text: str) -> list[str]:
+        """Buffer a token chunk and return whatever frames are due."""
+        self.tokens_received += 1
+        frames = []
+
+        # Never merge thoughts and content into one frame
+        if self._parts and kind != self._kind:
+            frames = self.flush()
+
+        now = time.monotonic()
+        if not self._parts:
+            self._kind = kind
+            self._first_at = now
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self._size >= self.max_bytes or now - self._first_at >= self.max_latency:
+            frames.extend(self.flush())
+        return frames
+
+    def flush(self) -> list[str]:
+        """Return the buffered text as a frame (or nothing if the buffer is empty)."""
+        if not self._parts:
+            return []
+        text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self.frames_emitted += 1
+        return [token_frame(self._kind, text)]
+
+    def record(self):
+        """Fold this stream's counters into the process-wide metrics."""
+        metrics.TOKENS_RECEIVED.inc(amount=self.tokens_received)
+        metrics.FRAMES_EMITTED.inc(amount=self.frames_emitted)
+
+
+############################################################################
+# EVENT PUMP
+############################################################################
+class EventPump:
+    """Iterate `source` from a background task, optionally interleaving `(TICK, None)` events on a timer.
+
+    Use as an async context manager so the background task is always cancelled:
+
+        async with EventPump(agent.astream(...), is_disconnected=request.is_disconnected) as events:
+            async for event, data in events:
+                ...
+
+    If `is_disconnected` is given it is polled every `poll_interval` seconds;
+    once it returns True the source is cancelled and iteration raises
+    `ClientDisconnected`.
+    """
+    _DONE = object()
+
+    def __init__(self,
+            source: AsyncIterator,
+            maxsize: int = 256,
+            is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+            poll_interval: float = settings.DISCONNECT_POLL_SECONDS,
+        ):
+        self._source = source
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._is_disconnected = is_disconnected
+        self._poll_interval = poll_interval
+        self._tick: Optional[asyncio.TimerHandle] = None
+        self._tick_deadline: Optional[float] = None
+
+    async def _pump(self):
+        try:
+            async for item in self._source:
+                await self._queue.put(item)
+        except Exception as e:
+            await self._queue.put((self._DONE, e))
+        else:
+            await self._queue.put((self._DONE, None))
+
+    def _fire_tick(self):
+        self._tick = None
+        self._tick_deadline = None
+        try:
+            self._queue.put_nowait((TICK, None))
+        except asyncio.QueueFull:
+            pass  # the consumer has plenty to do already - it'll notice the deadline on the next item
+
+    def tick_at(self, deadline: Optional[float]):
+        """Deliver a TICK at `deadline` (a `time.monotonic()` value), or cancel the pending one if None."""
+        if deadline == self._tick_deadline:
+            return
+        if self._tick is not None:
+            self._tick.cancel()
+            self._tick = None
+        self._tick_deadline = deadline
+        if deadline is not None:
+            loop = asyncio.get_running_loop()
+            self._tick = loop.call_later(max(0.0, deadline - time.monotonic()), self._fire_tick)
+
+    async def _watch(self):
+        while not self._task.done():
+            await asyncio.sleep(self._poll_interval)
+            if await self._is_disconnected():
+                self._abort(ClientDisconnected())
+                return
+
+    def _abort(self, error: Exception):
+        """Cancel the source and make the consumer's next read raise `error`."""
+        self._task.cancel()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait((self._DONE, error))
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._pump())
+        if self._is_disconnected is not None:
+            self._watcher = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.tick_at(None)
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            # wait for the graph run to unwind, without swallowing a cancellation aimed at *us*
+            await asyncio.wait([self._task])
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event, data = await self._queue.get()
+        if event is self._DONE:
+            if data is not None:
+                raise data
+            raise StopAsyncIteration
+        return event, data
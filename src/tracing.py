@@ -0,0 +1,207 @@
+"""Per-run trace spans: graph run -> nodes -> LLM calls / outbound HTTP.
+
+A trace is started for every graph run (`start_trace`) and spans opened
+anywhere below it - in nodes, in commands running on a worker thread - attach
+themselves to it through a context variable:
+
+    with tracing.span("http GET", url=url) as s:
+        response = ...
+        s.set(bytes=len(response.content))
+
+Finished traces are kept in memory for `/debug/runs` and, when `TRACE_FILE`
+is set, appended to that file as OTLP/JSON (one `ExportTraceServiceRequest`
+per line) so they can be loaded into any OTLP-compatible viewer later.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Optional
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: dict, start_ns: Optional[int] = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """All the spans of a single graph run."""
+
+    def __init__(self, run_id: str, name: str, attributes: dict):
+        self.run_id = run_id
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, None, attributes)
+        self.spans: list[Span] = [self.root]
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("plebchat_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("plebchat_span", default=None)
+
+# run_id -> finished Trace, oldest first
+RECENT: "OrderedDict[str, Trace]" = OrderedDict()
+
+
+############################################################################
+# RECORDING
+############################################################################
+def start_trace(run_id: str, name: str, **attributes) -> Trace:
+    """Start a trace for a graph run and make it current for this context (and tasks spawned from it)."""
+    trace = Trace(run_id, name, attributes)
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    return trace
+
+
+def finish_trace(trace: Trace, error: Optional[str] = None, **attributes):
+    trace.root.set(**attributes)
+    trace.root.error = error
+    trace.root.end_ns = time.time_ns()
+
+    RECENT[trace.run_id] = trace
+    while len(RECENT) > settings.TRACE_KEEP_RUNS:
+        RECENT.popitem(last=False)
+
+    if settings.TRACE_FILE:
+        line = json.dumps(to_otlp(trace), default=str)
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _append, settings.TRACE_FILE, line)
+        except RuntimeError:
+            _append(settings.TRACE_FILE, line)
+
+
+def _append(path: str, line: str):
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning("could not write trace to %s: %s", path, e)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Open a child span of whatever span is current.  A no-op outside of a traced run."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield Span(name, None, attributes)
+        return
+
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else None, attributes)
+    trace.spans.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+    """Add an already-finished span (e.g. a phase measured after the fact) under `parent` or the current span.
+
+    Unlike `span()` this never touches the context, so it's safe to use from async generators.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = parent or _current_span.get()
+    s = Span(name, parent.span_id if parent else None, attributes, start_ns=start_ns)
+    s.end_ns = end_ns
+    trace.spans.append(s)
+    return s
+
+
+############################################################################
+# EXPORT / RENDERING
+############################################################################
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    spans = []
+    for s in trace.spans:
+        entry = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            entry["parentSpanId"] = s.parent_id
+        spans.append(entry)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "plebchat"}},
+                {"key": "plebchat.run_id", "value": {"stringValue": trace.run_id}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "plebchat"}, "spans": spans}],
+        }]
+    }
+
+
+def render_waterfall(trace: Trace, width: int = 60) -> str:
+    """A plain-text waterfall of a trace, one span per line, children indented under their parent."""
+    root = trace.root
+    total_ns = max((s.end_ns or s.start_ns) for s in trace.spans) - root.start_ns or 1
+
+    children: dict[Optional[str], list[Span]] = {}
+    for s in trace.spans:
+        children.setdefault(s.parent_id, []).append(s)
+
+    lines = [f"run {trace.run_id}  trace {trace.trace_id}  {total_ns / 1e6:.1f} ms", ""]
+
+    def walk(s: Span, depth: int):
+        offset = int((s.start_ns - root.start_ns) / total_ns * width)
+        length = max(1, int(((s.end_ns or s.start_ns) - s.start_ns) / total_ns * width))
+        bar = " " * offset + "█" * min(length, width - offset)
+        attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+        status = f"  !! {s.error}" if s.error else ""
+        label = ("  " * depth + s.name)[:38]
+        lines.append(f"{label:<38} {(s.start_ns - root.start_ns) / 1e6:>9.1f} {s.duration_ms:>9.1f}  |{bar:<{width}}|  {attrs}{status}")
+        for child in sorted(children.get(s.span_id, []), key=lambda c: c.start_ns):
+            walk(child, depth + 1)
+
+    lines.append(f"{'span':<38} {'start ms':>9} {'dur ms':>9}")
+    walk(root, 0)
+    return "\n".join(lines) + "\n"
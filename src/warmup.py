@@ -0,0 +1,154 @@
+"""Start-up warm-up and the readiness state behind `/ready`.
+
+Right after a deploy (or once Ollama has evicted it) the first chat pays the
+whole cost of loading the model.  At start-up the server asks Ollama to load
+every model in `WARMUP_MODELS` - an empty `/api/generate` with the same
+`keep_alive` the `KEEP_ALIVE` valve uses - and, with `GRAPH_WARMUP`, compiles
+the lazily imported graphs.  `/ready` only reports ready once all of that has
+finished, so traffic isn't routed here while first-token latency is still bad.
+A graph whose import fails (a missing optional dependency, say) is reported in
+`status()` but doesn't hold readiness back - the other graphs still work.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Optional, Union
+
+import httpx
+
+import settings
+import metrics
+import http_client
+from graphs import graph_registry
+
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_WARMUP_SECONDS = metrics.Gauge(
+    "plebchat_model_warmup_seconds", "Time Ollama took to load a model at start-up", ("model",))
+
+PENDING = "pending"
+WARMING = "warming"
+WARM = "warm"
+MISSING = "missing"  # Ollama doesn't have the model - nothing to wait for
+FAILED = "failed"    # Ollama couldn't be reached - retried until it works
+
+
+def keep_alive_value(keep_alive: str) -> Union[str, int]:
+    """Ollama takes a duration ("5m") or a number of seconds (negative = forever)."""
+    stripped = keep_alive.strip()
+    return int(stripped) if stripped.lstrip("-").isdigit() else stripped
+
+
+def _graph_state(graph_id: str) -> str:
+    if graph_registry.is_loaded(graph_id):
+        return "loaded"
+    return "failed" if graph_id in graph_registry.failed else "pending"
+
+
+class ModelState:
+    __slots__ = ("state", "load_ms", "error")
+
+    def __init__(self):
+        self.state = PENDING
+        self.load_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {"state": self.state, "load_ms": self.load_ms, "error": self.error}
+
+
+class Warmup:
+    def __init__(self, base_url: str, models: list[str], keep_alive: str, warm_graphs: bool):
+        """
+        Args:
+            base_url: Ollama's base URL
+            models: Models to load at start-up
+            keep_alive: How long Ollama should keep them loaded (KEEP_ALIVE valve semantics)
+            warm_graphs: Also compile every graph, and wait for that before reporting ready
+        """
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.warm_graphs = warm_graphs
+        self.models = {model: ModelState() for model in models}
+
+    @property
+    def ready(self) -> bool:
+        if any(m.state not in (WARM, MISSING) for m in self.models.values()):
+            return False
+        return not self.warm_graphs or all(
+            graph_registry.is_loaded(g) or g in graph_registry.failed for g in graph_registry)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "models": {name: m.as_dict() for name, m in self.models.items()},
+            "graphs": {g: _graph_state(g) for g in graph_registry},
+            "graph_errors": dict(graph_registry.failed),
+        }
+
+    async def _warm_model(self, model: str):
+        state = self.models[model]
+        state.state = WARMING
+        started = time.perf_counter()
+        try:
+            response = await http_client.client().post(
+                f"{self.base_url}/api/generate",
+                json={"model": model, "keep_alive": keep_alive_value(self.keep_alive)},
+                timeout=settings.WARMUP_TIMEOUT,
+            )
+        except httpx.HTTPError as e:
+            state.state, state.error = FAILED, f"{type(e).__name__}: {e}"
+            return
+
+        if response.status_code == 404:
+            state.state, state.error = MISSING, response.text
+            logger.warning("warm-up model not found in Ollama", extra={"model": model})
+            return
+        if response.is_error:
+            state.state, state.error = FAILED, f"HTTP {response.status_code}: {response.text}"
+            return
+
+        elapsed = time.perf_counter() - started
+        state.state, state.error, state.load_ms = WARM, None, round(elapsed * 1000)
+        MODEL_WARMUP_SECONDS.set(elapsed, model)
+        logger.info("model warm", extra={"model": model, "ms": state.load_ms})
+
+    async def _warm_models(self):
+        if self.keep_alive.strip() == "0":
+            # The model would be unloaded again right away
+            logger.info("KEEP_ALIVE=0, not warming models")
+            for state in self.models.values():
+                state.state = WARM
+            return
+
+        while True:
+            for model, state in self.models.items():
+                if state.state in (PENDING, FAILED):
+                    await self._warm_model(model)
+
+            failed = [m for m, s in self.models.items() if s.state == FAILED]
+            if not failed:
+                return
+            logger.warning("model warm-up failed, retrying in %ss", settings.WARMUP_RETRY_SECONDS,
+                           extra={"models": ",".join(failed), "error": self.models[failed[0]].error})
+            await asyncio.sleep(settings.WARMUP_RETRY_SECONDS)
+
+    async def run(self):
+        """Warm every model and (optionally) graph.  Runs until all of them made it."""
+        started = time.perf_counter()
+        jobs = [self._warm_models()]
+        if self.warm_graphs:
+            jobs.append(graph_registry.warm_up())
+        await asyncio.gather(*jobs)
+        logger.info("warm-up done", extra={"ms": round((time.perf_counter() - started) * 1000), "ready": self.ready})
+
+
+warmup = Warmup(
+    base_url=settings.OLLAMA_BASE_URL,
+    models=[m.strip() for m in settings.WARMUP_MODELS.split(",") if m.strip()],
+    keep_alive=settings.KEEP_ALIVE,
+    warm_graphs=settings.GRAPH_WARMUP,
+)